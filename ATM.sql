@@ -28,16 +28,41 @@ create table if not exists `account` (
 ) auto_increment = 10001;  
 
 
+-- for monthly partitions and the cold archive see archive.py (python archive.py --partition)
 create table if not exists `transaction` (
     transaction_id int auto_increment primary key,
     account_number int not null,
     type enum('deposit', 'withdrawal') not null,
     amount decimal(10,2) not null,
     timestamp datetime default current_timestamp,
-    foreign key (account_number) references account(account_number)
+    foreign key (account_number) references account(account_number),
+    -- history queries filter by account and sort by time / filter by type and amount
+    -- both indexes hold every column the history page reads, so they cover the query
+    index idx_transaction_account_time (account_number, timestamp, type, amount),
+    index idx_transaction_account_type_amount (account_number, type, amount, timestamp)
 ) auto_increment = 1;
 
 
+-- closing balance of every account for every day it had transactions (see snapshots.py)
+create table if not exists balance_snapshot (
+    account_number int not null,
+    snapshot_date date not null,
+    closing_balance decimal(16,2) not null,
+    primary key (account_number, snapshot_date),
+    foreign key (account_number) references account(account_number)
+);
+
+-- withdrawal limits of accounts that don't use the default tier (see limits.py)
+create table if not exists account_limit (
+    account_number int primary key,
+    tier varchar(20) not null,
+    daily_amount decimal(10,2) default null,
+    weekly_amount decimal(10,2) default null,
+    daily_count int default null,
+    foreign key (account_number) references account(account_number)
+);
+
+
 select * from `account`;
 select * from customer;
 select * from `transaction`;
\ No newline at end of file
@@ -0,0 +1,286 @@
+# anomaly scoring for every deposit and withdrawal, before make_transaction commits
+# each account has a few running statistics in memory (AccountStats, ~200 bytes):
+#   - count, mean and variance of its amounts, updated one transaction at a time (Welford)
+#   - how many of its transactions fell in each hour of the day
+#   - the times of its last few transactions
+# and every posting gets a score from them, without a query:
+#   amount - how many standard deviations the amount is above the account's mean
+#   burst  - transactions in the last ATM_ANOMALY_BURST_SECONDS beyond ATM_ANOMALY_BURST_COUNT (2 points each)
+#   hour   - 2 points if the account almost never uses this hour of the day
+# amount and hour only count once the account has ATM_ANOMALY_MIN_HISTORY transactions
+#
+# a score of ATM_ANOMALY_FLAG_SCORE flags the transaction (it is posted and listed in anomaly_flag for
+# review); ATM_ANOMALY_HOLD_SCORE holds it (it is refused with "Transaction held for review." and
+# listed too), 0 turns holds off
+# amount and hour only learn from committed transactions (db_pool.after_commit); the burst check counts
+# every posting as soon as it is scored, so rows of one bulk chunk count against each other
+#
+# statistics and flags are written to account_stats / anomaly_flag by a background thread every
+# ATM_ANOMALY_PERSIST_SECONDS and read back by backend.create_tables, so a restart loses at most that
+# much learning; a process that never started the thread (scripts, tests) scores without keeping
+# anything to write, and at most FLAG_BACKLOG flags wait while the database is down
+# the statistics of existing history are built once with:
+#   python anomaly.py --rebuild
+import atexit
+import math
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime
+
+import config
+from db_pool import after_commit, connection, unit_of_work
+from storage import get_storage
+
+FLAG_BACKLOG = 10_000 # flags kept for the next persist at most, the oldest are dropped first
+
+
+class AccountStats:
+    __slots__ = ("n", "mean", "m2", "hours", "recent")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, hours=None):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2 # sum of squared differences from the mean (Welford)
+        self.hours = array("I", hours or [0] * 24)
+        self.recent = deque(maxlen=config.ANOMALY_BURST_COUNT + 1) # times of the last transactions
+
+    def add(self, amount, at, hour):
+        self.learn(amount, hour)
+        self.recent.append(at)
+
+    def learn(self, amount, hour):
+        self.n += 1
+        delta = amount - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (amount - self.mean)
+        self.hours[hour] += 1
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class AnomalyScorer:
+    def __init__(self):
+        self.min_history = config.ANOMALY_MIN_HISTORY
+        self.burst_seconds = config.ANOMALY_BURST_SECONDS
+        self.burst_count = config.ANOMALY_BURST_COUNT
+        self.rare_hour = config.ANOMALY_RARE_HOUR_SHARE
+        self.flag_score = config.ANOMALY_FLAG_SCORE
+        self.hold_score = config.ANOMALY_HOLD_SCORE
+        self._stats = {} # account_number -> AccountStats
+        self._dirty = set() # accounts changed since the last persist
+        self._flags = [] # flag rows waiting to be written
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.scored = 0
+        self.flagged = 0
+        self.held = 0
+
+    # (score, reasons) of a posting, from memory only
+    def score(self, account_number, amount, now=None):
+        now = time.time() if now is None else now
+        hour = datetime.fromtimestamp(now).hour
+        reasons = []
+        score = 0.0
+        with self._lock:
+            self.scored += 1
+            stats = self._stats.get(account_number)
+            if stats is None:
+                return 0.0, reasons
+            if stats.n >= self.min_history:
+                std = stats.std
+                if std > 0:
+                    z = (amount - stats.mean) / std
+                    if z > 0:
+                        score += z
+                        if z >= 2:
+                            reasons.append(f"amount {z:.1f} standard deviations above the account's mean")
+                if stats.hours[hour] / stats.n < self.rare_hour:
+                    score += 2
+                    reasons.append(f"unusual hour ({hour}:00)")
+            burst = 1 + sum(1 for at in stats.recent if now - at <= self.burst_seconds)
+        if burst > self.burst_count:
+            score += 2 * (burst - self.burst_count)
+            reasons.append(f"{burst} transactions in {self.burst_seconds:g} seconds")
+        return score, reasons
+
+    # score a posting inside its unit of work (called by ledger.post_transaction)
+    # raises ValueError if it is held; flags and learning happen when the posting commits
+    def check(self, account_number, transaction_type, amount):
+        account_number = int(account_number)
+        amount = float(amount)
+        now = time.time()
+        score, reasons = self.score(account_number, amount, now)
+        with self._lock:
+            self._account(account_number).recent.append(now) # the next posting's burst counts this one
+        if self.hold_score and score >= self.hold_score:
+            self._flag(account_number, transaction_type, amount, score, reasons, "hold")
+            raise ValueError("Transaction held for review.")
+        if score >= self.flag_score:
+            after_commit(self._flag, account_number, transaction_type, amount, score, reasons, "flag")
+        after_commit(self._learn, account_number, amount, now)
+        return score
+
+    # learn from a committed transaction
+    def observe(self, account_number, amount, at=None):
+        at = time.time() if at is None else at
+        with self._lock:
+            self._account(account_number).add(float(amount), at, datetime.fromtimestamp(at).hour)
+            self._changed(account_number)
+
+    # observe() for a posting check() already counted in the burst window
+    def _learn(self, account_number, amount, at):
+        with self._lock:
+            self._account(account_number).learn(float(amount), datetime.fromtimestamp(at).hour)
+            self._changed(account_number)
+
+    def _account(self, account_number):
+        stats = self._stats.get(account_number)
+        if stats is None:
+            stats = self._stats[account_number] = AccountStats()
+        return stats
+
+    def _changed(self, account_number):
+        if self._thread is not None: # only kept for the persist thread
+            self._dirty.add(account_number)
+
+    def _flag(self, account_number, transaction_type, amount, score, reasons, action):
+        with self._lock:
+            if self._thread is not None: # only kept for the persist thread
+                self._flags.append((account_number, transaction_type, round(amount, 2), round(score, 2),
+                                    "; ".join(reasons)[:255], action, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                del self._flags[:-FLAG_BACKLOG]
+            if action == "hold":
+                self.held += 1
+            else:
+                self.flagged += 1
+
+    # load the persisted statistics and start the background writer (backend.create_tables)
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            _create_tables(cursor)
+            cursor.execute("select account_number, n, mean, m2, hours from account_stats")
+            loaded = {account: AccountStats(n, float(mean), float(m2), [int(h) for h in hours.split(",")])
+                      for account, n, mean, m2, hours in cursor.fetchall()}
+        with self._lock:
+            for account, stats in loaded.items():
+                self._stats.setdefault(account, stats) # learned since startup wins
+            self._thread = threading.Thread(target=self._run, name="anomaly-persist", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(config.ANOMALY_PERSIST_SECONDS):
+            try:
+                self.persist()
+            except Exception as e: # database down: keep everything for the next round
+                print("Anomaly statistics persist failed:", e)
+
+    # write the changed statistics and the new flags
+    def persist(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            flags, self._flags = self._flags, []
+            rows = [(account, s.n, s.mean, s.m2, ",".join(map(str, s.hours)))
+                    for account, s in ((a, self._stats[a]) for a in dirty)]
+        if not rows and not flags:
+            return
+        try:
+            with unit_of_work() as conn:
+                cursor = conn.cursor()
+                if rows:
+                    cursor.executemany(get_storage().upsert_sql("account_stats", ("account_number",),
+                                                                ("n", "mean", "m2", "hours")), rows)
+                if flags:
+                    cursor.executemany("""
+                        insert into anomaly_flag (account_number, type, amount, score, reasons, action, timestamp)
+                        values (%s, %s, %s, %s, %s, %s, %s)
+                    """, flags)
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty
+                self._flags = (flags + self._flags)[-FLAG_BACKLOG:]
+            raise
+
+    # rebuild every account's statistics from the transaction history (python anomaly.py --rebuild)
+    def rebuild(self):
+        stats = {}
+        with connection() as conn:
+            cursor = conn.cursor(buffered=False) # rows stay on the server until we fetch them
+            cursor.execute("select account_number, amount, timestamp from `transaction` order by transaction_id")
+            while True:
+                rows = cursor.fetchmany(config.EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                for account, amount, timestamp in rows:
+                    if isinstance(timestamp, str): # SQLite
+                        timestamp = datetime.fromisoformat(timestamp)
+                    if account not in stats:
+                        stats[account] = AccountStats()
+                    stats[account].add(float(amount), timestamp.timestamp(), timestamp.hour)
+        with self._lock:
+            self._stats = stats
+            self._dirty = set(stats)
+        self.persist()
+        return len(stats)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.persist()
+
+    def stats(self):
+        with self._lock:
+            return {"accounts": len(self._stats), "scored": self.scored, "flagged": self.flagged, "held": self.held}
+
+
+def _create_tables(cursor):
+    cursor.execute("""
+        create table if not exists account_stats (
+            account_number int primary key,
+            n int not null,
+            mean double not null,
+            m2 double not null,
+            hours varchar(255) not null
+        )
+    """)
+    cursor.execute(f"""
+        create table if not exists anomaly_flag (
+            flag_id {get_storage().auto_id},
+            account_number int not null,
+            type varchar(10) not null,
+            amount decimal(10,2) not null,
+            score decimal(8,2) not null,
+            reasons varchar(255) not null,
+            action varchar(10) not null,
+            timestamp datetime not null
+        )
+    """)
+
+
+# the scorer shared by the whole process
+scorer = AnomalyScorer()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Anomaly scoring statistics")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild every account's statistics from the history")
+    args = parser.parse_args()
+    if args.rebuild:
+        with unit_of_work() as conn:
+            _create_tables(conn.cursor())
+        print(f"statistics of {scorer.rebuild()} accounts rebuilt")
+    else:
+        parser.print_help()
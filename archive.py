@@ -0,0 +1,259 @@
+# cold archive for the `transaction` table
+# months older than ATM_ARCHIVE_RETENTION_MONTHS are moved out of the table into compressed Parquet
+# files (one per month, <ATM_ARCHIVE_DIR>/transactions-YYYY-MM.parquet), so the table and its
+# indexes only hold the recent history every page and job actually reads
+#
+# with monthly partitions (MySQL, ATM_PARTITION_TRANSACTIONS=1 for new databases, or
+# "python archive.py --partition" once for an existing one) an archived month is removed by dropping
+# its partition, which is instant; without partitions (SQLite, or an unpartitioned MySQL table) its
+# rows are deleted
+#
+# a month is written to its file first, then listed in manifest.json, then removed from the table,
+# so a stopped run loses nothing: the next run writes the month again and finishes the removal
+# the cash-flow rollups (rollups.py) are refreshed first, and a month is only removed once they have
+# counted every row of it
+#
+# archive_account_month (account_number, month) lists the archived months that hold each account's
+# rows, written together with the removal: view_transactions, the history export and
+# snapshots.balance_at read only those files, so an account with nothing in the archive (or nothing
+# in the dates asked for) never opens one
+#
+# balances of archived days come from balance_snapshot: run "python snapshots.py --backfill" once
+# before the first archive if the history predates the snapshots
+#
+#   python archive.py                archive every month past the retention window
+#   python archive.py --partition    convert the MySQL table to monthly partitions (one-off, copies the table)
+import json
+import os
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import config
+import rollups
+from db_pool import connection, unit_of_work
+from months import month_bounds
+from storage import get_storage
+
+CENT = Decimal("0.01")
+
+
+def _manifest_path(folder):
+    return os.path.join(folder, "manifest.json")
+
+
+# {"YYYY-MM": rows archived} of every month in the archive
+def load_manifest(folder=None):
+    try:
+        with open(_manifest_path(folder or config.ARCHIVE_DIR)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(folder, manifest):
+    tmp = _manifest_path(folder) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, _manifest_path(folder)) # atomic, like the statement checkpoints
+
+
+def archive_path(month, folder=None):
+    return os.path.join(folder or config.ARCHIVE_DIR, f"transactions-{month:%Y-%m}.parquet")
+
+
+# first day of the oldest month that stays in the table
+def retention_start(retention_months=None, today=None):
+    retention_months = config.ARCHIVE_RETENTION_MONTHS if retention_months is None else retention_months
+    month = (today or date.today()).replace(day=1)
+    for _ in range(retention_months):
+        month = month_bounds(month - timedelta(days=1))[0] # previous month
+    return month
+
+
+# move every month before the retention window to the archive, oldest first
+# returns [("YYYY-MM", rows archived)] for this run
+def archive_old_months(retention_months=None, out_dir=None):
+    folder = out_dir or config.ARCHIVE_DIR
+    os.makedirs(folder, exist_ok=True)
+    cutoff = retention_start(retention_months)
+    storage = get_storage()
+    manifest = load_manifest(folder)
+    archived = []
+    with unit_of_work() as conn:
+        create_tables(conn.cursor())
+    _index_archived(manifest, folder) # months archived before the index existed
+    rollups.refresh() # count the rows about to leave the table
+
+    while True:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("select min(timestamp) from `transaction` where timestamp < %s", (cutoff,))
+            oldest = cursor.fetchone()[0]
+        if oldest is None:
+            break
+        if isinstance(oldest, str): # SQLite
+            oldest = datetime.fromisoformat(oldest)
+        start, end = month_bounds(oldest.date())
+        if not _counted_by_rollups(start, end):
+            # a row the rollups haven't reached yet (ex: an old month imported just now): next run
+            print(f"{start:%Y-%m} not archived: rollups.py hasn't counted all of it yet")
+            break
+
+        path = archive_path(start, folder)
+        rows = _write_month(start, end, path)
+        manifest[f"{start:%Y-%m}"] = rows
+        _save_manifest(folder, manifest) # listed before the rows leave the table
+
+        with unit_of_work() as conn:
+            cursor = conn.cursor()
+            _index_month(cursor, start, path)
+            name = f"p{start:%Y%m}"
+            cursor.execute("select 1 from `transaction` where timestamp < %s limit 1", (start,))
+            older = cursor.fetchone() # rows left from before the month would go with the partition
+            if storage.transaction_partitions(cursor).get(name) == end and not older:
+                storage.drop_transaction_partition(cursor, name) # the partition holds exactly this month
+            else:
+                cursor.execute("delete from `transaction` where timestamp >= %s and timestamp < %s", (start, end))
+        archived.append((f"{start:%Y-%m}", rows))
+
+    with unit_of_work() as conn: # long-running servers don't call create_tables again
+        storage.add_transaction_partitions(conn.cursor(), config.PARTITION_MONTHS_AHEAD)
+    return archived
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        create table if not exists archive_account_month (
+            account_number int not null,
+            month date not null,
+            primary key (account_number, month)
+        )
+    """)
+
+
+# True if the rollups' mark is past every row of the month
+def _counted_by_rollups(start, end):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select max(transaction_id) from `transaction` where timestamp >= %s and timestamp < %s",
+                       (start, end))
+        last = cursor.fetchone()[0]
+        cursor.execute("select last_transaction_id from rollup_state where name = 'transaction'")
+        mark = cursor.fetchone()
+    return last is None or (mark is not None and mark[0] >= last)
+
+
+# list the accounts of one archived month in archive_account_month (from its file)
+def _index_month(cursor, start, path):
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    accounts = pc.unique(pq.read_table(path, columns=["account_number"])["account_number"]).to_pylist()
+    cursor.execute("delete from archive_account_month where month = %s", (start,))
+    cursor.executemany("insert into archive_account_month (account_number, month) values (%s, %s)",
+                       [(account, start) for account in accounts])
+
+
+def _index_archived(manifest, folder):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select distinct month from archive_account_month")
+        indexed = {str(row[0])[:7] for row in cursor.fetchall()}
+    for key in sorted(set(manifest) - indexed):
+        start = month_bounds(key)[0]
+        with unit_of_work() as conn:
+            _index_month(conn.cursor(), start, archive_path(start, folder))
+
+
+# stream one month of the table into a Parquet file (one row group per chunk), returns the row count
+def _write_month(start, end, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("transaction_id", pa.int64()),
+        ("account_number", pa.int64()),
+        ("type", pa.string()),
+        ("amount", pa.decimal128(10, 2)),
+        ("timestamp", pa.timestamp("s")),
+    ])
+    rows = 0
+    with connection() as conn:
+        cursor = conn.cursor(buffered=False) # rows stay on the server until we fetch them
+        cursor.execute("""
+            select transaction_id, account_number, type, amount, timestamp from `transaction`
+            where timestamp >= %s and timestamp < %s
+            order by account_number, timestamp, transaction_id
+        """, (start, end))
+        # written to a temporary file, renamed once the whole month is in it
+        with pq.ParquetWriter(path + ".tmp", schema, compression="zstd") as writer:
+            while True:
+                chunk = cursor.fetchmany(config.EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                columns = list(zip(*chunk))
+                columns[3] = [Decimal(str(amount)).quantize(CENT) for amount in columns[3]]
+                columns[4] = [datetime.fromisoformat(t) if isinstance(t, str) else t for t in columns[4]]
+                writer.write_table(pa.table(columns, schema=schema))
+                rows += len(chunk)
+    os.replace(path + ".tmp", path)
+    return rows
+
+
+# archived months holding rows of the account between start_date and end_date (dates, end date
+# included, None = open), from archive_account_month (one indexed lookup, no file opened)
+def archived_months(account_number, start_date=None, end_date=None):
+    conditions, params = ["account_number = %s"], [int(account_number)]
+    if start_date:
+        conditions.append("month >= %s")
+        params.append(month_bounds(start_date)[0])
+    if end_date:
+        conditions.append("month <= %s")
+        params.append(end_date)
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"select month from archive_account_month where {' and '.join(conditions)} order by month",
+                           params)
+            return [month_bounds(str(row[0])[:7])[0] for row in cursor.fetchall()]
+    except Exception: # nothing was ever archived in this database (no table yet)
+        return []
+
+
+# the archived transactions of one account between start_date and end_date, as a DataFrame with the
+# columns of view_transactions (transaction_id, type, amount, timestamp)
+# returns None when the account has no archived month in the dates
+def read_transactions(account_number, start_date=None, end_date=None, folder=None):
+    months = archived_months(account_number, start_date, end_date)
+    if not months:
+        return None
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    filters = [("account_number", "=", int(account_number))]
+    if start_date:
+        filters.append(("timestamp", ">=", datetime.combine(start_date, datetime.min.time())))
+    if end_date:
+        filters.append(("timestamp", "<", datetime.combine(end_date + timedelta(days=1), datetime.min.time())))
+    frames = [pq.read_table(archive_path(month, folder), columns=["transaction_id", "type", "amount", "timestamp"],
+                            filters=filters).to_pandas()
+              for month in months]
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Monthly partitions and cold archive of the transaction table")
+    parser.add_argument("--partition", action="store_true", help="convert the MySQL table to monthly partitions")
+    parser.add_argument("--retention", type=int, help="months kept in the table (default ATM_ARCHIVE_RETENTION_MONTHS)")
+    parser.add_argument("--out", help="archive folder (default ATM_ARCHIVE_DIR)")
+    args = parser.parse_args()
+
+    if args.partition:
+        with unit_of_work() as conn:
+            get_storage().partition_transactions(conn.cursor(), config.PARTITION_MONTHS_AHEAD)
+        print("`transaction` is partitioned by month")
+    else:
+        for month, rows in archive_old_months(args.retention, args.out):
+            print(f"{month}: {rows} rows archived")
@@ -0,0 +1,84 @@
+# asyncio version of backend.py
+# every function here runs its backend.py twin on a bounded thread pool, so the event loop never
+# blocks on a database round trip and many ATM requests can overlap:
+#
+#   balance, history = await asyncio.gather(
+#       async_backend.check_balance(10001),
+#       async_backend.view_transactions(10001),
+#   )
+#
+# the thread pool has one worker per pooled connection (ATM_ASYNC_WORKERS, default ATM_POOL_SIZE),
+# so extra requests wait in the executor queue instead of waiting on the connection pool while
+# holding a thread
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import backend
+import config
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.ASYNC_WORKERS, thread_name_prefix="atm-db")
+    return _executor
+
+
+# stop the worker threads (ex: when the API server shuts down)
+def shutdown(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+create_tables = _wrap(backend.create_tables)
+register_customer = _wrap(backend.register_customer)
+view_personal_info = _wrap(backend.view_personal_info)
+login_customer = _wrap(backend.login_customer)
+update_customer_info = _wrap(backend.update_customer_info)
+change_pin = _wrap(backend.change_pin)
+verify_forgot_pin_identity = _wrap(backend.verify_forgot_pin_identity)
+forgot_pin = _wrap(backend.forgot_pin)
+check_balance = _wrap(backend.check_balance)
+make_transaction = _wrap(backend.make_transaction)
+make_transactions_bulk = _wrap(backend.make_transactions_bulk)
+view_transactions = _wrap(backend.view_transactions)
+export_transactions = _wrap(backend.export_transactions)
+update_csv = _wrap(backend.update_csv)
+
+
+# stream_transactions_csv as an async generator: every chunk is fetched on the thread pool
+# when stopping early, close it right away so the pooled connection goes back at once:
+#   async with contextlib.aclosing(async_backend.stream_transactions_csv(10001)) as chunks: ...
+async def stream_transactions_csv(account_number, **kwargs):
+    chunks = backend.stream_transactions_csv(account_number, **kwargs)
+    done = object()
+    try:
+        while True:
+            chunk = await run(next, chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        await run(chunks.close) # gives the pooled connection back even if the caller stops early
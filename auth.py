@@ -0,0 +1,164 @@
+# login checks for login_customer
+# a login only needs the account's PIN, and it only needs it once: the PIN read from the database
+# is kept as a keyed hash ("verifier") in a bounded LRU cache with a TTL (like balance_cache.py),
+# so repeated logins are checked in memory and the plain PIN is never kept
+# accounts that don't exist are cached too, so guessing account numbers doesn't reach the database
+#
+# every account number has a failed-attempt counter: after LOGIN_MAX_FAILURES wrong PINs within
+# LOGIN_LOCKOUT_SECONDS it is locked for LOGIN_LOCKOUT_SECONDS, and attempts on a locked account
+# are refused in memory before any lookup
+# account numbers that don't exist are counted and locked the same way, so the lockout doesn't tell
+# which accounts exist; past AUTH_CACHE_SIZE counters only the ones that no longer count (no failure for
+# LOGIN_LOCKOUT_SECONDS) are dropped, so junk logins can neither push a lockout out of the map nor
+# reset a counter that is still counting
+#
+# change_pin, forgot_pin and register_customer drop the cached entry after they commit; PINs changed by another
+# process are picked up after at most AUTH_CACHE_TTL seconds, lockouts are counted per process
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from db_pool import connection, in_unit_of_work
+
+_MISSING = object() # cached "no such account"
+
+
+class Authenticator:
+    def __init__(self, maxsize=None, ttl=None, max_failures=None, lockout=None):
+        self.maxsize = maxsize or config.AUTH_CACHE_SIZE
+        self.ttl = config.AUTH_CACHE_TTL if ttl is None else ttl
+        self.max_failures = max_failures or config.LOGIN_MAX_FAILURES
+        self.lockout = config.LOGIN_LOCKOUT_SECONDS if lockout is None else lockout
+        self._key = os.urandom(32) # verifiers are only meaningful inside this process
+        self._verifiers = OrderedDict() # account_number -> (verifier or _MISSING, expires_at), oldest first
+        self._failures = OrderedDict() # account_number -> (failed attempts, window start, locked until, last failure), oldest failure first
+        self._lock = threading.Lock()
+        self._writes = 0 # bumped by every invalidation, see balance_cache.fill_token
+        self.hits = 0
+        self.misses = 0
+        self.refused = 0 # attempts refused because the account was locked
+
+    def _verifier(self, account_number, pin):
+        return hmac.new(self._key, f"{account_number}:{pin}".encode(), hashlib.sha256).digest()
+
+    # returns (True, account_number) if the PIN is right, (False, None) otherwise
+    def login(self, account, pin):
+        account_number = _account_number(account)
+        if account_number is None:
+            return False, None # not an account number, nothing to look up
+        pin = str(pin)
+
+        if self.locked_for(account_number):
+            with self._lock:
+                self.refused += 1
+            return False, None
+
+        # inside a unit of work the PIN may be an uncommitted change: read it, don't cache it
+        verifier = None if in_unit_of_work() else self._cached(account_number)
+        if verifier is None:
+            verifier = self._load(account_number)
+
+        if verifier is not _MISSING and hmac.compare_digest(verifier, self._verifier(account_number, pin)):
+            with self._lock:
+                self._failures.pop(account_number, None)
+            return True, account_number
+        self._failed(account_number)
+        return False, None
+
+    # seconds until a locked account can try again, 0 if it isn't locked
+    def locked_for(self, account):
+        account_number = _account_number(account)
+        with self._lock:
+            entry = self._failures.get(account_number)
+        if entry is None:
+            return 0
+        return max(0.0, entry[2] - time.monotonic())
+
+    def _cached(self, account_number):
+        with self._lock:
+            entry = self._verifiers.get(account_number)
+            if entry is not None and entry[1] > time.monotonic():
+                self._verifiers.move_to_end(account_number)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._verifiers[account_number] # expired
+            self.misses += 1
+            return None
+
+    def _load(self, account_number):
+        token = self._writes
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("select pin from account where account_number = %s", (account_number,)) # the PIN only
+            row = cursor.fetchone()
+        verifier = self._verifier(account_number, row[0]) if row else _MISSING
+        with self._lock:
+            if token == self._writes and not in_unit_of_work(): # no PIN changed while we were reading, safe to cache
+                self._verifiers[account_number] = (verifier, time.monotonic() + self.ttl)
+                self._verifiers.move_to_end(account_number)
+                while len(self._verifiers) > self.maxsize:
+                    self._verifiers.popitem(last=False) # least recently used
+        return verifier
+
+    def _failed(self, account_number):
+        now = time.monotonic()
+        with self._lock:
+            count, window_start, _, _ = self._failures.pop(account_number, (0, now, 0, now))
+            if now - window_start > self.lockout: # old failures don't count any more
+                count, window_start = 0, now
+            count += 1
+            locked_until = now + self.lockout if count >= self.max_failures else 0
+            self._failures[account_number] = (count, window_start, locked_until, now)
+            # oldest failure first: a counter whose last failure is more than `lockout` ago is neither locked nor
+            # counting any more, the first one that isn't stops the loop
+            while len(self._failures) > self.maxsize:
+                key, (_, _, _, last) = next(iter(self._failures.items()))
+                if now - last <= self.lockout:
+                    break
+                del self._failures[key]
+
+    # the PIN changed (change_pin, forgot_pin) or the account was just created (register_customer):
+    # drop the cached verifier; unlock=True also clears the lockout
+    def invalidate(self, account_number, unlock=False):
+        account_number = _account_number(account_number)
+        with self._lock:
+            self._writes += 1
+            self._verifiers.pop(account_number, None)
+            if unlock:
+                self._failures.pop(account_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._verifiers.clear()
+            self._failures.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            now = time.monotonic()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "refused": self.refused,
+                "locked_accounts": sum(1 for _, _, until, _ in self._failures.values() if until > now),
+                "size": len(self._verifiers),
+                "maxsize": self.maxsize,
+            }
+
+
+def _account_number(account):
+    try:
+        return int(str(account).strip())
+    except ValueError:
+        return None
+
+
+# the authenticator shared by the whole process
+authenticator = Authenticator()
@@ -1,158 +1,98 @@
 # import necessary libraries
-import pandas as pd
-from datetime import datetime
-from db import cursor, mydb
-import regex
-import os
+# pandas is imported inside the functions that use it (view_transactions, next_page_key), so the
+# login page doesn't pay for it
+from datetime import datetime, timedelta
+from db_pool import connection, unit_of_work, after_commit, in_unit_of_work
+from storage import get_storage
+from ledger import check_transaction, post_transaction
+import snapshots
+from validation import UPDATE_MESSAGES, normalize_customer, validate_customer, error_messages
+from decimal import Decimal
+import config
+import csv_export
+from balance_cache import balance_cache
+from session_cache import generations
+from instrumentation import instrumented
+from auth import authenticator
+from group_commit import get_group_commit
+from limits import withdrawal_limits
+from anomaly import scorer
+import archive
+import csv
+import io
+import zlib
 
 # cursor is like remote control for interacting with the database
 # cursor.execute: how you run SQL commands from python code
 # create tables if not exist
+@instrumented
 def create_tables():
-
-# create customer table to store customer info
-    cursor.execute("""
-    create table if not exists customer (
-    customer_id int auto_increment primary key,
-    first_name varchar(50),
-    last_name varchar(50),
-    DOB date,
-    app varchar(10),
-    building varchar(50),
-    street varchar(100),
-    city varchar(50),
-    province varchar(50),
-    postal_code char(7),
-    phone char(10) default null,
-    email varchar(50) default null
-    )
-    """)
-
-# create account table to store account info
-    cursor.execute("""
-    create table if not exists `account` (
-        account_number int auto_increment primary key,
-        customer_id int,
-        pin char(4),
-        balance decimal(10,2) default 100.00,
-        foreign key (customer_id) references customer(customer_id)
-    ) auto_increment = 10001;
-    """)
-
-# create transaction table to store transaction info
-    cursor.execute("""
-        create table if not exists `transaction` (
-            transaction_id int auto_increment primary key,
-            account_number int not null,
-            type ENUM('deposit', 'withdrawal') not null,
-            amount decimal(10,2) not null,
-            timestamp datetime default current_timestamp,
-            foreign key (account_number) references account(account_number)
-        ) auto_increment = 1;
-    """)
-
-    mydb.commit()  # it saves all changes which had been made permanently
+    with unit_of_work() as conn: # borrow a connection from the pool, committed and given back at the end
+        # the table definitions depend on the database engine, see storage.py
+        get_storage().create_schema(conn.cursor())
+    withdrawal_limits.warm() # the rolling withdrawal counters start from the last 7 days of history
+    if config.ANOMALY_SCORING:
+        scorer.start() # loads the anomaly statistics, writes them back in the background
     print("Tables created or already exist.")
 
 # validate all custoemr input before saving to database
+@instrumented
 def register_customer(first_name, last_name, dob, app, building, street, city, province, postal_code, phone, email, pin):
-    errors = [] 
-    name_pattern = r"^[\p{L}]+([ -][\p{L}]+)*$" # only letters without numbers or symbols
-
-# first name
-    if not regex.fullmatch(name_pattern, first_name):
-        errors.append("Invalid first name.")
-
-# last name
-    if not regex.fullmatch(name_pattern, last_name):
-        errors.append("Invalid last name.")
-
-# DOB
-    try:
-        dob_date = datetime.strptime(dob, "%Y-%m-%d")
-        if not (datetime(1900, 1, 1) <= dob_date <= datetime.now()): # between 1900 and now
-            errors.append("Date of birth must be between 1900 and today.")
-    except ValueError:
-        errors.append("Invalid date of birth format (expected YYYY-MM-DD).")
-
-# apartment number (optional)
-    if app and not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", app): # accepts format like 12, 12A, 12 A
-        errors.append("Invalid apartment number format.")
-
-# building number
-    if not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", building): # accepts format like 12, 12A, 12 A
-        errors.append("Invalid building number format.")
-
-# street
-    if not regex.fullmatch(r"^[\p{L}\d\s.\-]+$", street): # letters, numbers, space, dot, hyphen
-        errors.append("Invalid street name.")
-
-# city
-    if not regex.fullmatch(r"^[\p{L}\s\-]+$", city): # only letters, space, hyphens
-        errors.append("Invalid city name.")
-
-# province
-    valid_provinces = [
-        "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
-        "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan"
-    ]
-    if province not in valid_provinces:
-        errors.append("Invalid province.")
-
-# postal code
-    if not regex.fullmatch(r"^[A-Z]\d[A-Z] \d[A-Z]\d$", postal_code): # must be in Canadian format
-        errors.append("Invalid postal code format (e.g., H2Z 1A1).")
-
-# phone
-    if phone and (not phone.isdigit() or len(phone) != 10): # must have exactly 10 digits
-        errors.append("Phone number must be 10 digits.")
-
-# email
-    if email and (not regex.match(r"^[^@]+@[^@]+\.[^@]{2,}$", email) or len(email) < 6): 
-        # at least one character before and after @ and 2 characters after final dot
-        errors.append("Invalid email address.")
-
-# PIN
-    if not pin.isdigit() or len(pin) != 4: # must be exactly 4 digits
-        errors.append("PIN must be exactly 4 digits.")
+    # all rules live in validation.py (compiled once, shared with update_customer_info and the bulk onboarding)
+    # values are stored the way they were validated: without surrounding spaces, like onboarding stores them
+    record = normalize_customer({
+        "first_name": first_name, "last_name": last_name, "dob": dob, "app": app, "building": building,
+        "street": street, "city": city, "province": province, "postal_code": postal_code,
+        "phone": phone, "email": email, "pin": pin,
+    })
+    errors = validate_customer(record)
 
     # Raise all errors together if any
     if errors:
-        raise ValueError(errors)
+        raise ValueError(error_messages(errors))
+    first_name, last_name, dob, app, building, street, city, province, postal_code, phone, email, pin = record.values()
 
 
 # cursor is like remote control for interacting with the database
 # cursor.execute: how you run SQL commands from python code
 
+    # customer and account are saved together with one commit (see unit_of_work in db_pool.py),
+    # so a failure can never leave a customer without an account
+    with unit_of_work() as conn:
+        cursor = conn.cursor()
+
 # insert new customer record into the customer table
-    cursor.execute("""
-        insert into customer (first_name, last_name, dob, app, building, street, city, province, phone, email, postal_code)
-        values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """, (first_name.title(), last_name.title(), dob, app, building, street.title(), city.title(),
-          province, phone, email, postal_code))
-    mydb.commit() # save changes permanently
+        cursor.execute("""
+            insert into customer (first_name, last_name, dob, app, building, street, city, province, phone, email, postal_code)
+            values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (first_name.title(), last_name.title(), dob, app, building, street.title(), city.title(),
+              province, phone, email, postal_code))
 
-    customer_id = cursor.lastrowid # retrieves the customer_id of the newly inserted row
+        customer_id = cursor.lastrowid # retrieves the customer_id of the newly inserted row
 
 # create a new account for this customer with teh given PIN
-    cursor.execute("""
-        insert into account (customer_id, pin) 
-        values (%s, %s)
-    """, (customer_id, pin))
-    mydb.commit() # save changes permanently
+        cursor.execute("""
+            insert into account (customer_id, pin) 
+            values (%s, %s)
+        """, (customer_id, pin))
+        account_number = cursor.lastrowid # the new account number that was just created in the account table
+        after_commit(authenticator.invalidate, account_number) # in case someone tried this number before it existed
 
-    return cursor.lastrowid  # returns a new account number that was just created in the account table
+    return account_number
 
 #this function returns all personal info for one account number by joining customer and account table
-def view_personal_info(cursor, account_number):
-    cursor.execute("""
-        select c.first_name, c.last_name, c.DOB, c.app, c.building, c.street, c.city, c.province, c.postal_code, c.phone, c.email, a.account_number
-        from customer c
-        join account a on c.customer_id = a.customer_id
-        where a.account_number = %s 
-    """, (account_number,))
-    # %s is a placeholder for the account number
-    result = cursor.fetchone() # returns only the first matching row from the query
+@instrumented
+def view_personal_info(account_number):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select c.first_name, c.last_name, c.DOB, c.app, c.building, c.street, c.city, c.province, c.postal_code, c.phone, c.email, a.account_number
+            from customer c
+            join account a on c.customer_id = a.customer_id
+            where a.account_number = %s 
+        """, (account_number,))
+        # %s is a placeholder for the account number
+        result = cursor.fetchone() # returns only the first matching row from the query
     
     if result:
         return {
@@ -170,18 +110,14 @@ def view_personal_info(cursor, account_number):
 
 # Login existing customer
 # check if account number and PIN match together
-def login_customer(cursor, account, pin):
-    cursor.execute("select * from account where account_number=%s and pin=%s", (account, pin))
-    result = cursor.fetchone() # if credentials are correct, returns a row/ returns a tuple
-
-    if result:
-        return True, result[0] # account number from database
-    else:
-        return False, None
+# checked by auth.py: only the PIN is read, cached as a hash, and locked accounts never reach the database
+@instrumented
+def login_customer(account, pin):
+    return authenticator.login(account, pin) # (True, account number) or (False, None)
 
     
+@instrumented
 def update_customer_info(
-    cursor,
     account_number,
     # these are the customer info which may be updated
     # first name, last name and DOB can't be updated by customer
@@ -189,15 +125,17 @@ def update_customer_info(
     email=None, phone=None, app=None, building=None, street=None, city=None, province=None, postal_code=None
 ):
 
-    cursor.execute("""
-        select customer.customer_id,
-               customer.app, customer.building, customer.street, customer.city, customer.province, customer.postal_code,
-               customer.phone, customer.email
-        from customer
-        join account on customer.customer_id = account.customer_id
-        where account.account_number = %s
-    """, (account_number,)) # returns single-member tuple(instead of int)
-    current = cursor.fetchone() # fetch current info
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select customer.customer_id,
+                   customer.app, customer.building, customer.street, customer.city, customer.province, customer.postal_code,
+                   customer.phone, customer.email
+            from customer
+            join account on customer.customer_id = account.customer_id
+            where account.account_number = %s
+        """, (account_number,)) # returns single-member tuple(instead of int)
+        current = cursor.fetchone() # fetch current info
 
     if not current:
         return False  # no customer found
@@ -217,93 +155,69 @@ def update_customer_info(
     new_email = email.strip() if email else curr_email
     new_phone = phone.strip() if phone else curr_phone
 
-# validation patterns
-    errors = []
-
-# apartment
-    if new_app and not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", new_app): # accepts format like 12, 12A, 12 A
-        errors.append("Invalid apartment number format (e.g., 123, 123A, 123 A).")
-
-# building
-    if new_building and not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", new_building): # accepts format like 12, 12A, 12 A
-        errors.append("Invalid building number format.")
-
-# street
-    if new_street and not regex.fullmatch(r"^[\p{L}\d\s.\-]+$", new_street): # letters, numbers, spaces, dot, hyphen
-        errors.append("Invalid street name format.")
-
-# city
-    if new_city and not regex.fullmatch(r"^[\p{L}\s\-]+$", new_city): # only letters, space, hyphens
-        errors.append("Invalid city name format.")
-
-# province
-    valid_provinces = [
-        "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
-        "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan"
-    ]
-    if new_province and new_province not in valid_provinces:
-        errors.append("Invalid province name.")
-
-# postal code
-    if new_postal and not regex.fullmatch(r"^[A-Z]\d[A-Z] \d[A-Z]\d$", new_postal): # must be in Canadian format
-        errors.append("Invalid postal code format (e.g., H2Z 1A1).")
-
-# phone
-    if new_phone and (not new_phone.isdigit() or len(new_phone) != 10): # must have exactly 10 digits
-        errors.append("Phone number must be exactly 10 digits.")
-
-# email
-    if new_email and (not regex.match(r"^[^@]+@[^@]+\.[^@]{2,}$", new_email) or len(new_email) < 6):
-         # at least one character before and after @ and 2 characters after final dot
-        errors.append("Invalid email address.")
+# validation (only the fields that have a value, see validation.py)
+    errors = validate_customer({
+        "app": new_app, "building": new_building, "street": new_street, "city": new_city,
+        "province": new_province, "postal_code": new_postal, "phone": new_phone, "email": new_email,
+    }, partial=True, messages=UPDATE_MESSAGES)
 
 # stop if any validation fails
     if errors:
-        raise ValueError(errors)
+        raise ValueError(error_messages(errors))
 
 # update database if no errors
 # # updates all fields, but keeps old values for any field the user leaves blank
 # structure of the SQL
 # using % safely inserts values into the querym keeps the code clean, prevents SQL injections
-    cursor.execute("""
-        update customer
-        set app = %s, building = %s, street = %s, city = %s, province = %s, postal_code = %s, phone = %s, email = %s
-        where customer_id = %s
-    """, (new_app, new_building, new_street, new_city, new_province, new_postal, new_phone, new_email, customer_id))
-    # fill the python placeholders
-    mydb.commit() # save the changes
+    with unit_of_work() as conn: # saved when the block ends
+        cursor = conn.cursor()
+        cursor.execute("""
+            update customer
+            set app = %s, building = %s, street = %s, city = %s, province = %s, postal_code = %s, phone = %s, email = %s
+            where customer_id = %s
+        """, (new_app, new_building, new_street, new_city, new_province, new_postal, new_phone, new_email, customer_id))
+        # fill the python placeholders
+        after_commit(csv_export.mark_customer_changed, customer_id) # the next CSV export refreshes this customer's row
+        after_commit(generations.bump, account_number) # sessions showing this account read it again
 
     return True
 
 # change PIN
-def change_pin(cursor, account_number, old_pin, new_pin):
-    cursor.execute("select pin from account where account_number = %s", (account_number,)) # check if account exists
-    result = cursor.fetchone() # get one row from select result
-
-    if not result:  # Account not found
-        return "Account not found."
-    if result[0] != old_pin:  # Check if old PIN is correct
-        return "Old PIN is incorrect."
-    if not new_pin.isdigit() or len(new_pin) != 4:
-        return "New PIN must be exactly 4 digits."
+@instrumented
+def change_pin(account_number, old_pin, new_pin):
+    with unit_of_work() as conn: # saved when the block ends
+        cursor = conn.cursor()
+        cursor.execute("select pin from account where account_number = %s", (account_number,)) # check if account exists
+        result = cursor.fetchone() # get one row from select result
+
+        if not result:  # Account not found
+            return "Account not found."
+        if result[0] != old_pin:  # Check if old PIN is correct
+            return "Old PIN is incorrect."
+        if not new_pin.isdigit() or len(new_pin) != 4:
+            return "New PIN must be exactly 4 digits."
 
-    cursor.execute("update account set pin = %s where account_number = %s", (new_pin, account_number))
-    mydb.commit() # save the changes to the database
+        cursor.execute("update account set pin = %s where account_number = %s", (new_pin, account_number))
+        after_commit(authenticator.invalidate, account_number) # the next login reads the new PIN
+        after_commit(generations.bump, account_number)
     return "PIN updated successfully."
 
-def verify_forgot_pin_identity(cursor, account_number, first_name, last_name, dob):
+@instrumented
+def verify_forgot_pin_identity(account_number, first_name, last_name, dob):
     try:
         # verify the person asking for a new PIN
-        cursor.execute("""
-            select a.account_number
-            from customer c
-            join account a on c.customer_id = a.customer_id
-            where a.account_number = %s
-              and c.first_name = %s
-              and c.last_name  = %s
-              and c.DOB        = %s
-        """, (account_number, first_name, last_name, dob))
-        result = cursor.fetchone()
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                select a.account_number
+                from customer c
+                join account a on c.customer_id = a.customer_id
+                where a.account_number = %s
+                  and c.first_name = %s
+                  and c.last_name  = %s
+                  and c.DOB        = %s
+            """, (account_number, first_name, last_name, dob))
+            result = cursor.fetchone()
         if not result:
             return False, "No matching user found."
         return True, "Identity verified."
@@ -312,120 +226,428 @@ def verify_forgot_pin_identity(cursor, account_number, first_name, last_name, do
 
 
 # forgot PIN
-def forgot_pin(cursor, mydb, account_number, first_name, last_name, dob, new_pin):
+@instrumented
+def forgot_pin(account_number, first_name, last_name, dob, new_pin):
     if not (isinstance(new_pin, str) and new_pin.isdigit() and len(new_pin) == 4):
         return False, "PIN must be exactly 4 digits."
     try:
-        # verifies the person asking for a new PIN
-        cursor.execute("""
-            select a.account_number
-            from customer c
-            join account a on c.customer_id = a.customer_id
-            where a.account_number = %s and c.first_name = %s and c.last_name = %s and c.DOB = %s
-        """, (account_number, first_name, last_name, dob))
-        result = cursor.fetchone()
-        if not result:
-            return False, "No matching user found."
-        cursor.execute("update account set pin = %s where account_number = %s", (new_pin, account_number))
-        mydb.commit() # makes it permanent
+        with unit_of_work() as conn: # saved when the block ends
+            cursor = conn.cursor()
+            # verifies the person asking for a new PIN
+            cursor.execute("""
+                select a.account_number
+                from customer c
+                join account a on c.customer_id = a.customer_id
+                where a.account_number = %s and c.first_name = %s and c.last_name = %s and c.DOB = %s
+            """, (account_number, first_name, last_name, dob))
+            result = cursor.fetchone()
+            if not result:
+                return False, "No matching user found."
+            cursor.execute("update account set pin = %s where account_number = %s", (new_pin, account_number))
+            # identity was verified, so a lockout ends too
+            after_commit(authenticator.invalidate, account_number, True)
+            after_commit(generations.bump, account_number)
         return True, account_number
     except Exception as e:
         return False, "PIN reset failed."
 
 
 # show account balance
-def check_balance(cursor, account_number):
-    cursor.execute("""
-        select a.balance
-        from account a
-        where a.account_number = %s
-    """, (account_number,))
-    result = cursor.fetchone()  # Fetch the balance
+# repeated reads are served from balance_cache (see balance_cache.py)
+@instrumented
+def check_balance(account_number):
+    cached = not in_unit_of_work() # inside a unit the balance may include writes that get rolled back
+    if cached:
+        hit, balance = balance_cache.get(account_number)
+        if hit:
+            return balance
+
+    token = balance_cache.fill_token()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select a.balance
+            from account a
+            where a.account_number = %s
+        """, (account_number,))
+        result = cursor.fetchone()  # Fetch the balance
     if result:
+        if cached:
+            balance_cache.put(account_number, result[0], token)
         return result[0]
     else:
         return None
 
 
-def make_transaction(cursor, account_number, transaction_type, amount):
-    if amount < 0.01:
-        raise ValueError("Minimum amount is $0.01.")
-
+@instrumented
+def make_transaction(account_number, transaction_type, amount):
     transaction_type = transaction_type.lower()
-    # check balance if withdrawal
-    if transaction_type == "withdrawal":
-        cursor.execute("select balance from account where account_number = %s", (account_number,))
-        balance = cursor.fetchone()
-        if not balance:
-            return "Account not found."
-        if amount > balance[0]:
-            raise ValueError("Insufficient funds.")
-        cursor.execute("update account set balance = balance - %s where account_number = %s", (amount, account_number))
-
-    elif transaction_type == "deposit":
-        if amount > 10_000:
-            raise ValueError("Deposit limit is $10,000.")
-        else:
-            cursor.execute("update account set balance = balance + %s where account_number = %s", (amount, account_number))
+    check_transaction(transaction_type, amount) # minimum amount, deposit limit, valid type
 
+    if config.GROUP_COMMIT and not in_unit_of_work():
+        # committed together with the postings of other threads, returns once that commit is done (see group_commit.py)
+        posted = get_group_commit().post(_post, account_number, transaction_type, amount)
     else:
-        raise ValueError("Invalid transaction type.")
-    
-    # record transaction
-    cursor.execute("""
-        insert into transaction (account_number, type, amount)
-        values (%s, %s, %s)
-    """, (account_number, transaction_type, amount))
-
-    mydb.commit() # saves changes to the database permanently
+        # committed when the block ends, or together with the caller's unit of work (ex: a batch of transactions)
+        with unit_of_work() as conn:
+            posted = _post(conn.cursor(), account_number, transaction_type, amount)
+    if not posted:
+        return "Account not found."
     return f"{transaction_type.capitalize()} successful."
 
 
+# one posting of make_transaction, inside the unit of work that commits it
+def _post(cursor, account_number, transaction_type, amount):
+    # balance check + update in one atomic statement, then the insert (see ledger.py)
+    if not post_transaction(cursor, account_number, transaction_type, amount):
+        return False
+    after_commit(balance_cache.invalidate, account_number) # the next check_balance reads the new balance
+    after_commit(generations.bump, account_number)
+    return True
+
+
+# post many transactions at once (ex: end-of-day branch deposit files)
+# records: list of (account_number, type, amount) tuples or dicts with those keys
+# every row is checked with the same rules as make_transaction, but each chunk of rows costs
+# one locking select, one executemany for the balances, one executemany for the history rows and one commit
+# returns one result per input row: {"row", "account_number", "type", "amount", "status", "message"}
+@instrumented
+def make_transactions_bulk(records, chunk_size=None):
+    chunk_size = chunk_size or config.BULK_CHUNK_SIZE
+    report = []
+    chunk = []
+    for row, record in enumerate(records, start=1):
+        chunk.append(_bulk_result(row, record))
+        if len(chunk) >= chunk_size:
+            _post_chunk(chunk)
+            report.extend(chunk)
+            chunk = []
+    if chunk:
+        _post_chunk(chunk)
+        report.extend(chunk)
+    return report
+
+
+def _bulk_result(row, record):
+    if isinstance(record, dict):
+        account_number, transaction_type, amount = record["account_number"], record["type"], record["amount"]
+    else:
+        account_number, transaction_type, amount = record
+    result = {"row": row, "account_number": account_number, "type": str(transaction_type).lower(),
+              "amount": amount, "status": "pending", "message": ""}
+    try:
+        result["account_number"] = int(account_number)
+    except (TypeError, ValueError):
+        result["status"], result["message"] = "rejected", "Invalid account number."
+        return result
+    try:
+        result["amount"] = Decimal(str(amount)).quantize(Decimal("0.01"))
+    except ArithmeticError:
+        result["status"], result["message"] = "rejected", "Invalid amount."
+        return result
+    try:
+        check_transaction(result["type"], result["amount"]) # minimum amount, deposit limit, valid type
+    except ValueError as e:
+        result["status"], result["message"] = "rejected", str(e)
+    return result
+
+
+# post the valid rows of one chunk inside a single database transaction
+def _post_chunk(chunk):
+    rows = [r for r in chunk if r["status"] == "pending"]
+    if not rows:
+        return
+    accounts = sorted({r["account_number"] for r in rows})
+    try:
+        with unit_of_work() as conn: # one commit for the whole chunk
+            cursor = conn.cursor()
+            # lock every account of the chunk once, so nobody changes these balances until we commit
+            placeholders = ", ".join(["%s"] * len(accounts))
+            cursor.execute(f"select account_number, balance from account where account_number in ({placeholders}) for update",
+                           accounts)
+            balances = {acc: Decimal(str(balance)) for acc, balance in cursor.fetchall()}
+
+            # replay the rows in file order against the running balance
+            deltas = {}
+            for r in rows:
+                acc = r["account_number"]
+                if acc not in balances:
+                    r["status"], r["message"] = "rejected", "Account not found."
+                    continue
+                change = r["amount"] if r["type"] == "deposit" else -r["amount"]
+                if balances[acc] + change < 0:
+                    r["status"], r["message"] = "rejected", "Insufficient funds."
+                    continue
+                if r["type"] == "withdrawal":
+                    try:
+                        reservation = withdrawal_limits.reserve(acc, r["amount"]) # uncounted if the chunk rolls back
+                    except ValueError as e:
+                        r["status"], r["message"] = "rejected", str(e)
+                        continue
+                if config.ANOMALY_SCORING:
+                    try:
+                        scorer.check(acc, r["type"], r["amount"]) # learns from the row when the chunk commits
+                    except ValueError as e: # held for review
+                        if r["type"] == "withdrawal":
+                            withdrawal_limits.release(reservation)
+                        r["status"], r["message"] = "rejected", str(e)
+                        continue
+                balances[acc] += change
+                deltas[acc] = deltas.get(acc, 0) + change
+                r["status"], r["message"] = "ok", f"{r['type'].capitalize()} successful."
+
+            posted = [r for r in rows if r["status"] == "ok"]
+            if posted:
+                # one balance update per account with the net change, not one per row
+                cursor.executemany("update account set balance = balance + %s where account_number = %s",
+                                   [(delta, acc) for acc, delta in deltas.items() if delta])
+                cursor.executemany("""
+                    insert into `transaction` (account_number, type, amount)
+                    values (%s, %s, %s)
+                """, [(r["account_number"], r["type"], r["amount"]) for r in posted])
+                snapshots.record(cursor, deltas) # today's closing balances, committed with the chunk
+            # the accounts stay locked until the commit, so these are exactly the committed balances
+            after_commit(balance_cache.update, {acc: balances[acc] for acc in deltas})
+            after_commit(generations.bump, *deltas)
+    except Exception as e: # the chunk was rolled back, none of its rows were posted
+        balance_cache.invalidate(*accounts)
+        for r in rows:
+            if r["status"] in ("pending", "ok"): # rows already rejected keep their own reason
+                r["status"], r["message"] = "error", f"Database error: {e}"
+
+
+# sort options of the View Transactions page -> (column, direction)
+# transaction_id breaks ties, so every row has a unique position and pages never overlap
+TRANSACTION_SORTS = {
+    "Newest First": ("timestamp", "desc"),
+    "Oldest First": ("timestamp", "asc"),
+    "Highest Amount": ("amount", "desc"),
+    "Lowest Amount": ("amount", "asc"),
+}
+
+# turn the View Transactions filters into one parameterized SQL query, returns (sql, params)
+# start_date/end_date: dates (end date included), transaction_type: "All", "Deposit" or "Withdrawal"
+# last_n: only look at the N most recent transactions before filtering ("Last N Transactions" scope)
+# after: page key of the last row already shown (see next_page_key), None for the first page
+# pages use keyset ("seek") pagination: instead of skipping rows with OFFSET, the query starts
+# right after the last row shown, so page 1000 costs the same as page 1
+def build_transaction_query(account_number, start_date=None, end_date=None, transaction_type="All",
+                            min_amount=None, max_amount=None, sort="Newest First", last_n=None,
+                            after=None, limit=10):
+    column, direction = TRANSACTION_SORTS[sort]
+    params = [account_number]
+
+    if last_n: # pick the last N rows first, then apply the filters to them only
+        source = """(
+            select transaction_id, type, amount, timestamp from `transaction`
+            where account_number = %s
+            order by timestamp desc, transaction_id desc
+            limit %s
+        ) t"""
+        params.append(int(last_n))
+        conditions = []
+    else:
+        source = "`transaction`"
+        conditions = ["account_number = %s"]
+
+    if start_date:
+        conditions.append("timestamp >= %s")
+        params.append(start_date)
+    if end_date: # everything before midnight of the next day, so the index can be used (no date(timestamp))
+        conditions.append("timestamp < %s")
+        params.append(end_date + timedelta(days=1))
+    if transaction_type and transaction_type != "All":
+        conditions.append("type = %s")
+        params.append(transaction_type.lower())
+    if min_amount is not None:
+        conditions.append("amount >= %s")
+        params.append(min_amount)
+    if max_amount is not None:
+        conditions.append("amount <= %s")
+        params.append(max_amount)
+    if after is not None: # rows that come after the last row of the previous page
+        value, transaction_id = after
+        op = "<" if direction == "desc" else ">"
+        conditions.append(f"({column} {op} %s or ({column} = %s and transaction_id {op} %s))")
+        params.extend([value, value, transaction_id])
+
+    where = f"where {' and '.join(conditions)}" if conditions else ""
+    sql = f"""
+        select transaction_id, type, amount, timestamp
+        from {source}
+        {where}
+        order by {column} {direction}, transaction_id {direction}
+    """
+    if limit is not None: # limit=None: every matching row (used by the streaming export)
+        sql += " limit %s"
+        params.append(int(limit))
+    return sql, params
+
+
+# page key of the last row of a page, pass it as `after` to get the next page
+def next_page_key(df, sort="Newest First"):
+    import pandas as pd
+
+    if df.empty:
+        return None
+    last = df.iloc[-1]
+    column, _ = TRANSACTION_SORTS[sort]
+    value = last[column]
+    if column == "timestamp":
+        value = pd.Timestamp(value).to_pydatetime()
+    else:
+        value = Decimal(str(value)).quantize(Decimal("0.01"))
+    return value, int(last["transaction_id"])
+
+
 # Show transaction history
-def view_transactions(account_number):
-    # uses the database connection directly and returns a DataFrame
-    df = pd.read_sql("""
-    select type, amount, timestamp
-    from transaction
-    where account_number = %s
-    order by timestamp desc
-    limit 10
-    """, con=mydb, params=(account_number,))
-    
+# without filters: the 10 most recent transactions, like before
+# keyword arguments are the filters of build_transaction_query
+@instrumented
+def view_transactions(account_number, **filters):
+    import pandas as pd
+
+    sql, params = build_transaction_query(account_number, **filters)
+    # uses a pooled database connection directly and returns a DataFrame
+    with connection() as conn:
+        df = pd.read_sql(sql, con=conn, params=params)
+
+    # months moved to the cold archive (archive.py) are only read when the date filter reaches back to them
+    if filters.get("start_date") and not filters.get("last_n"):
+        archived = archive.read_transactions(account_number, filters["start_date"], filters.get("end_date"))
+        if archived is not None:
+            df = _with_archived(df, archived, **filters)
+
     df.index += 1  # make index start at 1
     return df  # always return a DataFrame
 
 
+# page of view_transactions with the archived rows merged in: the same filters, order, page key and
+# limit as build_transaction_query, applied to the archived rows in pandas
+def _with_archived(df, archived, sort="Newest First", limit=10, **filters):
+    import pandas as pd
+
+    column, direction = TRANSACTION_SORTS[sort]
+    archived = _filter_archived(archived, sort=sort, **filters)
+    df = df.assign(timestamp=pd.to_datetime(df["timestamp"]), amount=df["amount"].map(lambda a: Decimal(str(a))))
+    merged = pd.concat([df, archived], ignore_index=True)
+    # a month that was being archived can be in both for a moment, see archive.py
+    merged = merged.drop_duplicates("transaction_id")
+    merged = merged.sort_values([column, "transaction_id"], ascending=direction == "asc")
+    if limit is not None:
+        merged = merged.head(int(limit))
+    return merged.reset_index(drop=True)
+
+
+# the filters and page key of build_transaction_query applied to archived rows, sorted the same way
+def _filter_archived(archived, transaction_type="All", min_amount=None, max_amount=None,
+                     sort="Newest First", after=None, **_):
+    import pandas as pd
+
+    column, direction = TRANSACTION_SORTS[sort]
+    if transaction_type and transaction_type != "All":
+        archived = archived[archived["type"] == transaction_type.lower()]
+    if min_amount is not None:
+        archived = archived[archived["amount"] >= Decimal(str(min_amount))]
+    if max_amount is not None:
+        archived = archived[archived["amount"] <= Decimal(str(max_amount))]
+    if after is not None:
+        value, transaction_id = after
+        values = archived[column] if column == "amount" else pd.to_datetime(archived[column])
+        value = Decimal(str(value)) if column == "amount" else pd.Timestamp(value)
+        if direction == "desc":
+            archived = archived[(values < value) | ((values == value) & (archived["transaction_id"] < transaction_id))]
+        else:
+            archived = archived[(values > value) | ((values == value) & (archived["transaction_id"] > transaction_id))]
+    archived = archived.assign(timestamp=pd.to_datetime(archived["timestamp"]))
+    return archived.sort_values([column, "transaction_id"], ascending=direction == "asc")
+
+
+# stream the (filtered) transaction history as CSV bytes, chunk by chunk
+# rows come from an unbuffered cursor with fetchmany, so only `chunk_size` rows are in memory at
+# a time no matter how long the history is; compress=True yields a gzip file instead
+# keyword arguments are the filters of build_transaction_query
+# archived months in the dates (archive.py) are merged in like in view_transactions: the account's archived
+# rows are read first (one account, only the months asked for), then merged with the table's rows in order
+@instrumented
+def stream_transactions_csv(account_number, chunk_size=None, compress=False, **filters):
+    import heapq
+
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    filters.pop("after", None)
+    filters.pop("limit", None)
+    sql, params = build_transaction_query(account_number, limit=None, **filters)
+    compressor = zlib.compressobj(wbits=31) if compress else None # wbits=31: gzip header, readable by any unzip tool
+    column, direction = TRANSACTION_SORTS[filters.get("sort", "Newest First")]
+
+    archived = []
+    if filters.get("start_date") and not filters.get("last_n"):
+        frame = archive.read_transactions(account_number, filters["start_date"], filters.get("end_date"))
+        if frame is not None:
+            frame = _filter_archived(frame, **filters)
+            archived = [(transaction_id, t, amount, timestamp.to_pydatetime()) for transaction_id, t, amount, timestamp
+                        in frame[["transaction_id", "type", "amount", "timestamp"]].itertuples(index=False, name=None)]
+
+    def key(row): # the query's order: sort column, then transaction_id
+        if column == "amount":
+            return Decimal(str(row[2])), row[0]
+        timestamp = row[3]
+        return (datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp), row[0]
+
+    def encode(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        data = buffer.getvalue().encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    with connection() as conn:
+        cursor = conn.cursor(buffered=False) # rows stay on the server until we fetch them
+        cursor.execute(sql, params)
+
+        def table_rows():
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
+
+        rows = heapq.merge(table_rows(), archived, key=key, reverse=direction == "desc") if archived else table_rows()
+        yield encode([("type", "amount", "timestamp")])
+        chunk, last_id = [], None
+        for transaction_id, t, amount, timestamp in rows:
+            if transaction_id == last_id: # a month that was being archived can be in both for a moment, see archive.py
+                continue
+            last_id = transaction_id
+            # same format as the table on the page ($1,234.50)
+            chunk.append((t, f"${amount:,.2f}", timestamp))
+            if len(chunk) >= chunk_size:
+                yield encode(chunk)
+                chunk = []
+        if chunk:
+            yield encode(chunk)
+    if compressor:
+        yield compressor.flush()
+
+
+# write the streamed history to a file, returns the file path
+@instrumented
+def export_transactions(account_number, path, compress=False, **filters):
+    with open(path, "wb") as f:
+        for chunk in stream_transactions_csv(account_number, compress=compress, **filters):
+            f.write(chunk)
+    return path
+
+
 # update CSV (with account_number starting at 10001)
+# incremental: appends accounts created since the last export and refreshes changed customers
+# (see csv_export.py), a full rebuild runs with: python csv_export.py --rebuild
+@instrumented
 def update_csv():
-    script_dir = os.path.dirname(os.path.abspath(__file__)) # find the folder where the .py is located
-    csv_path = os.path.join(script_dir, "customers.csv") # places the file into that folder
     try:
-        # read customer data into a DataFrame
-        df = pd.read_sql("""
-            select 
-                a.account_number,
-                c.customer_id,
-                c.first_name,
-                c.last_name,
-                c.DOB,
-                c.app,
-                c.building,
-                c.street,
-                c.city,
-                c.province,
-                c.postal_code,
-                c.phone,
-                c.email
-            from customer c
-            join account a on c.customer_id = a.customer_id
-        """, con=mydb)
-
-        # saves all customer and account data to customer.csv/ if index=True: it would contain an extra column 
-        df.to_csv(csv_path, index=False) 
-        print("CSV updated at:", csv_path)
+        count = csv_export.export_incremental()
+        print(f"CSV updated at: {csv_export.CSV_PATH} ({count} rows written)")
 
     except PermissionError: # if the user has customers.csv open, it won't overwrite it and warns user to close the app(ex: excel)
         print("Cannot update CSV. Please close it in Excel and try again.")
     except Exception as e: # prevents getting any other errors
-        print("Error updating CSV:", e)
\ No newline at end of file
+        print("Error updating CSV:", e)
@@ -0,0 +1,85 @@
+# process-wide cache of account balances for check_balance
+# bounded (least recently used balances are dropped first) and every entry expires after `ttl`
+# seconds, so balances changed by another process are picked up after at most `ttl` seconds
+# writes in this process (make_transaction, make_transactions_bulk) update or drop the entry right away
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class BalanceCache:
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or config.BALANCE_CACHE_SIZE
+        self.ttl = config.BALANCE_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict() # account_number -> (balance, expires_at), oldest first
+        self._lock = threading.Lock()
+        self._writes = 0 # bumped by every invalidation, see fill_token()
+        self.hits = 0
+        self.misses = 0
+
+    # returns (True, balance) on a hit, (False, None) on a miss
+    def get(self, account_number):
+        with self._lock:
+            entry = self._entries.get(account_number)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(account_number)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[account_number] # expired
+            self.misses += 1
+            return False, None
+
+    # take a token BEFORE reading the balance from the database, and pass it to put()
+    # if a write invalidated anything in between, the value read may already be stale and is not cached
+    def fill_token(self):
+        return self._writes
+
+    def put(self, account_number, balance, token=None):
+        with self._lock:
+            if token is not None and token != self._writes:
+                return
+            self._entries[account_number] = (balance, time.monotonic() + self.ttl)
+            self._entries.move_to_end(account_number)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False) # least recently used
+
+    # write-through: store balances we just committed ({account_number: balance})
+    def update(self, balances):
+        with self._lock:
+            self._writes += 1 # a read that started before this write must not overwrite it
+            expires_at = time.monotonic() + self.ttl
+            for account_number, balance in balances.items():
+                self._entries[account_number] = (balance, expires_at)
+                self._entries.move_to_end(account_number)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *account_numbers):
+        with self._lock:
+            self._writes += 1
+            for account_number in account_numbers:
+                self._entries.pop(account_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+# the cache shared by the whole process
+balance_cache = BalanceCache()
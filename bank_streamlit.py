@@ -1,13 +1,23 @@
 import streamlit as st
 import datetime
-import pandas as pd
 import regex
-from db import cursor, mydb
+import os
+import tempfile
+import hmac
+import config
+from db_pool import get_pool
+from balance_cache import balance_cache
+from session_cache import SessionCache, generations
+from instrumentation import query_stats
+from auth import authenticator
+import rollups
 from backend import(
     create_tables,
     login_customer,
     check_balance,
     view_transactions,
+    next_page_key,
+    export_transactions,
     view_personal_info,
     change_pin,
     verify_forgot_pin_identity,
@@ -16,6 +26,7 @@ from backend import(
     register_customer,
     make_transaction,
     update_csv)
+from validation import PROVINCE_LIST, UPDATE_MESSAGES, validate_customer, error_messages
 
 # definition to repetative parts
 # session_state: streamlit's memory(for temporary information)/ it remembers values between reruns
@@ -55,11 +66,24 @@ if "temp_account_number" not in st.session_state:
     st.session_state.temp_account_number = None
 if "next_page" not in st.session_state:
     st.session_state.next_page = None
+if "data_cache" not in st.session_state: # the logged-in account's info and balance, see session_cache.py
+    st.session_state.data_cache = SessionCache()
 
-# runs create_tables() if not already done
-if "db_init" not in st.session_state: # db_init: flag stored in session state to indicate if DB tables are created
+# runs create_tables() once per server process, not once per browser session
+# st.cache_resource keeps the result for every session, so new users go straight to the login page
+@st.cache_resource
+def init_database():
     create_tables()
-    st.session_state.db_init = True # create tables is done just once
+    return True
+
+
+# view_personal_info for the session cache: None when the account has no info, so it isn't cached
+def personal_info(account_number):
+    info = view_personal_info(account_number)
+    return info if isinstance(info, dict) else None
+
+
+init_database()
 
 # centered message
 if st.session_state.get("logout_message"):
@@ -86,7 +110,7 @@ if st.session_state.get("goto_login_after_registration"): # user just finished r
     pin = st.text_input("PIN", type="password")
 
     if st.button("Login"):
-        success, acc_number = login_customer(cursor, account_number, pin) # this checks the credentials in database
+        success, acc_number = login_customer(account_number, pin) # this checks the credentials in database
         if success:
             st.session_state.logged_in = True # user is authenticated
             st.session_state.account_number = acc_number # store which user is logged in
@@ -95,6 +119,8 @@ if st.session_state.get("goto_login_after_registration"): # user just finished r
             st.session_state.pop("goto_login_after_registration") # only needed after registration
             st.session_state.pop("temp_account_number")
             st.rerun() # refresh the UI
+        elif authenticator.locked_for(account_number): # too many wrong PINs, see auth.py
+            st.error(f"Too many failed attempts. Try again in {max(1, round(authenticator.locked_for(account_number) / 60))} minute(s).")
         else:
             st.error("Invalid account number or PIN.")
     st.stop() # stop everything below this code from running
@@ -115,7 +141,7 @@ if st.session_state.get("nav_to"):
 
 # main options __________________________________________________________________________
 if not st.session_state.logged_in:
-    options = ["Register New Customer", "Login Existing Customer", "Forgot PIN", "Exit"]
+    options = ["Register New Customer", "Login Existing Customer", "Forgot PIN", "Admin", "Exit"]
 
     if "option" not in st.session_state:
         st.session_state.option = "Login Existing Customer" # sidebar by default has this option chosen
@@ -155,9 +181,7 @@ if not st.session_state.logged_in:
                 building = st.text_input("Building Number", placeholder="12")
                 street = st.text_input("Street Name", placeholder="e.g. Saint Cathrine")
                 city = st.text_input("City", placeholder="Montreal")
-                province = st.selectbox("Province", [
-                    "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
-                    "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan"])
+                province = st.selectbox("Province", PROVINCE_LIST)
                 postal_code = st.text_input("Postal Code", placeholder="e.g. A1B 2C3").upper()
                 phone = st.text_input("Phone Number (Optional)", placeholder="e.g. 1234567890")
                 email = st.text_input("Email (Optional)", placeholder="e.g. example@gmail.com")
@@ -201,7 +225,7 @@ if not st.session_state.logged_in:
         if st.button("Login"):
             try:
                 # call login_customer in the backend
-                success, acc_number = login_customer(cursor, account_number, pin)
+                success, acc_number = login_customer(account_number, pin)
                 # success, acc_number=backend output
                 if success: # did the username and pin matches?
                     # session_state=app remembers state after refresh
@@ -209,6 +233,8 @@ if not st.session_state.logged_in:
                     st.session_state.account_number = acc_number  # store which user is logged in
                     st.session_state.show_welcome = True  # show welcome message
                     st.rerun()
+                elif authenticator.locked_for(account_number): # too many wrong PINs, see auth.py
+                    st.error(f"Too many failed attempts. Try again in {max(1, round(authenticator.locked_for(account_number) / 60))} minute(s).")
                 else:
                     st.error("Invalid account number or PIN.")
             except Exception as e:
@@ -248,7 +274,7 @@ if not st.session_state.logged_in:
                 st.error("Account number, first name and last name are required.")
             else:
                 # call backend function
-                ok, msg = verify_forgot_pin_identity(cursor,
+                ok, msg = verify_forgot_pin_identity(
                     account_number.strip(),
                     first_name.strip(),
                     last_name.strip(),
@@ -279,7 +305,7 @@ if not st.session_state.logged_in:
                     st.error("New PIN must be exactly 4 digits.")
                 else:
                     try:
-                        success, msg = forgot_pin(cursor, mydb, st.session_state.temp_account_number,
+                        success, msg = forgot_pin(st.session_state.temp_account_number,
                             first_name.strip(),
                             last_name.strip(),
                             dob.strftime("%Y-%m-%d"),
@@ -294,6 +320,104 @@ if not st.session_state.logged_in:
                         st.error("Something went wrong during PIN reset.")
                         st.text(str(e))
 
+ # admin: query performance and operations dashboard_________________________________________
+    elif option == "Admin":
+        st.header("Admin")
+
+        if not config.ADMIN_PASSWORD: # no password configured, nobody can open the page
+            st.info("The admin page is disabled. Set ATM_ADMIN_PASSWORD to enable it.")
+        elif not st.session_state.get("admin"):
+            password = st.text_input("Admin Password", type="password")
+            if st.button("Open"):
+                if hmac.compare_digest(password.encode(), config.ADMIN_PASSWORD.encode()): # constant-time compare
+                    st.session_state.admin = True
+                    st.rerun()
+                else:
+                    st.error("Wrong password.")
+        elif st.radio("", ["Query Performance", "Operations"], horizontal=True, key="admin_page") == "Operations":
+            # rollups.py: only the transactions posted since the last refresh are read here,
+            # every chart below comes from the small rollup tables
+            counted = rollups.refresh()
+            col1, col2 = st.columns(2)
+            start_date = col1.date_input("Start Date", datetime.date.today() - datetime.timedelta(days=29), key="ops_start")
+            end_date = col2.date_input("End Date", datetime.date.today(), key="ops_end")
+            if start_date > end_date:
+                st.error("Start date cannot be after end date.")
+                st.stop()
+
+            total = rollups.totals(start_date, end_date).iloc[0]
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Deposits", f"${total['deposits']:,.2f}")
+            col2.metric("Withdrawals", f"${total['withdrawals']:,.2f}")
+            col3.metric("Net Flow", f"${total['net']:,.2f}")
+            col4.metric("Transactions", f"{int(total['transactions']):,}",
+                        help=f"{counted} new since the last refresh, {rollups.pending()} waiting to settle")
+
+            st.subheader("Cash Flow")
+            grain = st.radio("Per", ["day", "hour"], horizontal=True, key="ops_grain")
+            flow = rollups.cash_flow(start_date, end_date, grain=grain)
+            if flow.empty:
+                st.write("No transactions in this period.")
+            else:
+                st.bar_chart(flow.set_index("period")[["deposits", "withdrawals"]])
+                st.line_chart(flow.set_index("period")["net"])
+
+            col1, col2 = st.columns(2)
+            col1.subheader("By Province")
+            col1.dataframe(rollups.totals(start_date, end_date, by="province"), use_container_width=True, hide_index=True)
+            col2.subheader("By Account Age")
+            col2.dataframe(rollups.totals(start_date, end_date, by="age_band"), use_container_width=True, hide_index=True)
+
+            st.subheader("Average Day")
+            st.bar_chart(rollups.hour_of_day(start_date, end_date)[["deposits", "withdrawals"]])
+
+            if st.button("Refresh", key="ops_refresh"):
+                st.rerun()
+        else:
+            summary = query_stats.summary() # one row per backend function, slowest total time first
+            pool = get_pool()
+            cache = balance_cache.stats()
+            sessions = generations.stats()
+
+            col1, col2, col3, col4, col5 = st.columns(5)
+            col1.metric("SQL Statements", sum(row["statements"] for row in summary))
+            col2.metric("Slow Queries", len(query_stats.slow_queries()), help=f"at least {config.SLOW_QUERY_MS:g} ms")
+            col3.metric("Pool Connections", pool.opened, help=f"{pool.checkouts} checkouts, {pool.reconnects} reconnects")
+            col4.metric("Balance Cache Hit Rate", f"{cache['hit_rate']:.0%}")
+            col5.metric("Session Cache Hit Rate", f"{sessions['hit_rate']:.0%}",
+                        help=f"{sessions['hits']} hits, {sessions['misses']} misses over all sessions")
+
+            st.subheader("Backend Functions")
+            if summary:
+                st.dataframe(summary, use_container_width=True, hide_index=True)
+            else:
+                st.write("No statements recorded yet.")
+
+            st.subheader("Latency Histogram")
+            functions = ["All"] + [row["function"] for row in summary]
+            selected = st.selectbox("Function", functions)
+            histogram = query_stats.histogram(None if selected == "All" else selected)
+            st.dataframe(
+                [{"latency": label, "statements": count} for label, count in histogram.items()],
+                column_config={"statements": st.column_config.ProgressColumn(
+                    "statements", format="%d", min_value=0, max_value=max(max(histogram.values()), 1))},
+                hide_index=True,
+            )
+
+            st.subheader("Slow Queries")
+            slow = query_stats.slow_queries()
+            if slow:
+                st.dataframe(slow, use_container_width=True, hide_index=True)
+            else:
+                st.write("No slow queries.")
+
+            col1, col2, col3 = st.columns([1, 1, 6])
+            if col1.button("Refresh"):
+                st.rerun()
+            if col2.button("Reset"):
+                query_stats.reset()
+                st.rerun()
+
  # exit_____________________________________________________________________________________
     elif option == "Exit":
         st.session_state.exit_app = True # show the exit page next time the app runs
@@ -325,8 +449,8 @@ if st.session_state.logged_in: # check if the user logged in
         if menu == "Check Balance":
             st.title("Check Balance")
             try:
-                # call check_balance in the backend
-                balance = check_balance(cursor, st.session_state.account_number) # check the balance
+                # call check_balance in the backend (only when the balance changed since this session last read it)
+                balance = st.session_state.data_cache.get("balance", st.session_state.account_number, check_balance)
                 if balance is not None:
                     st.subheader(f"Your current balance is: ${balance:,.2f}")
                 else:
@@ -358,8 +482,15 @@ if st.session_state.logged_in: # check if the user logged in
             if st.session_state.get("reset_filters", False): # checking reset filter
                 st.session_state.update(defaults) # apply all default filter values
                 st.session_state.reset_filters = False # turn reset flag off
+                st.session_state.filters_applied = False # back to the 10 most recent transactions
+                st.session_state.applied_filters = None
+                st.session_state.page_keys = [None] # back to the first page
                 st.rerun() # update immediately with default value
 
+            # page_keys: key of the last row of every page shown so far (None = first page)
+            st.session_state.setdefault("filters_applied", False)
+            st.session_state.setdefault("page_keys", [None])
+
             col1, col2 = st.columns(2) # splitting the screen into 2 side-by-side sections
 
             start_date = col1.date_input("Start Date", key="filter_start")
@@ -396,49 +527,77 @@ if st.session_state.logged_in: # check if the user logged in
                 st.session_state.reset_filters = True
                 st.rerun()
 
-            try:
-                # call view_transactions in the backend
-                df = view_transactions(st.session_state.account_number)
-                df["timestamp"] = pd.to_datetime(df["timestamp"])
-
-                if apply_filter:
-                    if filter_scope == "Last N Transactions":
-                        df = df.sort_values(by="timestamp", ascending=False).head(n_last)
-
-                    # date range
-                    df = df[(df["timestamp"].dt.date >= start_date) &
-                            (df["timestamp"].dt.date <= end_date)]
-
-                    # transaction type
-                    if transaction_type != "All":
-                        df = df[df["type"].str.lower() == transaction_type.lower()]
-
-                    # amount range
-                    df = df[(df["amount"] >= min_amount) &
-                            (df["amount"] <= max_amount)]
-
-                    # sorting
-                    if sort_option == "Newest First":
-                        df = df.sort_values(by="timestamp", ascending=False)
-                    elif sort_option == "Oldest First":
-                        df = df.sort_values(by="timestamp", ascending=True)
-                    elif sort_option == "Highest Amount":
-                        df = df.sort_values(by="amount", ascending=False)
-                    elif sort_option == "Lowest Amount":
-                        df = df.sort_values(by="amount", ascending=True)
+            if apply_filter:
+                # the filters are saved when applied: the page keys only make sense for the filters (and sort)
+                # they were taken with, so editing a widget afterwards doesn't change the pages until Apply
+                st.session_state.applied_filters = {
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "transaction_type": transaction_type,
+                    "min_amount": min_amount,
+                    "max_amount": max_amount,
+                    "sort": sort_option,
+                    "last_n": n_last if filter_scope == "Last N Transactions" else None,
+                }
+                st.session_state.filters_applied = True # keep the filters while the user pages through results
+                st.session_state.page_keys = [None] # new filters start on the first page
+
+            page_size = 10
+            if st.session_state.filters_applied and st.session_state.get("applied_filters"):
+                # all filtering and sorting happens in the database (see build_transaction_query)
+                filters = st.session_state.applied_filters
+            else:
+                filters = {"sort": "Newest First"} # the 10 most recent transactions
+            if st.session_state.get("page_filters") != filters: # keys taken under other filters would skip or repeat rows
+                st.session_state.page_filters = filters
+                st.session_state.page_keys = [None]
 
-                else:
-                    df = df.sort_values(by="timestamp", ascending=False).head(10)
+            try:
+                # call view_transactions in the backend, one extra row tells us if there is a next page
+                page = len(st.session_state.page_keys)
+                df = view_transactions(st.session_state.account_number,
+                    after=st.session_state.page_keys[-1], limit=page_size + 1, **filters)
+                has_next = st.session_state.filters_applied and len(df) > page_size
+                df = df.head(page_size)
+                next_key = next_page_key(df, filters["sort"])
+                df = df.drop(columns="transaction_id")
+                df.index += (page - 1) * page_size # keep numbering across pages
 
                 df["amount"] = df["amount"].apply(lambda x: f"${x:,.2f}") # change to format 100 -> $100.00
                 st.dataframe(df)
 
-                csv = df.to_csv(index=False).encode("utf-8") # convert the filtered DataFrame to CSV/ encode: streamlit's downalod button requires bytes, not a string
-                st.download_button(
-                    "Download Transaction History",
-                    data=csv,
-                    file_name="Transaction History.csv",
-                    mime="text/csv") # tells browser it's a CSV file (to have correct file type)
+                # previous / next page buttons (only when filters are applied)
+                if st.session_state.filters_applied:
+                    col5, col6, col7 = st.columns([1, 1, 4])
+                    if col5.button("Previous", disabled=page == 1):
+                        st.session_state.page_keys.pop()
+                        st.rerun()
+                    if col6.button("Next", disabled=not has_next):
+                        st.session_state.page_keys.append(next_key)
+                        st.rerun()
+                    col7.write(f"Page {page}")
+
+                # download the whole filtered history (not just this page)
+                # the file is streamed from the database in chunks into a temporary file, only when asked for, read back
+                # for this session's download button and deleted right away, so no history is left on disk or reachable
+                # outside the session; the button is only shown on the run that prepared it, so Streamlit holds the
+                # bytes until the next rerun instead of copying them again on every rerun
+                compress = st.checkbox("Compress download (gzip)")
+                if st.button("Prepare Download"):
+                    fd, path = tempfile.mkstemp(prefix="history_", suffix=".csv.gz" if compress else ".csv") # owner-only file
+                    os.close(fd)
+                    try:
+                        export_transactions(st.session_state.account_number, path, compress=compress, **filters)
+                        with open(path, "rb") as f:
+                            data = f.read()
+                    finally:
+                        os.remove(path)
+                    st.download_button(
+                        "Download Transaction History",
+                        data=data,
+                        file_name="Transaction History.csv.gz" if compress else "Transaction History.csv",
+                        mime="application/gzip" if compress else "text/csv", # tells browser the file type
+                        on_click="ignore") # clicking doesn't rerun, so the button stays until the next interaction
 
             except Exception as e:
                 st.error("Failed to filter transactions.")
@@ -448,8 +607,8 @@ if st.session_state.logged_in: # check if the user logged in
         elif menu == "View Personal Info":
             st.title("View Personal Information")
             try:
-                # call view_personal_info in the backend
-                info = view_personal_info(cursor, st.session_state.account_number)
+                # call view_personal_info in the backend (only when the info changed since this session last read it)
+                info = st.session_state.data_cache.get("personal_info", st.session_state.account_number, personal_info)
                 if isinstance(info, dict): # check if info is a dictionary
                     for key, value in info.items(): # display each field
                         st.write(f"**{key}**: {value}")
@@ -466,38 +625,25 @@ if st.session_state.logged_in: # check if the user logged in
             building = st.text_input("New Building Number", placeholder="e.g. 12")
             street = st.text_input("New Street Name", placeholder="Sainte Cathrine")
             city = st.text_input("New City", placeholder="Montreal")
-            province = st.selectbox("New Province", [
-                "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
-                "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan"])
+            province = st.selectbox("New Province", PROVINCE_LIST)
             postal_code = st.text_input("New Postal Code", placeholder="e.g. A1B 2C3").upper()
             phone = st.text_input("New Phone", placeholder="e.g. 1234567890")
             email = st.text_input("New Email", placeholder="e.g. example@gmail.com")
 
             if st.button("Update Info"):
                 try:
-                    # validation (same as registration)
-                    errors = []
-                    if app and not regex.fullmatch(r"^\d+( [A-Za-z])?$", app):
-                        errors.append("Invalid apartment number format.")
-                    if building and not regex.fullmatch(r"^\d+[A-Z]?$", building.strip()):
-                        errors.append("Invalid building number format.")
-                    if street and not regex.fullmatch(r"^[\p{L}]+([\- ]?[\p{L}\d])*$", street):
-                        errors.append("Invalid street name.")
-                    if city and not regex.fullmatch(r"^[\p{L}\s\-]+$", city):
-                        errors.append("Invalid city name.")
-                    if postal_code and not regex.fullmatch(r"^[A-Z]\d[A-Z] \d[A-Z]\d$", postal_code):
-                        errors.append("Invalid postal code.")
-                    if phone and (not phone.isdigit() or len(phone) != 10):
-                        errors.append("Phone must be 10 digits.")
-                    if email and (not regex.match(r"^[^@]+@[^@]+\.[^@]{2,}$", email) or len(email) < 6):
-                        errors.append("Invalid email address.")
+                    # validation (same rules and messages as update_customer_info, see validation.py)
+                    errors = error_messages(validate_customer({
+                        "app": app, "building": building, "street": street, "city": city, "province": province,
+                        "postal_code": postal_code, "phone": phone, "email": email,
+                    }, partial=True, messages=UPDATE_MESSAGES))
 
                     if errors:
                         for e in errors:
                             st.error(e)
                     else:
                         # call update_customer_info in the backend
-                        if update_customer_info(cursor, st.session_state.account_number,
+                        if update_customer_info(st.session_state.account_number,
                             # paramter name in backend function = variable from streamlit form
                             email=email,
                             phone=phone,
@@ -508,6 +654,7 @@ if st.session_state.logged_in: # check if the user logged in
                             province=province,
                             postal_code=postal_code):
                             st.success("Information updated successfully.")
+                            update_csv()  # customers.csv: the changed row is rewritten with the next compaction (csv_export.py)
                         else:
                             st.error("update failed.")
                 except Exception as e:
@@ -534,7 +681,7 @@ if st.session_state.logged_in: # check if the user logged in
 
                 try:
                     # call make_transaction in the backend
-                    result = make_transaction(cursor, st.session_state.account_number,
+                    result = make_transaction(st.session_state.account_number,
                         transaction_type.title(),
                         amount)
                     st.success(result)
@@ -547,8 +694,8 @@ if st.session_state.logged_in: # check if the user logged in
                     st.text(str(e))
 
             try:
-                # call check_balance in the backend
-                balance = check_balance(cursor, st.session_state.account_number) # check the balance
+                # call check_balance in the backend (only when the balance changed since this session last read it)
+                balance = st.session_state.data_cache.get("balance", st.session_state.account_number, check_balance)
                 if balance is not None:
                     st.write(f"**Your current balance is: ${balance:,.2f}**")
                 else:
@@ -576,7 +723,7 @@ if st.session_state.logged_in: # check if the user logged in
                 else:
                     try:
                         # call change_pin in the backend
-                        result = change_pin(cursor, st.session_state.account_number, old_pin, new_pin)
+                        result = change_pin(st.session_state.account_number, old_pin, new_pin)
                         if "success" in result.lower():
                             st.success(result)
                         else:
@@ -589,5 +736,7 @@ if st.session_state.logged_in: # check if the user logged in
         elif menu == "Logout":
             st.session_state.logged_in = False # end the logged_in session
             st.session_state.account_number = None # clear which account was logged in
+            st.session_state.page_keys = [None] # transaction pages belong to the old account
+            st.session_state.data_cache.clear() # so is the cached info and balance
             st.session_state.logout_message = True # show logout message on next rerun
             st.rerun() # rerun the app immediately
\ No newline at end of file
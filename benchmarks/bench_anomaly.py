@@ -0,0 +1,74 @@
+# benchmark: cost of anomaly scoring (anomaly.py) on the make_transaction hot path
+# registers `accounts` accounts (in-memory SQLite by default), gives each some history, then times
+#   score        - one AnomalyScorer.score() call (memory only)
+#   make_transaction with ATM_ANOMALY_SCORING off and on
+#
+#   python benchmarks/bench_anomaly.py --transactions 5000
+#   ATM_DB_NAME=atm_bench python benchmarks/bench_anomaly.py --backend config
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from db_pool import use_storage  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def register(backend, accounts):
+    numbers = []
+    for i in range(accounts):
+        numbers.append(backend.register_customer("Bench", "Mark", "1990-01-01", "", str(i), "Main St", "Toronto",
+                                                 "Ontario", "M5V 2T6", "4165551234", f"bench{i}@example.com", "1234"))
+    return numbers
+
+
+def post(backend, numbers, transactions):
+    start = time.perf_counter()
+    for _ in range(transactions):
+        backend.make_transaction(random.choice(numbers), "deposit", round(random.uniform(1, 500), 2))
+    return transactions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--history", type=int, default=50, help="transactions learned per account before timing")
+    parser.add_argument("--transactions", type=int, default=5_000)
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="sqlite")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        use_storage(SQLiteStorage(":memory:"))
+    import backend
+    from anomaly import scorer
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.create_tables()
+        numbers = register(backend, args.accounts)
+    now = time.time()
+    for number in numbers:
+        for i in range(args.history):
+            scorer.observe(number, random.uniform(1, 500), now - 3600 * (i + 1))
+
+    calls = 100_000
+    start = time.perf_counter()
+    for _ in range(calls):
+        scorer.score(random.choice(numbers), 250.0)
+    print(f"score: {(time.perf_counter() - start) / calls * 1e6:.2f} us per call")
+
+    for scoring in (False, True):
+        config.ANOMALY_SCORING = scoring
+        rate = post(backend, numbers, args.transactions)
+        print(f"make_transaction, scoring {'on ' if scoring else 'off'}: {rate:,.0f} per second")
+    print(scorer.stats())
+    scorer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmark: make_transaction throughput with and without group commit (group_commit.py)
+# `threads` threads post `deposits` deposits in total, spread over one account per thread, first with
+# ATM_GROUP_COMMIT off (one database transaction per deposit) then on; every run checks that the
+# balances and the history rows agree
+# file-backed SQLite by default, so every commit really syncs to disk (in-memory SQLite has no commit
+# cost to save)
+#
+#   python benchmarks/bench_group_commit.py --threads 8 --deposits 1600
+#   ATM_DB_NAME=atm_bench python benchmarks/bench_group_commit.py --backend config
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from db_pool import connection, use_storage  # noqa: E402
+from group_commit import get_group_commit  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def register(backend, accounts):
+    return [backend.register_customer("Bench", "Mark", "1990-01-01", "", str(i), "Main St", "Toronto", "Ontario",
+                                      "M5V 2T6", "4165551234", f"bench{i}@example.com", "1234")
+            for i in range(accounts)]
+
+
+def history(numbers):
+    placeholders = ", ".join(["%s"] * len(numbers))
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"select sum(balance) from account where account_number in ({placeholders})", numbers)
+        balance = Decimal(str(cursor.fetchone()[0]))
+        cursor.execute(f"select count(*) from `transaction` where account_number in ({placeholders})", numbers)
+        return balance, cursor.fetchone()[0]
+
+
+def run(backend, numbers, deposits):
+    per_thread = deposits // len(numbers)
+
+    def worker(account_number):
+        for _ in range(per_thread):
+            backend.make_transaction(account_number, "deposit", 5)
+
+    balance, rows = history(numbers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(numbers)) as executor:
+        list(executor.map(worker, numbers))
+    elapsed = time.perf_counter() - start
+    posted = per_thread * len(numbers)
+    new_balance, new_rows = history(numbers)
+    if new_balance - balance != posted * 5 or new_rows - rows != posted:
+        sys.exit(f"FAIL: {new_rows - rows} rows and {new_balance - balance} deposited for {posted} deposits")
+    return posted / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--deposits", type=int, default=1600, help="deposits per run, over all threads")
+    parser.add_argument("--rounds", type=int, default=3, help="runs of each mode, alternating")
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="sqlite",
+                        help="config: the database from config.py, sqlite: a fresh SQLite file")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        folder = tempfile.mkdtemp()
+        use_storage(SQLiteStorage(os.path.join(folder, "bench.db")))
+    import backend
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.create_tables()
+        numbers = register(backend, args.threads)
+
+    rates = {False: [], True: []}
+    for _ in range(args.rounds):
+        for group_commit in (False, True):
+            config.GROUP_COMMIT = group_commit
+            rates[group_commit].append(run(backend, numbers, args.deposits))
+    for group_commit, label in ((False, "off"), (True, "on ")):
+        print(f"group commit {label}: {max(rates[group_commit]):,.0f} deposits per second "
+              f"(best of {args.rounds}, {args.threads} threads)")
+    print(get_group_commit().stats())
+
+
+if __name__ == "__main__":
+    main()
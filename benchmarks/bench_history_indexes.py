@@ -0,0 +1,122 @@
+# benchmark: transaction history latency with and without the indexes from create_tables
+# seeds the transaction table (10M rows by default), then for each setup prints the EXPLAIN plan
+# and the latency of the history queries for a sample of accounts
+#
+# use a throwaway database, the script drops and recreates the history indexes:
+#   ATM_DB_NAME=atm_bench python benchmarks/bench_history_indexes.py --rows 10000000 --accounts 2000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_tables  # noqa: E402
+from storage import TRANSACTION_INDEXES  # noqa: E402
+from db_pool import connection  # noqa: E402
+
+QUERIES = {
+    # what the View Transactions page runs
+    "latest": """
+        select type, amount, timestamp from transaction
+        where account_number = %s order by timestamp desc limit 10
+    """,
+    # filtered by type and amount range
+    "filtered": """
+        select type, amount, timestamp from transaction
+        where account_number = %s and type = 'withdrawal' and amount between 20 and 200
+        order by amount desc limit 10
+    """,
+}
+
+
+# make sure there are `accounts` accounts and `rows` transactions spread over them
+def seed(cursor, conn, rows, accounts, batch=50_000):
+    cursor.execute("select count(*) from account")
+    missing = accounts - cursor.fetchone()[0]
+    if missing > 0:
+        cursor.execute("insert into customer (first_name, last_name) values ('Bench', 'Mark')")
+        customer_id = cursor.lastrowid
+        cursor.executemany("insert into account (customer_id, pin) values (%s, '1234')", [(customer_id,)] * missing)
+        conn.commit()
+    cursor.execute("select account_number from account order by account_number limit %s", (accounts,))
+    numbers = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute("select count(*) from transaction")
+    todo = rows - cursor.fetchone()[0]
+    start = time.perf_counter()
+    while todo > 0:
+        n = min(batch, todo)
+        cursor.executemany("""
+            insert into transaction (account_number, type, amount, timestamp)
+            values (%s, %s, %s, now() - interval %s minute)
+        """, [(random.choice(numbers), random.choice(("deposit", "withdrawal")),
+               round(random.uniform(1, 1000), 2), random.randint(0, 5 * 365 * 24 * 60)) for _ in range(n)])
+        conn.commit()
+        todo -= n
+        print(f"\rseeding... {rows - todo:,} rows", end="", flush=True)
+    if rows:
+        print(f"\rseeded in {time.perf_counter() - start:.0f}s" + " " * 20)
+    return numbers
+
+
+def drop_indexes(cursor):
+    # the foreign key needs some index on account_number; put back the single-column one
+    # MySQL creates for a plain foreign key, so the "before" setup matches the old schema
+    cursor.execute("""
+        select count(*) from information_schema.statistics
+        where table_schema = database() and table_name = 'transaction' and index_name = 'account_number'
+    """)
+    if not cursor.fetchone()[0]:
+        cursor.execute("create index account_number on transaction (account_number)")
+    for name in TRANSACTION_INDEXES:
+        try:
+            cursor.execute(f"drop index {name} on transaction")
+        except Exception:
+            pass  # not there
+
+
+def measure(cursor, numbers, samples):
+    for label, sql in QUERIES.items():
+        cursor.execute("explain " + sql, (numbers[0],))
+        columns = [c[0] for c in cursor.description]
+        plan = dict(zip(columns, cursor.fetchone()))
+        timings = []
+        for account_number in random.sample(numbers, min(samples, len(numbers))):
+            start = time.perf_counter()
+            cursor.execute(sql, (account_number,))
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"  {label:<9} key={plan.get('key')} rows={plan.get('rows')} extra={plan.get('Extra')}")
+        print(f"  {'':<9} p50={statistics.median(timings):.2f}ms p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=200, help="accounts queried per setup")
+    args = parser.parse_args()
+
+    create_tables()
+    with connection() as conn:
+        cursor = conn.cursor()
+        numbers = seed(cursor, conn, args.rows, args.accounts)
+
+        print("before (primary key + foreign key index only):")
+        drop_indexes(cursor)
+        measure(cursor, numbers, args.samples)
+
+        print("after (create_tables indexes):")
+        start = time.perf_counter()
+    create_tables()  # puts the indexes back, exactly like on app start
+    print(f"  indexes built in {time.perf_counter() - start:.1f}s")
+    with connection() as conn:
+        measure(conn.cursor(), numbers, args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmark: queries per second as the number of concurrent ATM sessions grows
+# compares the old model (one shared connection, every session waits its turn)
+# with the connection pool from db_pool.py
+#
+# run from the project folder against a real database (settings come from config.py):
+#   python benchmarks/bench_pool.py --sessions 1 2 4 8 16 --queries 200 --delay 0.005
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from storage import MySQLStorage  # noqa: E402
+
+# sleep() stands in for a slow query / network round trip, so the effect of waiting is visible
+QUERY = "select sleep(%s)"
+
+
+# one session runs `queries` statements
+def run_session(get_cursor, release, queries, delay):
+    for _ in range(queries):
+        cursor = get_cursor()
+        try:
+            cursor.execute(QUERY, (delay,))
+            cursor.fetchall()
+        finally:
+            release(cursor)
+
+
+# every session shares one connection, guarded by a lock (what the app did before the pool)
+def bench_shared(sessions, queries, delay):
+    conn = MySQLStorage().connect()
+    lock = threading.Lock()
+
+    def get_cursor():
+        lock.acquire()
+        return conn.cursor()
+
+    def release(cursor):
+        lock.release()
+
+    try:
+        return _timed(sessions, lambda: run_session(get_cursor, release, queries, delay), queries)
+    finally:
+        conn.close()
+
+
+# every session borrows its own connection from the pool
+def bench_pool(sessions, queries, delay):
+    storage = MySQLStorage()
+    pool = ConnectionPool(connect=storage.connect, ping=storage.ping, size=sessions)
+    borrowed = {}
+
+    def get_cursor():
+        conn = pool.checkout()
+        cursor = conn.cursor()
+        borrowed[id(cursor)] = conn
+        return cursor
+
+    def release(cursor):
+        pool.checkin(borrowed.pop(id(cursor)))
+
+    try:
+        return _timed(sessions, lambda: run_session(get_cursor, release, queries, delay), queries)
+    finally:
+        pool.close()
+
+
+def _timed(sessions, work, queries):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        for future in [executor.submit(work) for _ in range(sessions)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return sessions * queries / elapsed  # queries per second
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--queries", type=int, default=100, help="queries per session")
+    parser.add_argument("--delay", type=float, default=0.005, help="seconds each query spends on the server")
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8} {'shared q/s':>12} {'pooled q/s':>12} {'speedup':>8}")
+    for sessions in args.sessions:
+        shared = bench_shared(sessions, args.queries, args.delay)
+        pooled = bench_pool(sessions, args.queries, args.delay)
+        print(f"{sessions:>8} {shared:>12.1f} {pooled:>12.1f} {pooled / shared:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
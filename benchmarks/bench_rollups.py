@@ -0,0 +1,117 @@
+# benchmark: operations dashboard questions answered from the rollups vs from the transaction table
+# seeds `rows` transactions over the last year (in-memory SQLite by default), builds the rollups once
+# and times each dashboard question both ways:
+#   raw    - a grouped query over `transaction` joined with customer (what a dashboard without
+#            rollups would run on every page view)
+#   rollup - rollups.py (small rollup tables + pandas)
+# plus the cost of an incremental refresh after a batch of new transactions
+#
+#   python benchmarks/bench_rollups.py --rows 200000
+#   ATM_DB_NAME=atm_bench python benchmarks/bench_rollups.py --backend config
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import connection, use_storage  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+PROVINCES = ["Ontario", "Quebec", "Alberta", "British Columbia", "Manitoba", "Nova Scotia"]
+
+RAW = {
+    "cash flow per day": """
+        select date(t.timestamp), t.type, count(*), sum(t.amount) from `transaction` t
+        where t.timestamp >= %s group by date(t.timestamp), t.type
+    """,
+    "totals per province": """
+        select c.province, t.type, count(*), sum(t.amount) from `transaction` t
+        join account a on a.account_number = t.account_number
+        join customer c on c.customer_id = a.customer_id
+        where t.timestamp >= %s group by c.province, t.type
+    """,
+}
+
+
+def seed(rows, accounts, spread_days=365, batch=50_000):
+    with connection() as conn:
+        cursor = conn.cursor()
+        for i in range(accounts):
+            cursor.execute("insert into customer (first_name, last_name, province) values ('Bench', 'Mark', %s)",
+                           (PROVINCES[i % len(PROVINCES)],))
+            cursor.execute("insert into account (customer_id, pin, balance) values (%s, '1234', 100)", (cursor.lastrowid,))
+        cursor.execute("select account_number from account")
+        numbers = [row[0] for row in cursor.fetchall()]
+        now = datetime.now() - timedelta(minutes=5) # settled
+        for start in range(0, rows, batch):
+            cursor.executemany(
+                "insert into `transaction` (account_number, type, amount, timestamp) values (%s, %s, %s, %s)",
+                [(random.choice(numbers), random.choice(["deposit", "withdrawal"]), round(random.uniform(1, 500), 2),
+                  (now - timedelta(seconds=random.randint(0, spread_days * 86400))).strftime("%Y-%m-%d %H:%M:%S"))
+                 for _ in range(min(batch, rows - start))])
+        conn.commit()
+    return numbers
+
+
+def timed(func, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--accounts", type=int, default=2_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="sqlite")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        use_storage(SQLiteStorage(":memory:"))
+    import backend
+    import rollups
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend.create_tables()
+    numbers = seed(args.rows, args.accounts)
+    start = time.perf_counter()
+    counted = rollups.refresh()
+    print(f"initial refresh: {counted} rows in {time.perf_counter() - start:.2f}s")
+
+    since = date.today() - timedelta(days=90)
+
+    def raw(sql):
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, (since,))
+            cursor.fetchall()
+
+    print(f"{'question':<22} {'raw':>10} {'rollup':>10}")
+    for (label, sql), rollup in zip(RAW.items(), [lambda: rollups.cash_flow(since, date.today()),
+                                                  lambda: rollups.totals(since, date.today(), by="province")]):
+        print(f"{label:<22} {timed(lambda: raw(sql), args.runs):>7.1f} ms {timed(rollup, args.runs):>7.1f} ms")
+
+    # new transactions since the last refresh: only they are read
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("insert into `transaction` (account_number, type, amount, timestamp) values (%s, %s, %s, %s)",
+                           [(random.choice(numbers), "deposit", 10, (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S"))
+                            for _ in range(1000)])
+        conn.commit()
+    start = time.perf_counter()
+    counted = rollups.refresh()
+    print(f"incremental refresh: {counted} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
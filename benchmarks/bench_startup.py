@@ -0,0 +1,70 @@
+# startup benchmark: what a new Streamlit session / a fresh server process pays before the login page
+#   import       - "import backend" in a fresh interpreter (pandas is only loaded by the pages that use it)
+#   import+pd    - the same with pandas imported up front, like backend.py used to do
+#   schema check - one create_tables() call: what EVERY new session paid while it was gated by
+#                  st.session_state, now paid once per server process (st.cache_resource)
+#
+#   python benchmarks/bench_startup.py --runs 5
+#   python benchmarks/bench_startup.py --backend sqlite
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT = """
+import sys, time
+start = time.perf_counter()
+{prelude}
+import backend
+print(time.perf_counter() - start, "pandas" in sys.modules)
+"""
+
+
+# median import time (seconds) in fresh interpreters, and whether pandas ended up loaded
+def cold_import(runs, prelude=""):
+    times = []
+    loaded = False
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT.format(prelude=prelude)], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[1] == "True"
+    return statistics.median(times), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sessions", type=int, default=100, help="create_tables() calls to time")
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="config",
+                        help="database for the schema check: config.py settings or in-memory SQLite")
+    args = parser.parse_args()
+
+    for label, prelude in [("import", ""), ("import+pd", "import pandas")]:
+        seconds, pandas_loaded = cold_import(args.runs, prelude)
+        print(f"{label:<13} {seconds * 1000:>9.1f} ms  (pandas loaded: {pandas_loaded})")
+
+    from db_pool import use_storage
+    from storage import SQLiteStorage
+    if args.backend == "sqlite":
+        use_storage(SQLiteStorage())
+    import backend
+
+    with contextlib.redirect_stdout(io.StringIO()): # create_tables prints a line every call
+        backend.create_tables() # first call creates the tables and opens the pool
+        start = time.perf_counter()
+        for _ in range(args.sessions):
+            backend.create_tables()
+    per_session = (time.perf_counter() - start) / args.sessions
+    print(f"{'schema check':<13} {per_session * 1000:>9.2f} ms per session before, once per process now")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# micro-benchmark: customer records validated per second
+#   old      - the per-call regex.fullmatch(pattern_string, ...) style register_customer used to have
+#   single   - validation.validate_customer, one record at a time (precompiled patterns, set lookup)
+#   batch    - validation.validate_batch over a whole DataFrame
+#
+#   python benchmarks/bench_validation.py --records 100000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+import regex
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import PROVINCE_LIST, validate_batch, validate_customer  # noqa: E402
+
+
+def make_records(n):
+    records = []
+    for i in range(n):
+        records.append({
+            "first_name": random.choice(["Shadi", "Jean-Luc", "Zoë", "Ali3"]),  # some invalid
+            "last_name": random.choice(["Kheiri", "Tremblay", "O'Neil"]),
+            "dob": random.choice(["1990-05-01", "1985-12-31", "2999-01-01", "31/12/1990"]),
+            "app": random.choice(["", "12", "12A", "x"]),
+            "building": random.choice(["12", "12 B", "B12"]),
+            "street": "Saint Catherine",
+            "city": random.choice(["Montreal", "Trois-Rivières", "City 17"]),
+            "province": random.choice(PROVINCE_LIST + ("Texas",)),
+            "postal_code": random.choice(["H2Z 1A1", "h2z1a1"]),
+            "phone": random.choice(["", "5145551234", "555"]),
+            "email": random.choice(["", "shadi@example.com", "bad@"]),
+            "pin": random.choice(["1234", "12a4"]),
+        })
+    return records
+
+
+# the validation code register_customer had before validation.py, kept here for comparison
+def old_validate(r):
+    errors = []
+    name_pattern = r"^[\p{L}]+([ -][\p{L}]+)*$"
+    if not regex.fullmatch(name_pattern, r["first_name"]):
+        errors.append("Invalid first name.")
+    if not regex.fullmatch(name_pattern, r["last_name"]):
+        errors.append("Invalid last name.")
+    try:
+        dob_date = datetime.strptime(r["dob"], "%Y-%m-%d")
+        if not (datetime(1900, 1, 1) <= dob_date <= datetime.now()):
+            errors.append("Date of birth must be between 1900 and today.")
+    except ValueError:
+        errors.append("Invalid date of birth format (expected YYYY-MM-DD).")
+    if r["app"] and not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", r["app"]):
+        errors.append("Invalid apartment number format.")
+    if not regex.fullmatch(r"^(\d+)(?:\s*([A-Za-z]))?$", r["building"]):
+        errors.append("Invalid building number format.")
+    if not regex.fullmatch(r"^[\p{L}\d\s.\-]+$", r["street"]):
+        errors.append("Invalid street name.")
+    if not regex.fullmatch(r"^[\p{L}\s\-]+$", r["city"]):
+        errors.append("Invalid city name.")
+    valid_provinces = [
+        "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
+        "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan"
+    ]
+    if r["province"] not in valid_provinces:
+        errors.append("Invalid province.")
+    if not regex.fullmatch(r"^[A-Z]\d[A-Z] \d[A-Z]\d$", r["postal_code"]):
+        errors.append("Invalid postal code format (e.g., H2Z 1A1).")
+    if r["phone"] and (not r["phone"].isdigit() or len(r["phone"]) != 10):
+        errors.append("Phone number must be 10 digits.")
+    if r["email"] and (not regex.match(r"^[^@]+@[^@]+\.[^@]{2,}$", r["email"]) or len(r["email"]) < 6):
+        errors.append("Invalid email address.")
+    if not r["pin"].isdigit() or len(r["pin"]) != 4:
+        errors.append("PIN must be exactly 4 digits.")
+    return errors
+
+
+def rate(label, n, work):
+    start = time.perf_counter()
+    work()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} {n / elapsed:>12,.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    df = pd.DataFrame(records)
+
+    rate("old", args.records, lambda: [old_validate(r) for r in records])
+    rate("single", args.records, lambda: [validate_customer(r) for r in records])
+    rate("batch", args.records, lambda: validate_batch(df))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# load generator: N concurrent ATM sessions calling the backend.py functions
+# every session picks operations at random according to --mix and the script reports, as JSON,
+# the throughput and the p50/p95/p99 latency of every operation (compare runs between releases)
+#
+# point it at a local throwaway database, it creates tables and synthetic customers:
+#   ATM_DB_NAME=atm_bench python benchmarks/load_test.py --sessions 16 --duration 30 \
+#       --mix login=20,balance=40,transaction=20,history=15,update=5 --output results.json
+# or run it fully in-process on the in-memory SQLite backend (no server needed):
+#   python benchmarks/load_test.py --backend sqlite
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+from db_pool import connection, use_storage  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+PIN = "1234"
+
+# operation name -> function(account_number, rng)
+OPERATIONS = {
+    "login": lambda acc, rng: backend.login_customer(acc, PIN),
+    "balance": lambda acc, rng: backend.check_balance(acc),
+    "transaction": lambda acc, rng: _transaction(acc, rng),
+    "history": lambda acc, rng: backend.view_transactions(acc),
+    "update": lambda acc, rng: backend.update_customer_info(acc, email=f"load{rng.randint(1, 10**6)}@example.com"),
+}
+
+
+def _transaction(account_number, rng):
+    kind = rng.choice(("deposit", "withdrawal"))
+    try:
+        backend.make_transaction(account_number, kind, round(rng.uniform(1, 100), 2))
+    except ValueError: # insufficient funds is a normal answer, not a failure
+        pass
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r}, choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# make sure `count` synthetic accounts exist, returns their numbers
+def seed(count):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select a.account_number from account a join customer c on c.customer_id = a.customer_id
+            where c.first_name = 'Load' order by a.account_number
+        """)
+        numbers = [row[0] for row in cursor.fetchall()]
+        missing = count - len(numbers)
+        if missing > 0:
+            cursor.executemany("""
+                insert into customer (first_name, last_name, dob, building, street, city, province, postal_code)
+                values (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, [("Load", "Test", "1990-01-01", "1", "Main", "Montreal", "Quebec", "H2Z 1A1")] * missing)
+            cursor.execute("""
+                insert into account (customer_id, pin, balance)
+                select c.customer_id, %s, 1000.00 from customer c
+                left join account a on a.customer_id = c.customer_id
+                where c.first_name = 'Load' and a.account_number is null
+            """, (PIN,))
+            conn.commit()
+            return seed(count)
+    return numbers[:count]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(sessions, duration, mix, accounts, seed_value):
+    latencies = defaultdict(list) # operation -> seconds
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    deadline = time.perf_counter() + duration
+
+    def session(number):
+        rng = random.Random(seed_value + number)
+        local = defaultdict(list)
+        local_errors = defaultdict(int)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            account_number = rng.choice(accounts)
+            start = time.perf_counter()
+            try:
+                OPERATIONS[name](account_number, rng)
+            except Exception:
+                local_errors[name] += 1
+            local[name].append(time.perf_counter() - start)
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+            for name, n in local_errors.items():
+                errors[name] += n
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(session, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    report = {"sessions": sessions, "duration_s": round(elapsed, 3), "mix": mix, "operations": {}}
+    total = 0
+    for name in names:
+        values = sorted(latencies[name])
+        total += len(values)
+        report["operations"][name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "throughput_per_s": round(len(values) / elapsed, 2),
+            "p50_ms": _ms(percentile(values, 50)),
+            "p95_ms": _ms(percentile(values, 95)),
+            "p99_ms": _ms(percentile(values, 99)),
+        }
+    report["throughput_per_s"] = round(total / elapsed, 2)
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent ATM sessions")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run")
+    parser.add_argument("--mix", default="login=20,balance=40,transaction=20,history=15,update=5")
+    parser.add_argument("--accounts", type=int, default=1000, help="synthetic accounts to seed")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, same seed = same operation sequence")
+    parser.add_argument("--output", help="write the JSON report to this file as well")
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="config",
+                        help="config: the database from config.py, sqlite: a fresh in-memory database")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        use_storage(SQLiteStorage(":memory:"))
+
+    backend.create_tables()
+    accounts = seed(args.accounts)
+    report = run(args.sessions, args.duration, parse_mix(args.mix), accounts, args.seed)
+    report["backend"] = args.backend
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# concurrency stress test for make_transaction
+# many threads withdraw from the SAME account at the same time; afterwards the script checks that
+#   - the balance never went negative
+#   - balance == starting balance - (successful withdrawals * amount)
+#   - there is exactly one transaction row per successful withdrawal
+# and reports transactions per second
+#
+# run from the project folder against a test database (settings come from config.py):
+#   ATM_DB_NAME=atm_test python benchmarks/stress_transactions.py --threads 16 --attempts 200
+# or in-process on the in-memory SQLite backend:
+#   python benchmarks/stress_transactions.py --backend sqlite
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_tables, make_transaction, register_customer  # noqa: E402
+from db_pool import connection, use_storage  # noqa: E402
+from limits import withdrawal_limits  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+def new_account(balance):
+    account_number = register_customer("Stress", "Test", "1990-01-01", "", "1", "Main", "Montreal",
+                                       "Quebec", "H2Z 1A1", "", "", "1234")
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("update account set balance = %s where account_number = %s", (balance, account_number))
+        conn.commit()
+    # this test is about overdrafts: the rolling withdrawal limits (limits.py) must not refuse first
+    withdrawal_limits.set_account_limits(account_number, daily_amount=balance, weekly_amount=balance,
+                                         daily_count=10**9)
+    return account_number
+
+
+# each worker keeps withdrawing until it runs out of attempts
+def worker(account_number, attempts, amount):
+    ok = refused = 0
+    for _ in range(attempts):
+        try:
+            make_transaction(account_number, "withdrawal", amount)
+            ok += 1
+        except ValueError:  # Insufficient funds.
+            refused += 1
+    return ok, refused
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=200, help="withdrawals tried by each thread")
+    parser.add_argument("--amount", type=Decimal, default=Decimal("1.00"))
+    parser.add_argument("--balance", type=Decimal, default=Decimal("1000.00"),
+                        help="starting balance, keep it below threads*attempts*amount to force contention")
+    parser.add_argument("--backend", choices=["config", "sqlite"], default="config",
+                        help="config: the database from config.py, sqlite: a fresh in-memory database")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        use_storage(SQLiteStorage(":memory:"))
+
+    create_tables()
+    account_number = new_account(args.balance)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        futures = [executor.submit(worker, account_number, args.attempts, args.amount) for _ in range(args.threads)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    ok = sum(r[0] for r in results)
+    refused = sum(r[1] for r in results)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select balance from account where account_number = %s", (account_number,))
+        balance = cursor.fetchone()[0]
+        cursor.execute("select count(*) from `transaction` where account_number = %s", (account_number,))
+        rows = cursor.fetchone()[0]
+
+    print(f"account {account_number}: {ok} withdrawals accepted, {refused} refused in {elapsed:.2f}s")
+    print(f"throughput: {(ok + refused) / elapsed:.1f} attempts/s, {ok / elapsed:.1f} committed tx/s")
+    print(f"final balance: {balance}")
+
+    expected = args.balance - ok * args.amount
+    failures = []
+    if balance < 0:
+        failures.append("balance went negative")
+    if balance != expected:
+        failures.append(f"balance is {balance}, expected {expected}")
+    if rows != ok:
+        failures.append(f"{rows} transaction rows for {ok} accepted withdrawals")
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+    print("OK: no overdraft, balance and history agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# settings for the ATM app
+# every value can be overridden with an environment variable, so the same code runs on any machine
+# without editing the source (ex: ATM_DB_PASSWORD=secret streamlit run bank_streamlit.py)
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _float(name, default):
+    return float(os.environ.get(name, default))
+
+
+# database engine: "mysql" (production) or "sqlite" (in-process, see storage.py)
+DB_BACKEND = os.environ.get("ATM_DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.environ.get("ATM_SQLITE_PATH", ":memory:")  # a file path keeps the SQLite data between runs
+
+# database connection
+DB_HOST = os.environ.get("ATM_DB_HOST", "localhost")
+DB_PORT = _int("ATM_DB_PORT", 3306)
+DB_USER = os.environ.get("ATM_DB_USER", "root")
+DB_PASSWORD = os.environ.get("ATM_DB_PASSWORD", "")
+DB_NAME = os.environ.get("ATM_DB_NAME", "atm")
+
+# connection pool
+POOL_SIZE = _int("ATM_POOL_SIZE", 8)  # max number of connections open at the same time
+POOL_TIMEOUT = _float("ATM_POOL_TIMEOUT", 10)  # seconds to wait for a free connection before giving up
+POOL_PING_AFTER = _float("ATM_POOL_PING_AFTER", 30)  # idle seconds after which a connection is health-checked
+
+# bulk posting (make_transactions_bulk)
+BULK_CHUNK_SIZE = _int("ATM_BULK_CHUNK_SIZE", 1000)  # rows per database transaction / commit
+
+# transaction history export
+EXPORT_CHUNK_SIZE = _int("ATM_EXPORT_CHUNK_SIZE", 5000)  # rows fetched from the database per chunk
+
+# customers.csv export (csv_export.py)
+CSV_COMPACT_ROWS = _int("ATM_CSV_COMPACT_ROWS", 100)  # changed customers that trigger a rewrite of their lines
+CSV_COMPACT_SECONDS = _float("ATM_CSV_COMPACT_SECONDS", 300)  # or age of the oldest change that does
+CSV_GAP_SECONDS = _float("ATM_CSV_GAP_SECONDS", 600)  # how long a skipped account number is looked for again
+
+# bulk customer onboarding (onboarding.py)
+ONBOARDING_CHUNK_SIZE = _int("ATM_ONBOARDING_CHUNK_SIZE", 5000)  # CSV rows per database transaction
+
+# balance cache (balance_cache.py)
+BALANCE_CACHE_SIZE = _int("ATM_BALANCE_CACHE_SIZE", 10_000)  # max accounts kept in memory
+BALANCE_CACHE_TTL = _float("ATM_BALANCE_CACHE_TTL", 30)  # seconds before a cached balance is read again
+
+# per-session cache of the logged-in account (session_cache.py)
+SESSION_CACHE_TTL = _float("ATM_SESSION_CACHE_TTL", 60)  # seconds before a session reads its account again
+
+# async backend (async_backend.py)
+ASYNC_WORKERS = _int("ATM_ASYNC_WORKERS", POOL_SIZE)  # threads running database calls for the event loop
+
+# monthly statements (statements.py)
+STATEMENT_WORKERS = _int("ATM_STATEMENT_WORKERS", os.cpu_count() or 1)  # processes generating statements
+STATEMENT_RANGE_SIZE = _int("ATM_STATEMENT_RANGE_SIZE", 1000)  # consecutive account numbers per work unit
+
+# query instrumentation (instrumentation.py)
+INSTRUMENT = os.environ.get("ATM_INSTRUMENT", "1") != "0"  # time every SQL statement, ATM_INSTRUMENT=0 turns it off
+INSTRUMENT_SAMPLES = _int("ATM_INSTRUMENT_SAMPLES", 1000)  # recent latencies kept per backend function
+SLOW_QUERY_MS = _float("ATM_SLOW_QUERY_MS", 200)  # statements at least this slow go to the slow query log
+SLOW_QUERY_LOG = os.environ.get(
+    "ATM_SLOW_QUERY_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow_queries.log"))  # empty: no log file
+ADMIN_PASSWORD = os.environ.get("ATM_ADMIN_PASSWORD", "")  # the Admin page stays disabled while this is empty
+
+# group commit of make_transaction postings (group_commit.py)
+GROUP_COMMIT = os.environ.get("ATM_GROUP_COMMIT", "0") == "1"  # ATM_GROUP_COMMIT=1 turns it on
+GROUP_COMMIT_SIZE = _int("ATM_GROUP_COMMIT_SIZE", 100)  # most postings committed together
+
+# monthly partitions and cold archive of the transaction table (archive.py)
+PARTITION_TRANSACTIONS = os.environ.get("ATM_PARTITION_TRANSACTIONS", "0") == "1"  # MySQL: create `transaction` with one partition per month
+PARTITION_MONTHS_AHEAD = _int("ATM_PARTITION_MONTHS_AHEAD", 3)  # future months that always have their partition ready
+ARCHIVE_RETENTION_MONTHS = _int("ATM_ARCHIVE_RETENTION_MONTHS", 12)  # months kept in the table, older ones go to the archive
+ARCHIVE_DIR = os.environ.get(
+    "ATM_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))  # Parquet files of the archived months
+
+# rolling withdrawal limits (limits.py)
+LIMIT_TIER = os.environ.get("ATM_LIMIT_TIER", "standard")  # tier of accounts without their own row in account_limit
+DAILY_WITHDRAWAL_LIMIT = _float("ATM_DAILY_WITHDRAWAL_LIMIT", 1000)  # standard tier: most withdrawn in any 24 hours
+WEEKLY_WITHDRAWAL_LIMIT = _float("ATM_WEEKLY_WITHDRAWAL_LIMIT", 3000)  # standard tier: most withdrawn in any 7 days
+DAILY_WITHDRAWAL_COUNT = _int("ATM_DAILY_WITHDRAWAL_COUNT", 10)  # standard tier: most withdrawals in any 24 hours
+
+# cash-flow rollups (rollups.py)
+ROLLUP_SETTLE_SECONDS = _float("ATM_ROLLUP_SETTLE_SECONDS", 60)  # rows younger than this wait for the next refresh
+
+# anomaly scoring (anomaly.py)
+ANOMALY_SCORING = os.environ.get("ATM_ANOMALY_SCORING", "1") != "0"  # score every posting, ATM_ANOMALY_SCORING=0 turns it off
+ANOMALY_FLAG_SCORE = _float("ATM_ANOMALY_FLAG_SCORE", 4)  # postings scoring at least this are flagged for review
+ANOMALY_HOLD_SCORE = _float("ATM_ANOMALY_HOLD_SCORE", 0)  # postings scoring at least this are refused and flagged, 0: never
+ANOMALY_MIN_HISTORY = _int("ATM_ANOMALY_MIN_HISTORY", 10)  # transactions an account needs before amount and hour count
+ANOMALY_BURST_SECONDS = _float("ATM_ANOMALY_BURST_SECONDS", 60)  # window of the burst check
+ANOMALY_BURST_COUNT = _int("ATM_ANOMALY_BURST_COUNT", 5)  # transactions allowed in that window before it adds to the score
+ANOMALY_RARE_HOUR_SHARE = _float("ATM_ANOMALY_RARE_HOUR_SHARE", 0.02)  # hours with a smaller share of the account's history are unusual
+ANOMALY_PERSIST_SECONDS = _float("ATM_ANOMALY_PERSIST_SECONDS", 60)  # how often statistics and flags are written
+
+# login checks (auth.py)
+AUTH_CACHE_SIZE = _int("ATM_AUTH_CACHE_SIZE", 10_000)  # max accounts whose PIN verifier is kept in memory
+AUTH_CACHE_TTL = _float("ATM_AUTH_CACHE_TTL", 300)  # seconds before a cached verifier is read again
+LOGIN_MAX_FAILURES = _int("ATM_LOGIN_MAX_FAILURES", 5)  # wrong PINs in a row before the account is locked
+LOGIN_LOCKOUT_SECONDS = _float("ATM_LOGIN_LOCKOUT_SECONDS", 300)  # how long a locked account is refused
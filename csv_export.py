@@ -0,0 +1,272 @@
+# customers.csv exporter
+# instead of dumping every customer after every registration, the exporter remembers the highest
+# account number already written (the "high-water mark") and only appends accounts created after it
+# account numbers come from auto_increment when the insert runs, but registrations commit in any order,
+# so an export can see 105 before 104 has committed: numbers skipped below the mark are kept as "gaps"
+# and looked for again by every export until they show up (appended then, out of order) or are
+# ATM_CSV_GAP_SECONDS old (a rolled-back registration never commits its number)
+# customers changed by update_customer_info are remembered as "dirty"; rewriting their lines costs a pass
+# over the whole file, so they are batched: the rewrite (compaction) only runs once ATM_CSV_COMPACT_ROWS
+# customers are waiting or the oldest change is ATM_CSV_COMPACT_SECONDS old, in a background thread so
+# the caller never waits for it, and then re-reads only those customers' rows; until then their lines
+# show the old values
+# the full rebuild is still there, but runs on demand or in a background thread:
+#   python csv_export.py --rebuild
+#   python csv_export.py --compact    rewrite the changed customers now
+import csv
+import json
+import os
+import threading
+import time
+
+import config
+from db_pool import connection
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "customers.csv")
+
+COLUMNS = ["account_number", "customer_id", "first_name", "last_name", "DOB", "app", "building",
+           "street", "city", "province", "postal_code", "phone", "email"]
+
+SELECT = """
+    select a.account_number, c.customer_id, c.first_name, c.last_name, c.DOB, c.app, c.building,
+           c.street, c.city, c.province, c.postal_code, c.phone, c.email
+    from customer c
+    join account a on c.customer_id = a.customer_id
+"""
+
+GAP_WINDOW = 1000 # registrations still in flight hold numbers close to the newest one, older gaps aren't kept
+
+_file_lock = threading.Lock() # one writer of the CSV at a time per process (append, compaction, rebuild)
+_lock = threading.Lock() # the state file; held briefly (except by a full rebuild), so update_customer_info never waits for an export
+
+
+# state is kept next to the CSV:
+# {"last_account": 10057, "gaps": {"10055": 1760000000.0}, "dirty": {"12": 3, "40": 4}, "marks": 4,
+#  "dirty_since": 1760000000.0}
+# gaps: account number -> when it was first missed; dirty: customer_id -> number of its last change
+def _state_path(csv_path):
+    return csv_path + ".state.json"
+
+
+def _load_state(csv_path):
+    try:
+        with open(_state_path(csv_path)) as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if isinstance(state["dirty"], list): # written before changes were numbered
+        state["dirty"] = {str(customer_id): 0 for customer_id in state["dirty"]}
+    state.setdefault("gaps", {})
+    state.setdefault("marks", 0)
+    return state
+
+
+def _save_state(csv_path, state):
+    tmp = _state_path(csv_path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, _state_path(csv_path)) # atomic, a crash never leaves half a state file
+
+
+# remember that a customer's info changed (called by update_customer_info)
+def mark_customer_changed(customer_id, csv_path=None):
+    csv_path = csv_path or CSV_PATH
+    with _lock:
+        state = _load_state(csv_path)
+        if state is None:
+            return # no incremental export yet, the next full rebuild picks the change up
+        if not state["dirty"]:
+            state["dirty_since"] = time.time()
+        state["marks"] += 1
+        state["dirty"][str(customer_id)] = state["marks"] # a compaction already reading it writes it again next time
+        _save_state(csv_path, state)
+
+
+# append the new accounts (and the late ones of earlier gaps); starts a compaction in the background when
+# one is due, compact=True runs it now instead
+# returns number of rows written
+def export_incremental(csv_path=None, compact=False):
+    csv_path = csv_path or CSV_PATH
+    if not _file_lock.acquire(blocking=compact):
+        return 0 # a background compaction has the file, it appends the new accounts when it is done
+    try:
+        with _lock:
+            state = _load_state(csv_path)
+        if state is None or not os.path.exists(csv_path):
+            with _lock:
+                return _rebuild(csv_path) # first run (or the CSV was deleted): nothing to build on
+        written = _append_new(csv_path, state)
+        if compact:
+            written += _compact(csv_path)
+    finally:
+        _file_lock.release()
+    if not compact and _compaction_due(state):
+        compact_in_background(csv_path)
+    return written
+
+
+# rewrite the lines of the changed customers without making the caller wait
+# returns the thread, or None when another export or compaction is running (the next export tries again)
+def compact_in_background(csv_path=None):
+    csv_path = csv_path or CSV_PATH
+    if not _file_lock.acquire(blocking=False):
+        return None
+    # not a daemon: a process that exits meanwhile finishes the rewrite first
+    thread = threading.Thread(target=_compact_and_append, args=(csv_path,), name="customers-csv-compact")
+    thread.start()
+    return thread
+
+
+def _compact_and_append(csv_path): # runs with _file_lock held by compact_in_background
+    try:
+        _compact(csv_path)
+        with _lock:
+            state = _load_state(csv_path)
+        _append_new(csv_path, state) # registrations that came in while the file was being rewritten
+    except Exception as e: # the changes stay dirty, the next due export tries again
+        print("Error compacting CSV:", e)
+    finally:
+        _file_lock.release()
+
+
+def _compaction_due(state):
+    dirty = state["dirty"]
+    return bool(dirty) and (len(dirty) >= config.CSV_COMPACT_ROWS
+                            or time.time() - state.get("dirty_since", 0) >= config.CSV_COMPACT_SECONDS)
+
+
+# accounts past the high-water mark plus the gaps that committed since, appended to the CSV (_file_lock held)
+def _append_new(csv_path, state):
+    now = time.time()
+    last_account = state["last_account"]
+    gaps = {int(number): since for number, since in state["gaps"].items() if now - since < config.CSV_GAP_SECONDS}
+    with connection() as conn:
+        cursor = conn.cursor()
+        # only rows past the high-water mark, read through the account primary key
+        cursor.execute(SELECT + " where a.account_number > %s order by a.account_number", (last_account,))
+        new_rows = cursor.fetchall()
+        late_rows = []
+        if gaps: # one range read below the mark, the numbers already in the file are skipped here
+            cursor.execute(SELECT + " where a.account_number >= %s and a.account_number <= %s order by a.account_number",
+                           (min(gaps), last_account))
+            late_rows = [row for row in cursor.fetchall() if row[0] in gaps]
+
+    for row in late_rows:
+        del gaps[row[0]]
+    expected = last_account + 1 if last_account else None # numbering starts wherever auto_increment starts
+    for row in new_rows:
+        for number in range(max(expected or row[0], row[0] - GAP_WINDOW), row[0]): # skipped: not committed yet
+            gaps[number] = now
+        expected = row[0] + 1
+    if new_rows:
+        last_account = new_rows[-1][0]
+        gaps = {number: since for number, since in gaps.items() if number > last_account - GAP_WINDOW}
+
+    rows = late_rows + new_rows
+    if rows:
+        with open(csv_path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(rows)
+    if rows or {str(number) for number in gaps} != set(state["gaps"]):
+        with _lock:
+            current = _load_state(csv_path) # marks made meanwhile are kept
+            current["last_account"] = last_account
+            current["gaps"] = {str(number): since for number, since in gaps.items()}
+            _save_state(csv_path, current)
+    return len(rows)
+
+
+# re-read the dirty customers and rewrite their lines (_file_lock held), returns the number of lines rewritten
+def _compact(csv_path):
+    with _lock:
+        state = _load_state(csv_path)
+    dirty = state["dirty"]
+    if not dirty:
+        return 0
+    with connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(dirty))
+        cursor.execute(SELECT + f" where c.customer_id in ({placeholders})", [int(customer_id) for customer_id in dirty])
+        changed = {str(row[0]): row for row in cursor.fetchall()}
+    replaced = _replace_rows(csv_path, changed) if changed else 0
+
+    with _lock:
+        current = _load_state(csv_path)
+        for customer_id, mark in dirty.items():
+            if current["dirty"].get(customer_id) == mark: # not changed again while we were reading
+                del current["dirty"][customer_id]
+        if not current["dirty"]:
+            current.pop("dirty_since", None)
+        _save_state(csv_path, current)
+    return replaced
+
+
+# full dump of every customer, also resets the high-water mark
+def rebuild(csv_path=None):
+    csv_path = csv_path or CSV_PATH
+    with _file_lock, _lock:
+        return _rebuild(csv_path)
+
+
+# run the full rebuild without making the caller wait
+def rebuild_in_background(csv_path=None):
+    thread = threading.Thread(target=rebuild, args=(csv_path,), name="customers-csv-rebuild", daemon=True)
+    thread.start()
+    return thread
+
+
+# (_file_lock and _lock held)
+def _rebuild(csv_path):
+    tmp = csv_path + ".tmp"
+    last_account = 0
+    gaps = {}
+    now = time.time()
+    count = 0
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SELECT + " order by a.account_number")
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            while True:
+                rows = cursor.fetchmany(5000) # stream in chunks instead of one big DataFrame
+                if not rows:
+                    break
+                writer.writerows(rows)
+                count += len(rows)
+                for row in rows:
+                    for number in range(max(last_account + 1 if last_account else row[0], row[0] - GAP_WINDOW), row[0]):
+                        gaps[number] = now
+                    last_account = row[0]
+    os.replace(tmp, csv_path)
+    gaps = {str(number): since for number, since in gaps.items() if number > last_account - GAP_WINDOW}
+    _save_state(csv_path, {"last_account": last_account, "gaps": gaps, "dirty": {}, "marks": 0})
+    return count
+
+
+# rewrite only the lines of the changed accounts (file I/O, no full database join)
+def _replace_rows(csv_path, changed):
+    tmp = csv_path + ".tmp"
+    replaced = 0
+    with open(csv_path, newline="", encoding="utf-8") as src, open(tmp, "w", newline="", encoding="utf-8") as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        for line in reader:
+            row = changed.get(line[0]) if line else None
+            if row is not None:
+                writer.writerow(row)
+                replaced += 1
+            else:
+                writer.writerow(line)
+    os.replace(tmp, csv_path)
+    return replaced
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export customers.csv")
+    parser.add_argument("--rebuild", action="store_true", help="full dump instead of the incremental export")
+    parser.add_argument("--compact", action="store_true", help="rewrite the changed customers now")
+    args = parser.parse_args()
+    count = rebuild() if args.rebuild else export_incremental(compact=args.compact)
+    print(f"{count} rows written to {CSV_PATH}")
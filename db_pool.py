@@ -0,0 +1,270 @@
+# connection pool for the ATM app
+# instead of one shared connection for everybody, every backend call borrows its own
+# connection from the pool and gives it back when it's done, so one slow query
+# only blocks the user who ran it
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+import config
+from instrumentation import wrap_connection
+from storage import get_storage, set_storage
+
+log = logging.getLogger("atm.db_pool")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # connect/ping default to the configured storage backend (see storage.py)
+    def __init__(self, connect=None, ping=None, size=None, timeout=None, ping_after=None):
+        if connect is None or ping is None:
+            storage = get_storage()
+            connect = connect or storage.connect
+            ping = ping or storage.ping
+        self._connect = connect
+        self._ping = ping
+        self.size = size or config.POOL_SIZE
+        self.timeout = config.POOL_TIMEOUT if timeout is None else timeout
+        self.ping_after = config.POOL_PING_AFTER if ping_after is None else ping_after
+
+        self._idle = queue.LifoQueue()  # (connection, time it was returned); LIFO keeps the warmest ones busy
+        self._slots = threading.BoundedSemaphore(self.size)  # one slot per connection that may be checked out
+        self._lock = threading.Lock()
+
+        # counters, useful for benchmarks and debugging
+        self.opened = 0
+        self.reconnects = 0
+        self.checkouts = 0
+
+    # borrow a connection (waits up to `timeout` seconds when all of them are in use)
+    def checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No free database connection after {self.timeout} seconds.")
+        try:
+            conn = self._take_idle()
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            self._slots.release()  # don't lose the slot if connecting failed
+            raise
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    # give a connection back
+    # anything not committed is rolled back, so the next user never sees a half-done transaction
+    # or a stale read snapshot
+    def checkin(self, conn):
+        try:
+            try:
+                conn.rollback()
+            except Exception:
+                self._close(conn)  # broken connection, the next checkout opens a fresh one
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    # with pool.connection() as conn: ...
+    # the connection is wrapped so every statement is timed (see instrumentation.py)
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield wrap_connection(conn) if config.INSTRUMENT else conn
+        finally:
+            self.checkin(conn)
+
+    # close every idle connection (ex: when the app shuts down)
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def _take_idle(self):
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            # only ping connections that sat idle for a while, a busy connection is known to be alive
+            if time.monotonic() - returned_at < self.ping_after or self._healthy(conn):
+                return conn
+            self._close(conn)
+            with self._lock:
+                self.reconnects += 1
+
+    def _healthy(self, conn):
+        try:
+            return bool(self._ping(conn))
+        except Exception:
+            return False
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# the pool shared by the whole process, created on first use
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+# switch to another storage backend (ex: use_storage(SQLiteStorage()) in a benchmark)
+# connections of the old pool that are still checked out finish normally
+def use_storage(storage):
+    global _pool
+    with _pool_lock:
+        set_storage(storage)
+        old, _pool = _pool, None
+    if old is not None:
+        old.close()
+
+
+# with connection() as conn: ...
+# short form used by backend.py
+# inside a unit of work this is the unit's connection, and its commit() waits for the unit
+def connection():
+    unit = _unit.get()
+    if unit is not None:
+        return nullcontext(unit.shared)
+    return get_pool().connection()
+
+
+# unit of work: several backend operations in ONE database transaction with ONE commit
+#
+#   with unit_of_work():
+#       make_transaction(10001, "withdrawal", 50)
+#       make_transaction(10002, "deposit", 50)
+#
+# everything inside commits together when the block ends, or is rolled back if it raises
+# backend write functions open their own unit, which joins the caller's unit when there is one;
+# a nested unit is a savepoint, so a failing inner step only undoes its own statements
+# units belong to the current thread / context, so concurrent requests never share one
+_unit = ContextVar("atm_unit_of_work", default=None)
+
+
+class _Unit:
+    def __init__(self, conn):
+        self.conn = conn
+        self.shared = _UnitConnection(conn)
+        self.depth = 0
+        self.callbacks = [] # run after the commit, see after_commit
+        self.rollbacks = [] # run when the work is rolled back, see after_rollback
+
+
+# the unit's connection as handed out by connection(): commit is left to the unit
+class _UnitConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@contextmanager
+def unit_of_work():
+    unit = _unit.get()
+    if unit is not None:
+        yield from _savepoint(unit)
+        return
+
+    with get_pool().connection() as conn: # an exception skips the commit, checkin rolls back
+        unit = _Unit(conn)
+        token = _unit.set(unit)
+        try:
+            yield unit.shared
+            conn.commit() # the one commit of the whole unit
+        except BaseException:
+            _run(unit.rollbacks) # before checkin, so the rows are still locked
+            raise
+        finally:
+            _unit.reset(token)
+    _run(unit.callbacks)
+
+
+# every callback runs even if one before it fails, and a failure is logged, never raised: after the commit
+# the work is done, so the caller must not report it as failed (and a skipped cache invalidation or
+# limit release would do more harm than the one that failed)
+def _run(callbacks):
+    for callback, args in callbacks:
+        try:
+            callback(*args)
+        except Exception:
+            log.exception("unit of work callback %s failed", getattr(callback, "__qualname__", callback))
+
+
+def _savepoint(unit):
+    unit.depth += 1
+    name = f"unit_of_work_{unit.depth}"
+    cursor = unit.conn.cursor()
+    cursor.execute(f"savepoint {name}")
+    outer_callbacks, unit.callbacks = unit.callbacks, []
+    outer_rollbacks, unit.rollbacks = unit.rollbacks, []
+    try:
+        yield unit.shared
+    except BaseException:
+        cursor.execute(f"rollback to savepoint {name}")
+        _run(unit.rollbacks)
+        unit.callbacks, unit.rollbacks = outer_callbacks, outer_rollbacks # the undone step's callbacks never run
+        raise
+    else:
+        cursor.execute(f"release savepoint {name}")
+        unit.callbacks = outer_callbacks + unit.callbacks
+        unit.rollbacks = outer_rollbacks + unit.rollbacks
+    finally:
+        unit.depth -= 1
+
+
+# True inside a unit of work: what connection() reads there includes the unit's own uncommitted writes,
+# which may still be rolled back, so the caches (balance_cache, auth, session_cache) neither serve nor keep
+# values there
+def in_unit_of_work():
+    return _unit.get() is not None
+
+
+# run callback(*args) once the current unit of work has committed (right away outside a unit)
+# for side effects that must only happen to committed data: cache invalidation, CSV export marks
+def after_commit(callback, *args):
+    unit = _unit.get()
+    if unit is None:
+        _run([(callback, args)])
+    else:
+        unit.callbacks.append((callback, args))
+
+
+# run callback(*args) if the current unit of work is rolled back instead (nothing happens outside a unit)
+# it runs while the unit's row locks are still held
+def after_rollback(callback, *args):
+    unit = _unit.get()
+    if unit is not None:
+        unit.rollbacks.append((callback, args))
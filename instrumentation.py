@@ -0,0 +1,253 @@
+# query instrumentation: how long every SQL statement takes, and which backend function ran it
+# every pooled connection is wrapped (see db_pool.ConnectionPool.connection), so each
+# cursor.execute - including the ones pd.read_sql runs for us - is timed and its rows counted
+# the statements are tagged with the backend function that called them: backend.py functions are
+# decorated with @instrumented, which puts their name in a context variable for the duration of
+# the call (the outermost function wins, so _post_chunk is counted under make_transactions_bulk)
+#
+# for every function we keep the latencies of the last ATM_INSTRUMENT_SAMPLES statements
+# (rolling percentiles and a histogram), lifetime totals and row counts; statements slower than
+# ATM_SLOW_QUERY_MS are written to the slow query log (ATM_SLOW_QUERY_LOG) without their
+# parameters, which may contain PINs
+#
+# the numbers are shown on the Admin page of bank_streamlit.py
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import config
+
+# upper bounds of the histogram buckets, in milliseconds (the last bucket has no upper bound)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_current_function = ContextVar("atm_instrumented_function", default=None)
+
+slow_log = logging.getLogger("atm.slow_queries")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class FunctionStats:
+    def __init__(self, samples):
+        self.latencies = deque(maxlen=samples) # seconds, the most recent statements only
+        self.statements = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def add(self, seconds, error):
+        self.latencies.append(seconds)
+        self.statements += 1
+        self.errors += error
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+
+
+class QueryStats:
+    def __init__(self, samples=None, slow_ms=None, slow_kept=100):
+        self.samples = samples or config.INSTRUMENT_SAMPLES
+        self.slow_ms = config.SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self._functions = {} # function name -> FunctionStats
+        self._slow = deque(maxlen=slow_kept) # the most recent slow statements, for the admin page
+        self._lock = threading.Lock()
+
+    def _stats(self, function):
+        stats = self._functions.get(function)
+        if stats is None:
+            stats = self._functions[function] = FunctionStats(self.samples)
+        return stats
+
+    def record(self, function, sql, seconds, error=False):
+        with self._lock:
+            self._stats(function).add(seconds, error)
+        if seconds * 1000 >= self.slow_ms:
+            statement = _WHITESPACE.sub(" ", sql).strip()
+            with self._lock:
+                self._slow.append({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "function": function,
+                                   "ms": round(seconds * 1000, 1), "sql": statement})
+            slow_log.warning("%s %.1f ms: %s", function, seconds * 1000, statement)
+
+    def add_rows(self, function, rows):
+        with self._lock:
+            self._stats(function).rows += rows
+
+    # one row per function: statements, errors, rows, mean/p50/p95/p99/max in ms (percentiles of the recent samples)
+    def summary(self):
+        with self._lock:
+            items = [(name, stats, sorted(stats.latencies)) for name, stats in self._functions.items()]
+        rows = []
+        for name, stats, recent in sorted(items, key=lambda item: -item[1].total_time):
+            rows.append({
+                "function": name,
+                "statements": stats.statements,
+                "errors": stats.errors,
+                "rows": stats.rows,
+                "total_ms": round(stats.total_time * 1000, 1),
+                "mean_ms": round(stats.total_time * 1000 / stats.statements, 2) if stats.statements else 0.0,
+                "p50_ms": _percentile(recent, 50),
+                "p95_ms": _percentile(recent, 95),
+                "p99_ms": _percentile(recent, 99),
+                "max_ms": round(stats.max_time * 1000, 2),
+            })
+        return rows
+
+    # {bucket label: count} of the recent latencies of one function (or of all of them)
+    def histogram(self, function=None):
+        with self._lock:
+            if function is None:
+                latencies = [s for stats in self._functions.values() for s in stats.latencies]
+            else:
+                latencies = list(self._functions[function].latencies) if function in self._functions else []
+        labels = [f"<= {b} ms" for b in BUCKETS_MS] + [f"> {BUCKETS_MS[-1]} ms"]
+        counts = dict.fromkeys(labels, 0)
+        for seconds in latencies:
+            ms = seconds * 1000
+            label = next((f"<= {b} ms" for b in BUCKETS_MS if ms <= b), labels[-1])
+            counts[label] += 1
+        return counts
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self._slow)) # newest first
+
+    def reset(self):
+        with self._lock:
+            self._functions.clear()
+            self._slow.clear()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return round(sorted_values[index] * 1000, 2)
+
+
+# the statistics shared by the whole process
+query_stats = QueryStats()
+
+
+# decorator for backend functions: statements run inside the call are counted under its name
+# generator functions (stream_transactions_csv) are tagged while each chunk is produced
+def instrumented(func):
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator(*args, **kwargs):
+            chunks = func(*args, **kwargs)
+            try:
+                while True:
+                    with _tagged(func.__name__):
+                        try:
+                            chunk = next(chunks)
+                        except StopIteration:
+                            return
+                    yield chunk
+            finally:
+                with _tagged(func.__name__):
+                    chunks.close()
+        return generator
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _tagged(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def _tagged(name):
+    if _current_function.get() is not None: # called by another instrumented function
+        yield
+        return
+    token = _current_function.set(name)
+    try:
+        yield
+    finally:
+        _current_function.reset(token)
+
+
+def current_function():
+    return _current_function.get() or "other"
+
+
+# wrap a pooled connection so its cursors are timed
+def wrap_connection(conn):
+    return conn if isinstance(conn, _InstrumentedConnection) else _InstrumentedConnection(conn)
+
+
+class _InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name): # commit, rollback, ... go straight to the real connection
+        return getattr(self._conn, name)
+
+
+class _InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._function = None # set by every execute
+
+    def _timed(self, method, sql, params):
+        self._function = current_function()
+        start = time.perf_counter()
+        try:
+            result = method(sql, params) if params is not None else method(sql)
+        except Exception:
+            query_stats.record(self._function, sql, time.perf_counter() - start, error=True)
+            raise
+        query_stats.record(self._function, sql, time.perf_counter() - start)
+        return result
+
+    def execute(self, sql, params=None):
+        result = self._timed(self._cursor.execute, sql, params)
+        if not sql.lstrip().lower().startswith("select") and (self._cursor.rowcount or 0) > 0:
+            query_stats.add_rows(self._function, self._cursor.rowcount) # rows written
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        result = self._timed(self._cursor.executemany, sql, seq_of_params)
+        query_stats.add_rows(self._function, len(seq_of_params))
+        return result
+
+    # rows read are counted as they are fetched
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            query_stats.add_rows(self._function, 1)
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        query_stats.add_rows(self._function, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        query_stats.add_rows(self._function, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name): # rowcount, lastrowid, description, close, ...
+        return getattr(self._cursor, name)
+
+
+# slow queries go to their own file, configured on first import
+if config.SLOW_QUERY_LOG and not slow_log.handlers:
+    _handler = logging.FileHandler(config.SLOW_QUERY_LOG, encoding="utf-8", delay=True)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_log.addHandler(_handler)
+    slow_log.propagate = False
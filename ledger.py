@@ -0,0 +1,73 @@
+# transaction engine used by make_transaction
+# the balance check and the debit happen in ONE conditional update statement:
+#   update account set balance = balance - X where account_number = N and balance >= X
+# the database checks and changes the row atomically, so two withdrawals running at the
+# same time can never both spend the same money, and the happy path needs no select at all
+from decimal import Decimal
+
+import config
+import snapshots
+from anomaly import scorer
+from limits import withdrawal_limits
+
+MIN_AMOUNT = Decimal("0.01")
+DEPOSIT_LIMIT = 10_000
+TRANSACTION_TYPES = ("deposit", "withdrawal")
+
+
+# same rules make_transaction always had, raises ValueError with the message shown to the user
+def check_transaction(transaction_type, amount):
+    if Decimal(str(amount)) < MIN_AMOUNT: # str() first so a float 0.01 compares as exactly 0.01
+        raise ValueError("Minimum amount is $0.01.")
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ValueError("Invalid transaction type.")
+    if transaction_type == "deposit" and amount > DEPOSIT_LIMIT:
+        raise ValueError("Deposit limit is $10,000.")
+
+
+# apply one deposit/withdrawal and record it (the caller commits)
+# returns False if the account doesn't exist, raises ValueError("Insufficient funds.") if the
+# withdrawal would make the balance negative
+def post_transaction(cursor, account_number, transaction_type, amount):
+    check_transaction(transaction_type, amount)
+
+    if transaction_type == "withdrawal":
+        # rolling daily/weekly limits, checked and counted in memory (see limits.py), uncounted if the posting rolls back
+        try:
+            reservation = withdrawal_limits.reserve(account_number, amount)
+        except ValueError:
+            # over the limit: a missing account or missing money is still reported first, like before limits
+            cursor.execute("select balance from account where account_number = %s", (account_number,))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            if Decimal(str(row[0])) < Decimal(str(amount)):
+                raise ValueError("Insufficient funds.")
+            raise
+        # only matches the row when there is enough money, the row stays locked until commit
+        cursor.execute("""
+            update account set balance = balance - %s
+            where account_number = %s and balance >= %s
+        """, (amount, account_number, amount))
+    else:
+        cursor.execute("update account set balance = balance + %s where account_number = %s", (amount, account_number))
+
+    if cursor.rowcount == 0:
+        # nothing was updated: find out why (only runs on the failure path)
+        cursor.execute("select 1 from account where account_number = %s", (account_number,))
+        if not cursor.fetchone():
+            if transaction_type == "withdrawal":
+                withdrawal_limits.release(reservation)
+            return False
+        raise ValueError("Insufficient funds.")
+
+    if config.ANOMALY_SCORING:
+        scorer.check(account_number, transaction_type, amount) # in memory, raises ValueError if held (see anomaly.py)
+
+    # record transaction
+    cursor.execute("""
+        insert into `transaction` (account_number, type, amount)
+        values (%s, %s, %s)
+    """, (account_number, transaction_type, amount))
+    snapshots.record(cursor, [account_number]) # today's closing balance, same database transaction
+    return True
\ No newline at end of file
@@ -0,0 +1,255 @@
+# rolling withdrawal limits for make_transaction and make_transactions_bulk
+# every account has a tier (TIERS, ATM_LIMIT_TIER by default) with three limits, and the account_limit
+# table can give an account another tier or its own values:
+#   daily_amount  - most money withdrawn in any 24 hours
+#   weekly_amount - most money withdrawn in any 7 days
+#   daily_count   - most withdrawals in any 24 hours
+#
+# the amounts withdrawn are kept in memory as sliding windows of time buckets (SlidingWindow), so a
+# withdrawal is checked and counted in O(1) without summing the account's history; the windows are
+# filled from the last 7 days of `transaction` when the process starts (backend.create_tables)
+#
+# a withdrawal is counted BEFORE its balance update (check and count are one step under a lock, so
+# two withdrawals at the same time can't both use the last of the limit) and the count is undone if
+# the posting rolls back (db_pool.after_rollback) or is given up (release); a Reservation is released
+# at most once, however many of those happen, and from the buckets it was counted in
+# an account only keeps its windows while they hold something: a released withdrawal takes its bucket
+# away again (so withdrawals on accounts that don't exist leave nothing behind), and windows that
+# expired to nothing are dropped once an hour
+# counters are per process, like the login lockouts in auth.py
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import config
+from db_pool import after_commit, after_rollback, connection, unit_of_work
+from storage import get_storage
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+
+TIERS = {
+    "standard": {
+        "daily_amount": Decimal(str(config.DAILY_WITHDRAWAL_LIMIT)),
+        "weekly_amount": Decimal(str(config.WEEKLY_WITHDRAWAL_LIMIT)),
+        "daily_count": config.DAILY_WITHDRAWAL_COUNT,
+    },
+    "premium": {
+        "daily_amount": Decimal("5000.00"),
+        "weekly_amount": Decimal("15000.00"),
+        "daily_count": 30,
+    },
+}
+
+
+# total amount and count over the last `span` seconds, in `buckets` buckets of span/buckets seconds
+# adding and expiring are O(1) (amortized); the window remembers up to one bucket more than `span`,
+# never less, so a limit is never under-counted
+class SlidingWindow:
+    def __init__(self, span, buckets):
+        self.width = span / buckets
+        self.buckets = buckets
+        self._buckets = deque() # [bucket index, amount, count], oldest first
+        self.amount = Decimal("0.00")
+        self.count = 0
+
+    def _expire(self, now):
+        oldest = int(now // self.width) - self.buckets
+        while self._buckets and self._buckets[0][0] < oldest:
+            _, amount, count = self._buckets.popleft()
+            self.amount -= amount
+            self.count -= count
+
+    def totals(self, now):
+        self._expire(now)
+        return self.amount, self.count
+
+    # returns the bucket the add was counted in, for remove()
+    def add(self, at, amount, count=1):
+        index = int(at // self.width)
+        if self._buckets and self._buckets[-1][0] >= index: # same bucket (or a late add)
+            bucket = self._buckets[-1]
+        else:
+            bucket = [index, Decimal("0.00"), 0]
+            self._buckets.append(bucket)
+        bucket[1] += amount
+        bucket[2] += count
+        self.amount += amount
+        self.count += count
+        return bucket
+
+    # take back an add (a rolled back withdrawal) from the bucket add() returned, unless it already expired;
+    # a bucket left with nothing in it is dropped
+    def remove(self, bucket, amount, count=1):
+        for position, current in enumerate(reversed(self._buckets)): # recent buckets first, at most `buckets` + 1
+            if current is bucket:
+                bucket[1] -= amount
+                bucket[2] -= count
+                self.amount -= amount
+                self.count -= count
+                if bucket[2] == 0:
+                    del self._buckets[len(self._buckets) - 1 - position]
+                return
+
+    def __bool__(self):
+        return bool(self._buckets)
+
+
+# one counted withdrawal, returned by reserve() and given back to release()
+class Reservation:
+    __slots__ = ("account_number", "amount", "buckets", "released")
+
+    def __init__(self, account_number, amount, buckets):
+        self.account_number = account_number
+        self.amount = amount
+        self.buckets = buckets # the (24 hour, 7 day) buckets it was counted in
+        self.released = False
+
+
+class WithdrawalLimits:
+    def __init__(self, tiers=None, default_tier=None):
+        self.tiers = tiers or TIERS
+        self.default_tier = default_tier or config.LIMIT_TIER
+        self._windows = {} # account_number -> (24 hour window, 7 day window)
+        self._accounts = {} # account_number -> its account_limit row as a dict
+        self._lock = threading.Lock()
+        self._pruned = time.time()
+        self.refused = 0
+
+    # the limits that apply to an account: its tier, with the account's own values on top
+    def limits_for(self, account_number):
+        with self._lock:
+            override = self._accounts.get(int(account_number), {})
+        limits = dict(self.tiers[override.get("tier") or self.default_tier])
+        limits.update({k: v for k, v in override.items() if k != "tier" and v is not None})
+        return limits
+
+    # count a withdrawal, raises ValueError with the message shown to the user if it goes over a limit
+    # returns a Reservation for release(); inside a unit of work it is released automatically if the work
+    # rolls back
+    def reserve(self, account_number, amount):
+        account_number = int(account_number)
+        amount = Decimal(str(amount))
+        limits = self.limits_for(account_number)
+        now = time.time()
+        with self._lock:
+            daily, weekly = self._windows.get(account_number) or (None, None)
+            if daily is None:
+                daily, weekly = self._windows[account_number] = (SlidingWindow(DAY, 96), SlidingWindow(WEEK, 168))
+            day_amount, day_count = daily.totals(now)
+            week_amount, _ = weekly.totals(now)
+            error = None
+            if day_count + 1 > limits["daily_count"]:
+                error = f"Daily limit of {limits['daily_count']} withdrawals reached."
+            elif day_amount + amount > limits["daily_amount"]:
+                error = (f"Daily withdrawal limit is ${limits['daily_amount']:,.2f} "
+                         f"(${max(limits['daily_amount'] - day_amount, 0):,.2f} left).")
+            elif week_amount + amount > limits["weekly_amount"]:
+                error = (f"Weekly withdrawal limit is ${limits['weekly_amount']:,.2f} "
+                         f"(${max(limits['weekly_amount'] - week_amount, 0):,.2f} left).")
+            if error:
+                self.refused += 1
+                if not daily and not weekly:
+                    del self._windows[account_number]
+                raise ValueError(error)
+            buckets = (daily.add(now, amount), weekly.add(now, amount))
+            if now - self._pruned >= 3600:
+                self._prune(now)
+        reservation = Reservation(account_number, amount, buckets)
+        after_rollback(self.release, reservation)
+        return reservation
+
+    # undo reserve() (the withdrawal didn't happen), once
+    def release(self, reservation):
+        with self._lock:
+            if reservation.released:
+                return
+            reservation.released = True
+            windows = self._windows.get(reservation.account_number)
+            if windows is not None:
+                for window, bucket in zip(windows, reservation.buckets):
+                    window.remove(bucket, reservation.amount)
+                if not windows[0] and not windows[1]:
+                    del self._windows[reservation.account_number]
+
+    # drop the windows that expired to nothing (accounts without withdrawals for 7 days), _lock held
+    def _prune(self, now):
+        self._pruned = now
+        for account_number, (daily, weekly) in list(self._windows.items()):
+            daily.totals(now)
+            weekly.totals(now)
+            if not daily and not weekly:
+                del self._windows[account_number]
+
+    # withdrawn in the last 24 hours / 7 days: {"daily_amount", "weekly_amount", "daily_count"}
+    def usage(self, account_number):
+        now = time.time()
+        with self._lock:
+            windows = self._windows.get(int(account_number))
+            if windows is None:
+                return {"daily_amount": Decimal("0.00"), "weekly_amount": Decimal("0.00"), "daily_count": 0}
+            day_amount, day_count = windows[0].totals(now)
+            week_amount, _ = windows[1].totals(now)
+        return {"daily_amount": day_amount, "weekly_amount": week_amount, "daily_count": day_count}
+
+    # (re)build every counter from the database: the account_limit rows and the withdrawals of the last 7 days
+    def warm(self):
+        since = datetime.now() - timedelta(seconds=WEEK)
+        windows = {}
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("select account_number, tier, daily_amount, weekly_amount, daily_count from account_limit")
+            accounts = {row[0]: {"tier": row[1],
+                                 "daily_amount": None if row[2] is None else Decimal(str(row[2])),
+                                 "weekly_amount": None if row[3] is None else Decimal(str(row[3])),
+                                 "daily_count": row[4]}
+                        for row in cursor.fetchall()}
+            cursor = conn.cursor(buffered=False) # rows stay on the server until we fetch them
+            cursor.execute("""
+                select account_number, amount, timestamp from `transaction`
+                where type = 'withdrawal' and timestamp >= %s
+                order by timestamp
+            """, (since,))
+            while True:
+                rows = cursor.fetchmany(config.EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                for account, amount, timestamp in rows:
+                    if isinstance(timestamp, str): # SQLite
+                        timestamp = datetime.fromisoformat(timestamp)
+                    if account not in windows:
+                        windows[account] = (SlidingWindow(DAY, 96), SlidingWindow(WEEK, 168))
+                    at = timestamp.timestamp()
+                    amount = Decimal(str(amount))
+                    windows[account][0].add(at, amount)
+                    windows[account][1].add(at, amount)
+        with self._lock:
+            self._windows = windows
+            self._accounts = accounts
+
+    # give an account a tier and/or its own limits (None = the tier's value)
+    def set_account_limits(self, account_number, tier=None, daily_amount=None, weekly_amount=None, daily_count=None):
+        tier = tier or self.default_tier
+        if tier not in self.tiers:
+            raise ValueError(f"Unknown limit tier: {tier}.")
+        row = {"tier": tier, "daily_amount": daily_amount, "weekly_amount": weekly_amount, "daily_count": daily_count}
+        with unit_of_work() as conn:
+            conn.cursor().execute(
+                get_storage().upsert_sql("account_limit", ("account_number",), ("tier", "daily_amount", "weekly_amount", "daily_count")),
+                (account_number, tier, daily_amount, weekly_amount, daily_count))
+            after_commit(self._set, int(account_number), row)
+
+    def _set(self, account_number, row):
+        with self._lock:
+            self._accounts[account_number] = {k: (Decimal(str(v)) if k.endswith("amount") and v is not None else v)
+                                              for k, v in row.items()}
+
+    def stats(self):
+        with self._lock:
+            return {"accounts": len(self._windows), "refused": self.refused}
+
+
+# the limits shared by the whole process
+withdrawal_limits = WithdrawalLimits()
@@ -0,0 +1,17 @@
+# calendar month helpers shared by statements.py, archive.py and storage.py (monthly partitions)
+from datetime import date, datetime
+
+
+# "2026-09" (or any date in the month) -> (first day of the month, first day of the next month)
+def month_bounds(month):
+    if isinstance(month, str):
+        month = datetime.strptime(month, "%Y-%m").date()
+    start = date(month.year, month.month, 1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+# first day of the month `months` months after the month of `day`
+def add_months(day, months):
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, 1)
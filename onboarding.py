@@ -0,0 +1,167 @@
+# bulk customer onboarding from a CSV file (bank migrations)
+# the file is read in chunks; every chunk is validated with the register_customer rules (validation.py),
+# then its customers and accounts are inserted in one unit of work (db_pool.unit_of_work), committed once
+# ids come from auto_increment like register_customer's, so both can run at the same time
+#
+# output files, next to the input file by default:
+#   <name>.accounts.csv - source row, customer_id, account_number for every customer created
+#   <name>.rejects.csv  - the rejected rows with their error messages
+#
+# resumable: the number of rows done (and the size of both output files) is saved in the
+# onboarding_progress table IN THE SAME database transaction as the chunk, so after a crash
+# the next run skips exactly the committed rows and cuts off output lines of the unfinished chunk
+#
+#   python onboarding.py customers_migration.csv
+import csv
+import os
+
+import pandas as pd
+
+import config
+from auth import authenticator
+from db_pool import after_commit, unit_of_work
+from storage import get_storage
+from validation import FIELDS, validate_batch, error_messages
+
+TITLE_CASE = ("first_name", "last_name", "street", "city") # stored the way register_customer stores them
+
+
+def _create_progress_table(cursor):
+    cursor.execute("""
+        create table if not exists onboarding_progress (
+            source varchar(255) primary key,
+            rows_done int not null default 0,
+            accounts_bytes bigint not null default 0,
+            rejects_bytes bigint not null default 0
+        )
+    """)
+
+
+def _load_progress(cursor, source):
+    cursor.execute("select rows_done, accounts_bytes, rejects_bytes from onboarding_progress where source = %s",
+                   (source,))
+    row = cursor.fetchone()
+    return row if row else (0, 0, 0)
+
+
+# cut a file back to the size saved at the last commit (drops lines of an unfinished chunk)
+def _open_output(path, size, header):
+    if size and os.path.exists(path):
+        f = open(path, "r+", newline="", encoding="utf-8")
+        f.truncate(size)
+        f.seek(size)
+    else:
+        f = open(path, "w", newline="", encoding="utf-8")
+        csv.writer(f).writerow(header)
+    return f
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+    return f.tell()
+
+
+# import every customer of `path`, returns {"rows", "created", "rejected"} for this run
+def onboard_customers(path, chunk_size=None, accounts_path=None, rejects_path=None, source=None):
+    chunk_size = chunk_size or config.ONBOARDING_CHUNK_SIZE
+    base = os.path.splitext(path)[0]
+    accounts_path = accounts_path or base + ".accounts.csv"
+    rejects_path = rejects_path or base + ".rejects.csv"
+    source = source or os.path.basename(path)
+
+    with unit_of_work() as conn:
+        cursor = conn.cursor()
+        _create_progress_table(cursor)
+        rows_done, accounts_bytes, rejects_bytes = _load_progress(cursor, source)
+
+    if rows_done:
+        print(f"resuming {source} after row {rows_done}")
+
+    summary = {"rows": 0, "created": 0, "rejected": 0}
+    accounts_file = _open_output(accounts_path, accounts_bytes, ["row", "customer_id", "account_number"])
+    rejects_file = _open_output(rejects_path, rejects_bytes, ["row", *FIELDS, "errors"])
+    try:
+        # skiprows keeps the header line and jumps over the rows committed by an earlier run
+        chunks = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size,
+                             skiprows=range(1, rows_done + 1))
+        for chunk in chunks:
+            if chunk.empty: # the whole file was already done
+                continue
+            chunk.index = range(rows_done + 1, rows_done + len(chunk) + 1) # source row numbers (1 = first data row)
+            created, rejected = _onboard_chunk(chunk, source, accounts_file, rejects_file)
+            rows_done += len(chunk)
+            summary["rows"] += len(chunk)
+            summary["created"] += created
+            summary["rejected"] += rejected
+            print(f"{source}: {rows_done} rows done ({summary['created']} created, {summary['rejected']} rejected)")
+    finally:
+        accounts_file.close()
+        rejects_file.close()
+    return summary
+
+
+def _onboard_chunk(chunk, source, accounts_file, rejects_file):
+    for field in FIELDS:
+        if field not in chunk.columns:
+            chunk[field] = ""
+    chunk = chunk[list(FIELDS)].apply(lambda column: column.str.strip())
+
+    errors = validate_batch(chunk)
+    bad = errors.notna().any(axis=1)
+    rejects = chunk[bad]
+    good = chunk[~bad].copy()
+    for field in TITLE_CASE:
+        good[field] = good[field].str.title()
+
+    rows_done = int(chunk.index[-1])
+    rejects_writer = csv.writer(rejects_file)
+    for row, record in rejects.iterrows():
+        rejects_writer.writerow([row, *record.tolist(), "; ".join(error_messages(errors.loc[row]))])
+
+    with unit_of_work() as conn: # one commit for the whole chunk
+        cursor = conn.cursor()
+        if len(good):
+            # one insert per customer for its auto_increment id (lastrowid): ids of a multi-row insert are
+            # only consecutive in some InnoDB lock modes, and other sessions may register at the same time
+            customer_ids = []
+            for r in good.itertuples():
+                cursor.execute("""
+                    insert into customer (first_name, last_name, dob, app, building, street, city, province,
+                                          phone, email, postal_code)
+                    values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (r.first_name, r.last_name, r.dob, r.app or None, r.building, r.street, r.city, r.province,
+                      r.phone or None, r.email or None, r.postal_code)) # empty optional fields are stored as NULL
+                customer_ids.append(cursor.lastrowid)
+            cursor.executemany("insert into account (customer_id, pin) values (%s, %s)",
+                               [(cid, pin) for cid, pin in zip(customer_ids, good["pin"])])
+
+            # every new customer has exactly one account; customers of other sessions in the same id range
+            # are simply not looked up
+            cursor.execute("select customer_id, account_number from account where customer_id between %s and %s",
+                           (min(customer_ids), max(customer_ids)))
+            account_of = dict(cursor.fetchall())
+            accounts_writer = csv.writer(accounts_file)
+            for row, cid in zip(good.index, customer_ids):
+                accounts_writer.writerow([row, cid, account_of[cid]])
+                after_commit(authenticator.invalidate, account_of[cid]) # like register_customer
+
+        # output files first, then their sizes are saved together with the data
+        accounts_bytes = _sync(accounts_file)
+        rejects_bytes = _sync(rejects_file)
+        cursor.execute(get_storage().upsert_sql("onboarding_progress", ["source"],
+                                                ["rows_done", "accounts_bytes", "rejects_bytes"]),
+                       (source, rows_done, accounts_bytes, rejects_bytes))
+
+    return len(good), len(rejects)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import customers from a CSV file")
+    parser.add_argument("path", help="CSV file with the columns: " + ", ".join(FIELDS))
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    result = onboard_customers(args.path, chunk_size=args.chunk_size)
+    print(f"done: {result['rows']} rows, {result['created']} customers created, {result['rejected']} rejected")
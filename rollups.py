@@ -0,0 +1,232 @@
+# cash-flow rollups for the operations dashboard (Admin page of bank_streamlit.py)
+# the dashboard never reads `transaction`: deposits and withdrawals are pre-aggregated into
+#   rollup_hourly (hour, province, age_band, type, transactions, amount)
+#   rollup_daily  (day,  province, age_band, type, transactions, amount)
+# where province is the customer's province and age_band is how long the account had been open when
+# the transaction was posted (counted from the account's first transaction, kept in rollup_account)
+#
+# refresh() is incremental: rollup_state remembers the last transaction_id already counted, and
+# every run aggregates only the rows after it (in pandas, a chunk at a time) and adds them to the
+# rollups in the same database transaction that moves the mark, so no row is counted twice
+# rows younger than ATM_ROLLUP_SETTLE_SECONDS wait for the next run: a transaction_id is taken at
+# insert time, so a posting still open could commit a lower id after the mark has passed it
+# the rollups are never cut back, so they keep the history of months moved to the archive (archive.py)
+#
+# the query functions (cash_flow, totals, hour_of_day) read the small rollup tables and do the
+# rest with vectorized pandas/NumPy operations
+#
+#   python rollups.py    run a refresh (ex: every minute from cron)
+from datetime import datetime, timedelta
+
+import config
+from db_pool import connection, unit_of_work
+from storage import get_storage
+
+# account age bands: upper bound in days -> label
+AGE_BANDS = ((30, "0-30 days"), (90, "1-3 months"), (365, "3-12 months"), (3 * 365, "1-3 years"), (None, "3+ years"))
+
+GRAINS = {"hour": "rollup_hourly", "day": "rollup_daily"}
+
+
+def create_tables(cursor):
+    for grain, table in GRAINS.items():
+        cursor.execute(f"""
+            create table if not exists {table} (
+                {grain} {"datetime" if grain == "hour" else "date"} not null,
+                province varchar(50) not null,
+                age_band varchar(20) not null,
+                type varchar(10) not null,
+                transactions int not null,
+                amount decimal(16,2) not null,
+                primary key ({grain}, province, age_band, type)
+            )
+        """)
+    cursor.execute("""
+        create table if not exists rollup_account (
+            account_number int primary key,
+            first_seen datetime not null
+        )
+    """)
+    cursor.execute("""
+        create table if not exists rollup_state (
+            name varchar(50) primary key,
+            last_transaction_id bigint not null
+        )
+    """)
+    cursor.execute("select 1 from rollup_state where name = 'transaction'")
+    if not cursor.fetchone():
+        cursor.execute("insert into rollup_state (name, last_transaction_id) values ('transaction', 0)")
+
+
+# add every settled transaction after the mark to the rollups, returns the number of rows counted
+def refresh(chunk_size=None, settle=None):
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    settle = config.ROLLUP_SETTLE_SECONDS if settle is None else settle
+    with unit_of_work() as conn:
+        create_tables(conn.cursor())
+
+    counted = 0
+    while True:
+        with unit_of_work() as conn: # one chunk: rollups and mark committed together
+            cursor = conn.cursor()
+            # locked, so two refreshes at the same time take turns instead of counting twice
+            cursor.execute("select last_transaction_id from rollup_state where name = 'transaction' for update")
+            last = cursor.fetchone()[0]
+            cursor.execute("""
+                select t.transaction_id, t.account_number, t.type, t.amount, t.timestamp, coalesce(c.province, '')
+                from `transaction` t
+                join account a on a.account_number = t.account_number
+                left join customer c on c.customer_id = a.customer_id
+                where t.transaction_id > %s
+                order by t.transaction_id
+                limit %s
+            """, (last, chunk_size))
+            rows = cursor.fetchall()
+            settled = _settled(rows, datetime.now() - timedelta(seconds=settle))
+            if settled:
+                _add(cursor, settled)
+                cursor.execute("update rollup_state set last_transaction_id = %s where name = 'transaction'",
+                               (settled[-1][0],))
+        counted += len(settled)
+        if len(settled) < chunk_size: # caught up (or stopped at a row that isn't settled yet)
+            return counted
+
+
+# the rows up to (not including) the first one posted after `cutoff`
+def _settled(rows, cutoff):
+    for i, row in enumerate(rows):
+        timestamp = datetime.fromisoformat(row[4]) if isinstance(row[4], str) else row[4] # SQLite gives strings
+        if timestamp > cutoff:
+            return rows[:i]
+    return rows
+
+
+# aggregate one chunk of transaction rows and add it to both rollups
+def _add(cursor, rows):
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["transaction_id", "account_number", "type", "amount", "timestamp", "province"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["cents"] = (df["amount"].astype(float) * 100).round().astype("int64") # exact sums, no float drift
+    df["age_band"] = _age_bands(cursor, df)
+    df["hour"] = df["timestamp"].dt.floor("h")
+    df["day"] = df["timestamp"].dt.normalize()
+
+    storage = get_storage()
+    for grain, table in GRAINS.items():
+        groups = df.groupby([grain, "province", "age_band", "type"], sort=False).agg(
+            transactions=("transaction_id", "size"), cents=("cents", "sum")).reset_index()
+        periods = groups[grain].dt.to_pydatetime()
+        if grain == "day":
+            periods = [period.date() for period in periods]
+        amounts = np.round(groups["cents"].to_numpy(dtype=np.int64) / 100, 2)
+        cursor.executemany(
+            storage.accumulate_sql(table, (grain, "province", "age_band", "type"), ("transactions", "amount")),
+            list(zip(periods, groups["province"].tolist(), groups["age_band"].tolist(), groups["type"].tolist(),
+                     groups["transactions"].tolist(), amounts.tolist())))
+
+
+# age band of every row, from each account's first transaction (new accounts are added to rollup_account)
+def _age_bands(cursor, df):
+    import numpy as np
+    import pandas as pd
+
+    accounts = [int(a) for a in df["account_number"].unique()]
+    placeholders = ", ".join(["%s"] * len(accounts))
+    cursor.execute(f"select account_number, first_seen from rollup_account where account_number in ({placeholders})",
+                   accounts)
+    first_seen = {account: seen for account, seen in cursor.fetchall()}
+    new = df[~df["account_number"].isin(list(first_seen))].groupby("account_number")["timestamp"].min()
+    if not new.empty:
+        cursor.executemany("insert into rollup_account (account_number, first_seen) values (%s, %s)",
+                           [(int(account), seen.to_pydatetime()) for account, seen in new.items()])
+        first_seen.update(new.to_dict())
+
+    opened = pd.to_datetime(df["account_number"].map(first_seen))
+    days = (df["timestamp"] - opened).dt.days.to_numpy()
+    bounds = [bound for bound, _ in AGE_BANDS[:-1]]
+    labels = np.array([label for _, label in AGE_BANDS])
+    return labels[np.searchsorted(bounds, days, side="right")]
+
+
+# rollup rows between start and end (dates, end included) as a DataFrame:
+# period, province, age_band, type, transactions, amount
+def load(grain="day", start=None, end=None):
+    import pandas as pd
+
+    column = grain
+    conditions, params = [], []
+    if start:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+    if end:
+        conditions.append(f"{column} < %s")
+        params.append(end + timedelta(days=1))
+    where = f"where {' and '.join(conditions)}" if conditions else ""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"select {column}, province, age_band, type, transactions, amount from {GRAINS[grain]} {where}",
+                       params)
+        rows = cursor.fetchall()
+    df = pd.DataFrame(rows, columns=["period", "province", "age_band", "type", "transactions", "amount"])
+    df["period"] = pd.to_datetime(df["period"])
+    df["amount"] = df["amount"].astype(float)
+    df["transactions"] = df["transactions"].astype("int64")
+    df["province"] = df["province"].replace("", "Unknown")
+    return df
+
+
+# deposits, withdrawals, net flow and transaction count per period (and per `by`: "province" or "age_band")
+def cash_flow(start=None, end=None, grain="day", by=None):
+    df = _flows(load(grain, start, end))
+    keys = ["period"] + ([by] if by else [])
+    return df.groupby(keys, as_index=False)[["deposits", "withdrawals", "net", "transactions"]].sum()
+
+
+# the same totals over the whole range, per `by` (or one row)
+def totals(start=None, end=None, by=None):
+    import pandas as pd
+
+    df = _flows(load("day", start, end))
+    columns = ["deposits", "withdrawals", "net", "transactions"]
+    if by is None:
+        return df[columns].sum().to_frame().T.astype({"transactions": "int64"})
+    if by == "age_band": # youngest accounts first, not alphabetical
+        df[by] = pd.Categorical(df[by], categories=[label for _, label in AGE_BANDS], ordered=True)
+    return df.groupby(by, as_index=False, observed=True)[columns].sum()
+
+
+# average deposits / withdrawals / transactions per hour of the day over the range
+def hour_of_day(start=None, end=None):
+    df = _flows(load("hour", start, end))
+    df["hour_of_day"] = df["period"].dt.hour
+    per_hour = df.groupby(["period", "hour_of_day"], as_index=False)[["deposits", "withdrawals", "transactions"]].sum()
+    days = (end - start).days + 1 if start and end else max(per_hour["period"].dt.normalize().nunique(), 1)
+    profile = per_hour.groupby("hour_of_day")[["deposits", "withdrawals", "transactions"]].sum() / days
+    return profile.reindex(range(24), fill_value=0.0)
+
+
+# split the signed flows into columns, vectorized
+def _flows(df):
+    import numpy as np
+
+    deposit = (df["type"] == "deposit").to_numpy()
+    amount = df["amount"].to_numpy()
+    return df.assign(deposits=np.where(deposit, amount, 0.0), withdrawals=np.where(deposit, 0.0, amount),
+                     net=np.where(deposit, amount, -amount))
+
+
+# rows not counted yet (the dashboard shows how far behind the rollups are)
+def pending():
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select count(*) from `transaction`
+            where transaction_id > (select coalesce(max(last_transaction_id), 0) from rollup_state where name = 'transaction')
+        """)
+        return cursor.fetchone()[0]
+
+
+if __name__ == "__main__":
+    print(f"{refresh()} transactions added to the rollups")
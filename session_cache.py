@@ -0,0 +1,100 @@
+# per-session cache of the logged-in account's data for bank_streamlit.py
+# every rerun of a logged-in page used to read view_personal_info and check_balance again; now each
+# Streamlit session keeps what it read (SessionCache, in st.session_state) and only reads again when
+# the account changed
+#
+# "changed" is a per-account generation counter shared by the whole process (generations):
+# update_customer_info, make_transaction, make_transactions_bulk, change_pin and forgot_pin bump it after
+# they commit (db_pool.after_commit), so every session holding that account misses once and reads the
+# new values, and sessions of other accounts keep their entries
+# a session entry remembers the generation it was read at, taken BEFORE the read, so a write committed
+# during the read makes it stale right away (like balance_cache.fill_token)
+# changes made by another process are picked up after at most ATM_SESSION_CACHE_TTL seconds
+import threading
+import time
+
+import config
+from db_pool import in_unit_of_work
+
+
+class AccountGenerations:
+    def __init__(self):
+        self._generations = {} # account_number -> times it was written, missing = 0
+        self._lock = threading.Lock()
+        self.hits = 0 # totals of every session, for the Admin page
+        self.misses = 0
+
+    def get(self, account_number):
+        return self._generations.get(account_number, 0)
+
+    # the account's data changed: every session reads it again
+    def bump(self, *account_numbers):
+        with self._lock:
+            for account_number in account_numbers:
+                account_number = int(account_number)
+                self._generations[account_number] = self._generations.get(account_number, 0) + 1
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "accounts_written": len(self._generations),
+            }
+
+
+class SessionCache:
+    def __init__(self, ttl=None):
+        self.ttl = config.SESSION_CACHE_TTL if ttl is None else ttl
+        self._entries = {} # (name, account_number) -> (generation, expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    # the cached `name` of an account, or loader(account_number) when it changed or expired
+    # None (account not found) is returned but not cached
+    def get(self, name, account_number, loader):
+        account_number = int(account_number)
+        if in_unit_of_work(): # the values may include writes that get rolled back
+            return loader(account_number)
+        key = (name, account_number)
+        generation = generations.get(account_number)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation and entry[1] > time.monotonic():
+            self.hits += 1
+            generations._count(True)
+            return entry[2]
+        self.misses += 1
+        generations._count(False)
+        value = loader(account_number)
+        if value is None:
+            self._entries.pop(key, None)
+        else:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+        return value
+
+    # forget everything (logout: the next account starts empty)
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "ttl": self.ttl,
+        }
+
+
+# the generation counters shared by the whole process
+generations = AccountGenerations()
@@ -0,0 +1,240 @@
+# daily balance snapshots: the closing balance of every account for every day it had transactions
+# balance_snapshot (account_number, snapshot_date, closing_balance) is kept up to date by the posting
+# code itself (ledger.post_transaction, make_transactions_bulk): right after the balance changes,
+# today's row is upserted from account.balance IN THE SAME database transaction, so it can never
+# disagree with the ledger
+#
+# "what was the balance at time X" is then one primary key seek for the last snapshot before X plus
+# the sum of the few transactions after it, instead of replaying the account's whole history
+# days without transactions have no row, the previous snapshot is still their closing balance
+#
+# history posted before snapshots existed is filled in once with:
+#   python snapshots.py --backfill
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import archive
+import config
+from db_pool import connection
+from months import month_bounds
+from storage import get_storage
+
+# signed amount of a transaction row
+CHANGE = "case when type = 'deposit' then amount else -amount end"
+
+
+# upsert today's snapshot of `account_numbers` from their current balance (the caller commits)
+def record(cursor, account_numbers):
+    account_numbers = list(account_numbers)
+    if not account_numbers:
+        return
+    storage = get_storage()
+    placeholders = ", ".join(["%s"] * len(account_numbers))
+    cursor.execute(storage.upsert_select_sql(
+        "balance_snapshot", ("account_number", "snapshot_date"), ("closing_balance",),
+        f"select account_number, {storage.current_date}, balance from account where account_number in ({placeholders})",
+    ), account_numbers)
+
+
+# balance of an account at `when` (a datetime, or a date for the closing balance of that day)
+# returns None if the account doesn't exist
+# transactions of months moved to the cold archive (archive.py) are added from their files; a month archived
+# while this runs could be counted twice (read from the table, then from its file), so the account's archived
+# months are looked up before and after, and the balance is computed again if they changed
+def balance_at(account_number, when):
+    if not isinstance(when, datetime):
+        when = datetime.combine(when, time.max)
+    while True:
+        months = archive.archived_months(account_number)
+        balance = _balance_at(account_number, when, months)
+        if archive.archived_months(account_number) == months:
+            return balance
+
+
+def _balance_at(account_number, when, archived_months):
+    last_closed_day = (when + timedelta(microseconds=1)).date() - timedelta(days=1) # last day fully before `when`
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select snapshot_date, closing_balance from balance_snapshot
+            where account_number = %s and snapshot_date <= %s
+            order by snapshot_date desc
+            limit 1
+        """, (account_number, last_closed_day))
+        snapshot = cursor.fetchone()
+
+        if snapshot:
+            # replay forward: only the transactions between the snapshot's day and `when`
+            snapshot_date, closing_balance = snapshot
+            day_after = datetime.combine(date.fromisoformat(str(snapshot_date)) + timedelta(days=1), time())
+            cursor.execute(f"""
+                select coalesce(sum({CHANGE}), 0) from `transaction`
+                where account_number = %s and timestamp >= %s and timestamp <= %s
+            """, (account_number, day_after, when))
+            balance = Decimal(str(closing_balance)) + Decimal(str(cursor.fetchone()[0]))
+            start, end, sign = day_after, when, 1
+        else:
+            # no snapshot before `when`: walk back from the live balance instead
+            cursor.execute("select balance from account where account_number = %s", (account_number,))
+            account = cursor.fetchone()
+            if not account:
+                return None
+            cursor.execute(f"""
+                select coalesce(sum({CHANGE}), 0) from `transaction`
+                where account_number = %s and timestamp > %s
+            """, (account_number, when))
+            balance = Decimal(str(account[0])) - Decimal(str(cursor.fetchone()[0]))
+            start, end, sign = when + timedelta(seconds=1), None, -1 # timestamps have whole seconds
+
+    if any(month_bounds(month)[1] > start.date() and (end is None or month <= end.date()) for month in archived_months):
+        balance += sign * _archived_change(account_number, start, end)
+    return balance
+
+
+# signed sum of the account's archived transactions with start <= timestamp <= end (end=None: open)
+def _archived_change(account_number, start, end=None):
+    import pandas as pd
+
+    archived = archive.read_transactions(account_number, start.date(), end.date() if end else None)
+    if archived is None:
+        return Decimal(0)
+    timestamps = pd.to_datetime(archived["timestamp"])
+    rows = archived[(timestamps >= start) & (timestamps <= end)] if end else archived[timestamps >= start]
+    return sum((amount if kind == "deposit" else -amount for kind, amount in zip(rows["type"], rows["amount"])),
+               Decimal(0))
+
+
+# balance of every account in first_account <= account_number < end_account just before `when` (a datetime)
+# the bulk version of balance_at (used by statements.py): three grouped queries per range instead of
+# three queries per account, returns {account_number: Decimal}
+def balances_before(cursor, first_account, end_account, when):
+    last_closed_day = when.date() - timedelta(days=1)
+    last_snapshot = """
+        select account_number, max(snapshot_date) as snapshot_date from balance_snapshot
+        where account_number >= %s and account_number < %s and snapshot_date <= %s
+        group by account_number
+    """
+    cursor.execute(f"""
+        select s.account_number, s.closing_balance
+        from balance_snapshot s
+        join ({last_snapshot}) last on last.account_number = s.account_number and last.snapshot_date = s.snapshot_date
+    """, (first_account, end_account, last_closed_day))
+    balances = {account: Decimal(str(balance)) for account, balance in cursor.fetchall()}
+
+    # replay forward from each account's snapshot up to `when`
+    cursor.execute(f"""
+        select t.account_number, sum({CHANGE})
+        from `transaction` t
+        join ({last_snapshot}) last on last.account_number = t.account_number
+        where date(t.timestamp) > last.snapshot_date and t.timestamp < %s
+        group by t.account_number
+    """, (first_account, end_account, last_closed_day, when))
+    for account, change in cursor.fetchall():
+        balances[account] += Decimal(str(change))
+
+    # accounts without a snapshot before `when`: walk back from the live balance
+    cursor.execute(f"""
+        select a.account_number, a.balance - coalesce(sum({CHANGE}), 0)
+        from account a
+        left join `transaction` t on t.account_number = a.account_number and t.timestamp >= %s
+        where a.account_number >= %s and a.account_number < %s
+          and a.account_number not in (
+              select account_number from balance_snapshot
+              where account_number >= %s and account_number < %s and snapshot_date <= %s
+          )
+        group by a.account_number, a.balance
+    """, (when, first_account, end_account, first_account, end_account, last_closed_day))
+    for account, balance in cursor.fetchall():
+        balances[account] = Decimal(str(balance))
+    return balances
+
+
+# closing balance of every day from start_date to end_date (both included), for balance-over-time charts
+# returns a DataFrame indexed by date with one "balance" column, None if the account doesn't exist
+def balance_history(account_number, start_date, end_date):
+    import pandas as pd
+
+    opening = balance_at(account_number, start_date - timedelta(days=1))
+    if opening is None:
+        return None
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            select snapshot_date, closing_balance from balance_snapshot
+            where account_number = %s and snapshot_date >= %s and snapshot_date <= %s
+            order by snapshot_date
+        """, (account_number, start_date, end_date))
+        rows = cursor.fetchall()
+
+    days = pd.date_range(start_date, end_date, freq="D")
+    closing = pd.Series([float(balance) for _, balance in rows],
+                        index=pd.to_datetime([str(day) for day, _ in rows]), dtype="float64")
+    history = closing.reindex(days).ffill().fillna(float(opening))
+    history.index = history.index.date
+    return history.to_frame("balance")
+
+
+# build the snapshots of every day before today from the transaction history, returns the number written
+# today's snapshot is left to the posting code, so a backfill never overwrites a newer live balance
+def backfill(chunk_size=None):
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    today = date.today()
+    sql = get_storage().upsert_sql("balance_snapshot", ("account_number", "snapshot_date"), ("closing_balance",))
+    written = 0
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        # balance before the first transaction = live balance - every change ever posted
+        cursor.execute(f"""
+            select a.account_number, a.balance - coalesce(sum({CHANGE}), 0)
+            from account a
+            left join `transaction` t on t.account_number = a.account_number
+            group by a.account_number, a.balance
+        """)
+        opening = {account: Decimal(str(balance)) for account, balance in cursor.fetchall()}
+
+        cursor.execute(f"""
+            select account_number, date(timestamp), {CHANGE} from `transaction`
+            where timestamp < %s
+            order by account_number, timestamp, transaction_id
+        """, (today,))
+        writer = conn.cursor()
+        pending = []
+        current = None # (account_number, day) being summed up
+        balance = None
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for account, day, change in rows:
+                if (account, day) != current:
+                    if current is not None:
+                        pending.append((*current, balance)) # the previous day is closed
+                    if current is None or current[0] != account:
+                        balance = opening[account]
+                    current = (account, day)
+                balance += Decimal(str(change))
+            if len(pending) >= chunk_size:
+                writer.executemany(sql, pending)
+                written += len(pending)
+                pending = []
+        if current is not None:
+            pending.append((*current, balance))
+        if pending:
+            writer.executemany(sql, pending)
+            written += len(pending)
+        conn.commit() # one transaction, a failed backfill leaves no half-built history
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Daily balance snapshots")
+    parser.add_argument("--backfill", action="store_true", help="build the snapshots of past days from the history")
+    args = parser.parse_args()
+    if args.backfill:
+        print(f"{backfill()} snapshots written")
+    else:
+        parser.print_help()
@@ -0,0 +1,248 @@
+# monthly statements for every account: opening balance, the month's transactions with a running
+# balance, closing balance
+#
+# accounts are split into ranges of consecutive account numbers (ATM_STATEMENT_RANGE_SIZE) and the
+# ranges are shared out over a process pool; every worker gets the opening balances of its range
+# in three grouped queries (snapshots.balances_before) and then reads the range's transactions as
+# ONE stream ordered by account and timestamp, straight from idx_transaction_account_time
+#
+# output, one pair of files per range in <out_dir>/<YYYY-MM>/:
+#   statements-<first>-<last>.jsonl - one JSON statement per account per line (ready for a PDF renderer)
+#   statements-<first>-<last>.csv   - the same statements as printable lines
+# finished ranges are written to checkpoint.json in the same folder, so a stopped run picks up
+# where it left off:
+#
+#   python statements.py 2026-09 --workers 8
+#
+# the workers open their own database connections, so the SQLite backend needs a database file
+# (ATM_SQLITE_PATH), an in-memory database is only visible with --workers 1
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+
+import config
+from db_pool import connection, use_storage
+from months import month_bounds
+from snapshots import balances_before
+from storage import MySQLStorage, SQLiteStorage, get_storage
+
+OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "statements")
+
+CSV_COLUMNS = ["account_number", "timestamp", "description", "amount", "balance"]
+
+CENT = Decimal("0.01")
+
+
+def _checkpoint_path(folder):
+    return os.path.join(folder, "checkpoint.json")
+
+
+def _load_checkpoint(folder):
+    try:
+        with open(_checkpoint_path(folder)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_checkpoint(folder, checkpoint):
+    tmp = _checkpoint_path(folder) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, _checkpoint_path(folder)) # atomic, a crash never leaves half a checkpoint
+
+
+# statements for every account of `month`, returns {"ranges", "statements", "transactions", "failed"} for this run
+# on_progress(done, total, result) is called in this process every time a range is finished
+# every finished range is checkpointed as it arrives; a range that fails is listed in "failed"
+# ((first_account, last_account, error)) and the others still finish, so a rerun only redoes the failed ones
+def generate_statements(month, out_dir=None, workers=None, range_size=None, on_progress=None):
+    start, end = month_bounds(month)
+    folder = os.path.join(out_dir or OUT_DIR, start.strftime("%Y-%m"))
+    os.makedirs(folder, exist_ok=True)
+    workers = workers or config.STATEMENT_WORKERS
+
+    checkpoint = _load_checkpoint(folder)
+    if checkpoint is None:
+        # the ranges are fixed at the first run, a restart must not cut the accounts differently
+        checkpoint = {"range_size": range_size or config.STATEMENT_RANGE_SIZE, "done": {}}
+    range_size = checkpoint["range_size"]
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("select min(account_number), max(account_number) from account")
+        first, last = cursor.fetchone()
+    ranges = [(lo, lo + range_size) for lo in range(first, last + 1, range_size)] if first is not None else []
+    todo = [r for r in ranges if str(r[0]) not in checkpoint["done"]]
+
+    summary = {"ranges": 0, "statements": 0, "transactions": 0, "failed": []}
+
+    def finished(result):
+        checkpoint["done"][str(result["first_account"])] = result
+        _save_checkpoint(folder, checkpoint)
+        summary["ranges"] += 1
+        summary["statements"] += result["statements"]
+        summary["transactions"] += result["transactions"]
+        if on_progress:
+            on_progress(len(checkpoint["done"]), len(ranges), result)
+
+    if workers == 1:
+        for lo, hi in todo:
+            try:
+                result = _statement_range(lo, hi, start, end, folder)
+            except Exception as e:
+                summary["failed"].append((lo, hi - 1, str(e)))
+                continue
+            finished(result)
+        return summary
+
+    # spawn, not fork: a forked worker would inherit (and could close) this process's pooled connections
+    storage = get_storage()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(storage.name, getattr(storage, "path", None))) as pool:
+        futures = {pool.submit(_statement_range, lo, hi, start, end, folder): (lo, hi) for lo, hi in todo}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                lo, hi = futures[future]
+                summary["failed"].append((lo, hi - 1, str(e)))
+                continue
+            finished(result)
+    return summary
+
+
+# every worker process uses the same storage backend as the parent, with its own connection pool
+def _init_worker(backend, sqlite_path):
+    use_storage(SQLiteStorage(sqlite_path) if backend == "sqlite" else MySQLStorage())
+
+
+# write the statements of the accounts first_account <= account_number < end_account
+def _statement_range(first_account, end_account, start, end, folder):
+    name = os.path.join(folder, f"statements-{first_account}-{end_account - 1}")
+    statements = 0
+    transactions = 0
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        opening = balances_before(cursor, first_account, end_account, datetime.combine(start, datetime.min.time()))
+        cursor = conn.cursor(buffered=False) # rows stay on the server until we fetch them
+        cursor.execute("""
+            select account_number, transaction_id, type, amount, timestamp
+            from `transaction`
+            where account_number >= %s and account_number < %s and timestamp >= %s and timestamp < %s
+            order by account_number, timestamp, transaction_id
+        """, (first_account, end_account, start, end))
+
+        # written to temporary files, renamed once the whole range is done
+        with open(name + ".jsonl.tmp", "w", encoding="utf-8") as json_file, \
+                open(name + ".csv.tmp", "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(CSV_COLUMNS)
+
+            def write(statement):
+                json_file.write(json.dumps(statement) + "\n")
+                _write_csv(writer, statement)
+
+            quiet_accounts = sorted(opening)
+            next_quiet = 0
+            statement = None
+            while True:
+                rows = cursor.fetchmany(config.EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                for account, transaction_id, transaction_type, amount, timestamp in rows:
+                    if statement is None or statement["account_number"] != account:
+                        if statement is not None:
+                            write(_close(statement))
+                            statements += 1
+                        # accounts without transactions this month still get a statement
+                        while next_quiet < len(quiet_accounts) and quiet_accounts[next_quiet] <= account:
+                            quiet = quiet_accounts[next_quiet]
+                            next_quiet += 1
+                            if quiet != account:
+                                write(_close(_open(quiet, opening[quiet], start, end)))
+                                statements += 1
+                        # no opening balance row (ex: the account was created while the range was read)
+                        statement = _open(account, opening.get(account, Decimal(0)), start, end)
+                    amount = Decimal(str(amount)).quantize(CENT)
+                    change = amount if transaction_type == "deposit" else -amount
+                    statement["_balance"] += change
+                    statement["total_deposits" if change > 0 else "total_withdrawals"] += amount
+                    statement["transactions"].append({
+                        "transaction_id": transaction_id,
+                        "timestamp": str(timestamp),
+                        "type": transaction_type,
+                        "amount": str(amount),
+                        "balance": str(statement["_balance"]),
+                    })
+                    transactions += 1
+            if statement is not None:
+                write(_close(statement))
+                statements += 1
+            for quiet in quiet_accounts[next_quiet:]:
+                write(_close(_open(quiet, opening[quiet], start, end)))
+                statements += 1
+
+    os.replace(name + ".jsonl.tmp", name + ".jsonl")
+    os.replace(name + ".csv.tmp", name + ".csv")
+    return {"first_account": first_account, "last_account": end_account - 1,
+            "statements": statements, "transactions": transactions}
+
+
+def _open(account_number, opening_balance, start, end):
+    return {
+        "account_number": account_number,
+        "period_start": start.isoformat(),
+        "period_end": date.fromordinal(end.toordinal() - 1).isoformat(),
+        "opening_balance": opening_balance.quantize(CENT),
+        "total_deposits": Decimal("0.00"),
+        "total_withdrawals": Decimal("0.00"),
+        "transactions": [],
+        "_balance": opening_balance.quantize(CENT), # running balance while the rows are read
+    }
+
+
+# finish a statement: closing balance, and Decimals as strings so no cent is lost in JSON
+def _close(statement):
+    statement["closing_balance"] = statement.pop("_balance")
+    for key in ("opening_balance", "closing_balance", "total_deposits", "total_withdrawals"):
+        statement[key] = str(statement[key])
+    return statement
+
+
+def _write_csv(writer, statement):
+    account = statement["account_number"]
+    writer.writerow([account, statement["period_start"], "Opening balance", "", statement["opening_balance"]])
+    for t in statement["transactions"]:
+        amount = t["amount"] if t["type"] == "deposit" else "-" + t["amount"]
+        writer.writerow([account, t["timestamp"], t["type"].capitalize(), amount, t["balance"]])
+    writer.writerow([account, statement["period_end"], "Closing balance", "", statement["closing_balance"]])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate monthly statements")
+    parser.add_argument("month", help="YYYY-MM")
+    parser.add_argument("--out-dir", default=None, help=f"default: {OUT_DIR}")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--range-size", type=int, default=None, help="accounts per range (first run only)")
+    args = parser.parse_args()
+
+    def progress(done, total, result):
+        print(f"[{done}/{total}] accounts {result['first_account']}-{result['last_account']}: "
+              f"{result['statements']} statements, {result['transactions']} transactions")
+
+    result = generate_statements(args.month, out_dir=args.out_dir, workers=args.workers,
+                                 range_size=args.range_size, on_progress=progress)
+    print(f"done: {result['ranges']} ranges, {result['statements']} statements, "
+          f"{result['transactions']} transactions")
+    for first_account, last_account, error in result["failed"]:
+        print(f"FAILED accounts {first_account}-{last_account}: {error}")
+    if result["failed"]:
+        raise SystemExit(f"{len(result['failed'])} range(s) failed, run again to retry them")
@@ -0,0 +1,477 @@
+# storage backends: everything that depends on which database engine is used
+#   MySQLStorage  - the production database (mysql-connector)
+#   SQLiteStorage - in-process SQLite (in memory by default) for tests, benchmarks and replays,
+#                   no server needed
+# backend.py writes its SQL once, MySQL style (%s placeholders); the SQLite backend translates
+# what SQLite doesn't understand, and the few statements that really differ (schema, upserts)
+# are methods here
+#
+# choose with ATM_DB_BACKEND=mysql|sqlite, or in code: db_pool.use_storage(SQLiteStorage())
+import re
+import sqlite3
+import threading
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+import config
+from months import add_months
+
+# indexes for the transaction history queries, name -> columns
+# both start with account_number, so one account's history is read from a small slice of the index
+# they also contain every column view_transactions selects, so MySQL answers from the index alone
+# (no table lookups, no filesort for "order by timestamp")
+TRANSACTION_INDEXES = {
+    "idx_transaction_account_time": "account_number, timestamp, type, amount",
+    "idx_transaction_account_type_amount": "account_number, type, amount, timestamp",
+}
+
+
+class MySQLStorage:
+    name = "mysql"
+    current_date = "current_date" # today's date in SQL
+    auto_id = "int auto_increment primary key" # column definition of a generated id
+
+    # open a new MySQL connection using the settings in config.py
+    def connect(self):
+        import mysql.connector
+
+        return mysql.connector.connect(
+            host=config.DB_HOST,
+            port=config.DB_PORT,
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            database=config.DB_NAME,
+            buffered=True,  # fetchone() must not leave unread rows behind on a shared connection
+        )
+
+    # health check: True if the connection still answers
+    # ping(reconnect=True) quietly reopens a connection the server has dropped
+    def ping(self, conn):
+        conn.ping(reconnect=True, attempts=1, delay=0)
+        return True
+
+    # create tables if not exist
+    def create_schema(self, cursor):
+
+# create customer table to store customer info
+        cursor.execute("""
+        create table if not exists customer (
+        customer_id int auto_increment primary key,
+        first_name varchar(50),
+        last_name varchar(50),
+        DOB date,
+        app varchar(10),
+        building varchar(50),
+        street varchar(100),
+        city varchar(50),
+        province varchar(50),
+        postal_code char(7),
+        phone char(10) default null,
+        email varchar(50) default null
+        )
+        """)
+
+# create account table to store account info
+        cursor.execute("""
+        create table if not exists `account` (
+            account_number int auto_increment primary key,
+            customer_id int,
+            pin char(4),
+            balance decimal(10,2) default 100.00,
+            foreign key (customer_id) references customer(customer_id)
+        ) auto_increment = 10001;
+        """)
+
+# create transaction table to store transaction info
+        if config.PARTITION_TRANSACTIONS:
+            # one partition per month (see archive.py): MySQL wants the partitioning column in every
+            # unique key and allows no foreign keys on partitioned tables
+            cursor.execute("""
+                create table if not exists `transaction` (
+                    transaction_id int auto_increment,
+                    account_number int not null,
+                    type ENUM('deposit', 'withdrawal') not null,
+                    amount decimal(10,2) not null,
+                    timestamp datetime not null default current_timestamp,
+                    primary key (transaction_id, timestamp)
+                ) auto_increment = 1
+                partition by range columns (timestamp) (partition pmax values less than (maxvalue))
+            """)
+            self.add_transaction_partitions(cursor, config.PARTITION_MONTHS_AHEAD)
+        else:
+            cursor.execute("""
+                create table if not exists `transaction` (
+                    transaction_id int auto_increment primary key,
+                    account_number int not null,
+                    type ENUM('deposit', 'withdrawal') not null,
+                    amount decimal(10,2) not null,
+                    timestamp datetime default current_timestamp,
+                    foreign key (account_number) references account(account_number)
+                ) auto_increment = 1;
+            """)
+
+        self.create_indexes(cursor, "transaction", TRANSACTION_INDEXES)
+
+# create balance_snapshot table to store the closing balance of every account per day (see snapshots.py)
+        cursor.execute("""
+            create table if not exists balance_snapshot (
+                account_number int not null,
+                snapshot_date date not null,
+                closing_balance decimal(16,2) not null,
+                primary key (account_number, snapshot_date),
+                foreign key (account_number) references account(account_number)
+            )
+        """)
+
+# create account_limit table to store the withdrawal limits of accounts that don't use the default tier (see limits.py)
+        cursor.execute("""
+            create table if not exists account_limit (
+                account_number int primary key,
+                tier varchar(20) not null,
+                daily_amount decimal(10,2) default null,
+                weekly_amount decimal(10,2) default null,
+                daily_count int default null,
+                foreign key (account_number) references account(account_number)
+            )
+        """)
+
+    # create any missing index (MySQL has no "create index if not exists"), so older databases get them too
+    def create_indexes(self, cursor, table, indexes):
+        cursor.execute("""
+            select distinct index_name
+            from information_schema.statistics
+            where table_schema = database() and table_name = %s
+        """, (table,))
+        existing = {row[0] for row in cursor.fetchall()}
+        for name, columns in indexes.items():
+            if name not in existing:
+                cursor.execute(f"create index {name} on `{table}` ({columns})")
+
+    # monthly partitions of `transaction`: {partition name: first day NOT in it, None for pmax}
+    # empty if the table isn't partitioned
+    def transaction_partitions(self, cursor):
+        cursor.execute("""
+            select partition_name, partition_description from information_schema.partitions
+            where table_schema = database() and table_name = 'transaction' and partition_name is not null
+            order by partition_ordinal_position
+        """)
+        return {name: None if bound == "MAXVALUE" else date.fromisoformat(bound.strip("'")[:10])
+                for name, bound in cursor.fetchall()}
+
+    # split partitions for this month and the next `months_ahead` ones off pmax (the catch-all partition),
+    # so new rows never pile up in pmax; does nothing if the table isn't partitioned
+    def add_transaction_partitions(self, cursor, months_ahead):
+        partitions = self.transaction_partitions(cursor)
+        if not partitions:
+            return
+        month = date.today().replace(day=1)
+        months = [add_months(month, i) for i in range(months_ahead + 1)]
+        highest = max((bound for bound in partitions.values() if bound is not None), default=None)
+        new = [m for m in months if highest is None or m >= highest]
+        if new:
+            parts = ", ".join(f"partition p{m:%Y%m} values less than ('{add_months(m, 1)}')" for m in new)
+            cursor.execute(f"""
+                alter table `transaction` reorganize partition pmax into
+                ({parts}, partition pmax values less than (maxvalue))
+            """)
+
+    # one-off conversion of an existing unpartitioned `transaction` table (python archive.py --partition)
+    # slow on a big table: MySQL copies every row
+    def partition_transactions(self, cursor, months_ahead):
+        if self.transaction_partitions(cursor):
+            return
+        cursor.execute("""
+            select constraint_name from information_schema.referential_constraints
+            where constraint_schema = database() and table_name = 'transaction'
+        """)
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"alter table `transaction` drop foreign key {name}")
+        cursor.execute("""
+            alter table `transaction`
+                modify timestamp datetime not null default current_timestamp,
+                drop primary key,
+                add primary key (transaction_id, timestamp)
+        """)
+        cursor.execute("select min(timestamp) from `transaction`")
+        oldest = cursor.fetchone()[0]
+        month = date.today().replace(day=1)
+        first = oldest.date().replace(day=1) if oldest else month
+        parts = []
+        while first <= add_months(month, months_ahead):
+            parts.append(f"partition p{first:%Y%m} values less than ('{add_months(first, 1)}')")
+            first = add_months(first, 1)
+        cursor.execute(f"""
+            alter table `transaction` partition by range columns (timestamp)
+            ({', '.join(parts)}, partition pmax values less than (maxvalue))
+        """)
+
+    # drop one monthly partition and its rows (archive.py, after the month was archived)
+    def drop_transaction_partition(self, cursor, name):
+        cursor.execute(f"alter table `transaction` drop partition {name}")
+
+    # insert a row, or update `columns` of the row that already has the same key
+    def upsert_sql(self, table, keys, columns):
+        names = [*keys, *columns]
+        return (f"insert into `{table}` ({', '.join(names)}) values ({', '.join(['%s'] * len(names))}) "
+                f"on duplicate key update {', '.join(f'{c} = values({c})' for c in columns)}")
+
+    # same, with the rows coming from a select
+    def upsert_select_sql(self, table, keys, columns, select):
+        return (f"insert into `{table}` ({', '.join([*keys, *columns])}) {select} "
+                f"on duplicate key update {', '.join(f'{c} = values({c})' for c in columns)}")
+
+    # insert a row, or ADD `columns` to the row that already has the same key (counters, see rollups.py)
+    def accumulate_sql(self, table, keys, columns):
+        names = [*keys, *columns]
+        return (f"insert into `{table}` ({', '.join(names)}) values ({', '.join(['%s'] * len(names))}) "
+                f"on duplicate key update {', '.join(f'{c} = {c} + values({c})' for c in columns)}")
+
+
+class SQLiteStorage:
+    name = "sqlite"
+    current_date = "date('now', 'localtime')" # same clock as the transaction timestamps
+    auto_id = "integer primary key autoincrement"
+
+    # path=":memory:" keeps the whole database in this process
+    # one SQLite connection is shared by every pooled connection, and a lock gives each pooled
+    # connection the database to itself from its first statement until commit/rollback, so
+    # transactions never mix (the same isolation MySQL gives us with row locks, just coarser)
+    # the lock belongs to the pooled connection, not to a thread (async_backend may resume a
+    # stream on another worker thread), so one thread must not hold two connections at once
+    def __init__(self, path=None):
+        self.path = path or config.SQLITE_PATH
+        # declared types picked up for the converters below (decimal columns read back as Decimal)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._lock = threading.Lock()
+
+    def connect(self):
+        return _SQLiteConnection(self._db, self._lock)
+
+    def ping(self, conn):
+        return True
+
+    def create_schema(self, cursor):
+        cursor.execute("""
+            create table if not exists customer (
+                customer_id integer primary key autoincrement,
+                first_name varchar(50),
+                last_name varchar(50),
+                DOB date,
+                app varchar(10),
+                building varchar(50),
+                street varchar(100),
+                city varchar(50),
+                province varchar(50),
+                postal_code char(7),
+                phone char(10) default null,
+                email varchar(50) default null
+            )
+        """)
+        cursor.execute("""
+            create table if not exists account (
+                account_number integer primary key autoincrement,
+                customer_id int references customer(customer_id),
+                pin char(4),
+                balance decimal(10,2) default 100.00
+            )
+        """)
+        # account numbers start at 10001, like "auto_increment = 10001" in MySQL
+        cursor.execute("""
+            insert into sqlite_sequence (name, seq)
+            select 'account', 10000 where not exists (select 1 from sqlite_sequence where name = 'account')
+        """)
+        cursor.execute("""
+            create table if not exists `transaction` (
+                transaction_id integer primary key autoincrement,
+                account_number int not null references account(account_number),
+                type text not null check (type in ('deposit', 'withdrawal')),
+                amount decimal(10,2) not null,
+                timestamp datetime default (datetime('now', 'localtime'))
+            )
+        """)
+        self.create_indexes(cursor, "transaction", TRANSACTION_INDEXES)
+        cursor.execute("""
+            create table if not exists balance_snapshot (
+                account_number int not null references account(account_number),
+                snapshot_date date not null,
+                closing_balance decimal(16,2) not null,
+                primary key (account_number, snapshot_date)
+            )
+        """)
+        cursor.execute("""
+            create table if not exists account_limit (
+                account_number int primary key references account(account_number),
+                tier varchar(20) not null,
+                daily_amount decimal(10,2) default null,
+                weekly_amount decimal(10,2) default null,
+                daily_count int default null
+            )
+        """)
+        self.round_money(cursor, "account", "balance", "account_number")
+        self.round_money(cursor, "balance_snapshot", "closing_balance", "account_number, snapshot_date")
+
+    # SQLite computes "balance - 99.90" in binary floating point (100 - 99.9 = 0.0999999999999943, and then
+    # a $0.10 withdrawal fails "balance >= 0.10"); these triggers round every value written back to cents,
+    # the nearest double to an exact amount, so stored values and comparisons match MySQL's decimal(x,2)
+    def round_money(self, cursor, table, column, key):
+        match = " and ".join(f"{k} = new.{k}" for k in key.split(", "))
+        for event in ("insert", f"update of {column}"):
+            cursor.execute(f"""
+                create trigger if not exists {table}_{column}_{event.split()[0]}_cents after {event} on `{table}`
+                when new.{column} <> round(new.{column}, 2)
+                begin
+                    update `{table}` set {column} = round(new.{column}, 2) where {match};
+                end
+            """)
+
+    def create_indexes(self, cursor, table, indexes):
+        for name, columns in indexes.items():
+            cursor.execute(f"create index if not exists {name} on `{table}` ({columns})")
+
+    # SQLite has no table partitioning: archive.py deletes archived months instead
+    def transaction_partitions(self, cursor):
+        return {}
+
+    def add_transaction_partitions(self, cursor, months_ahead):
+        pass
+
+    def partition_transactions(self, cursor, months_ahead):
+        raise RuntimeError("SQLite tables can't be partitioned.")
+
+    def upsert_sql(self, table, keys, columns):
+        names = [*keys, *columns]
+        return (f"insert into `{table}` ({', '.join(names)}) values ({', '.join(['%s'] * len(names))}) "
+                f"on conflict ({', '.join(keys)}) do update set {', '.join(f'{c} = excluded.{c}' for c in columns)}")
+
+    # the select needs a where clause, otherwise SQLite reads "on conflict" as a join condition
+    def upsert_select_sql(self, table, keys, columns, select):
+        return (f"insert into `{table}` ({', '.join([*keys, *columns])}) {select} "
+                f"on conflict ({', '.join(keys)}) do update set {', '.join(f'{c} = excluded.{c}' for c in columns)}")
+
+    def accumulate_sql(self, table, keys, columns):
+        names = [*keys, *columns]
+        return (f"insert into `{table}` ({', '.join(names)}) values ({', '.join(['%s'] * len(names))}) "
+                f"on conflict ({', '.join(keys)}) do update set {', '.join(f'{c} = {c} + excluded.{c}' for c in columns)}")
+
+
+# SQLite has no Decimal type: amounts are stored as numbers rounded to cents (SQLiteStorage.round_money)
+# and decimal(x,2) columns are read back as Decimal, like mysql-connector does; dates stay ISO strings
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter("decimal", lambda value: Decimal(value.decode()).quantize(Decimal("0.01")))
+sqlite3.register_converter("date", lambda value: value.decode())
+
+_FOR_UPDATE = re.compile(r"\s+for\s+update\b", re.IGNORECASE)
+
+
+# MySQL style SQL -> SQLite: %s placeholders become ?, "for update" is dropped
+# (the pooled connection already holds the database lock, see SQLiteStorage)
+@lru_cache(maxsize=512)
+def _translate(sql):
+    return _FOR_UPDATE.sub("", sql).replace("%s", "?").replace("%%", "%")
+
+
+# looks like a mysql-connector connection to the rest of the code
+class _SQLiteConnection:
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+        self._holding = False
+
+    def _acquire(self):
+        if not self._holding:
+            self._lock.acquire()
+            self._holding = True
+            if not self._db.in_transaction:
+                # explicit begin: otherwise a leading "savepoint" (unit_of_work) would start the
+                # transaction itself, and releasing it would commit early
+                self._db.execute("begin")
+
+    def _release(self):
+        if self._holding:
+            self._holding = False
+            self._lock.release()
+
+    def cursor(self, buffered=None):
+        return _SQLiteCursor(self)
+
+    def commit(self):
+        if self._holding:
+            try:
+                self._db.commit()
+            finally:
+                self._release()
+
+    def rollback(self):
+        if self._holding:
+            try:
+                self._db.rollback()
+            finally:
+                self._release()
+
+    def close(self):
+        self.rollback()
+
+
+class _SQLiteCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = None
+
+    def execute(self, sql, params=()):
+        self._conn._acquire()
+        self._cursor = self._conn._db.cursor()
+        self._cursor.execute(_translate(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._conn._acquire()
+        self._cursor = self._conn._db.cursor()
+        self._cursor.executemany(_translate(sql), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+# the storage backend chosen in config.py (ATM_DB_BACKEND)
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = SQLiteStorage() if config.DB_BACKEND == "sqlite" else MySQLStorage()
+    return _storage
+
+
+# switch backend in code (benchmarks, tests); use db_pool.use_storage so the pool is reset too
+def set_storage(storage):
+    global _storage
+    with _storage_lock:
+        _storage = storage
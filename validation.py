@@ -0,0 +1,157 @@
+# validation rules for customer data, shared by register_customer, update_customer_info,
+# the Update Personal Info page and the bulk onboarding pipeline
+# the patterns are compiled once when the module is imported, not on every call
+from datetime import datetime
+
+import regex
+
+NAME = regex.compile(r"^[\p{L}]+([ -][\p{L}]+)*$") # only letters without numbers or symbols
+UNIT = regex.compile(r"^(\d+)(?:\s*([A-Za-z]))?$") # apartment / building: 12, 12A, 12 A
+STREET = regex.compile(r"^[\p{L}\d\s.\-]+$") # letters, numbers, space, dot, hyphen
+CITY = regex.compile(r"^[\p{L}\s\-]+$") # only letters, space, hyphens
+POSTAL_CODE = regex.compile(r"^[A-Z]\d[A-Z] \d[A-Z]\d$") # must be in Canadian format
+EMAIL = regex.compile(r"^[^@]+@[^@]+\.[^@]{2,}$") # at least one character before and after @ and 2 characters after final dot
+
+# in display order for the select boxes, and as a set for O(1) lookups
+PROVINCE_LIST = (
+    "Alberta", "British Columbia", "Manitoba", "New Brunswick", "Newfoundland and Labrador",
+    "Nova Scotia", "Ontario", "Prince Edward Island", "Quebec", "Saskatchewan",
+)
+PROVINCES = frozenset(PROVINCE_LIST)
+
+FIELDS = ("first_name", "last_name", "dob", "app", "building", "street", "city", "province",
+          "postal_code", "phone", "email", "pin")
+OPTIONAL = frozenset(("app", "phone", "email")) # may be left empty on registration
+
+# the messages register_customer (and the bulk onboarding) always had
+MESSAGES = {
+    "first_name": "Invalid first name.",
+    "last_name": "Invalid last name.",
+    "dob": "Date of birth must be between 1900 and today.",
+    "app": "Invalid apartment number format.",
+    "building": "Invalid building number format.",
+    "street": "Invalid street name.",
+    "city": "Invalid city name.",
+    "province": "Invalid province.",
+    "postal_code": "Invalid postal code format (e.g., H2Z 1A1).",
+    "phone": "Phone number must be 10 digits.",
+    "email": "Invalid email address.",
+    "pin": "PIN must be exactly 4 digits.",
+}
+# update_customer_info (and the Update Personal Info page) words a few of them differently
+UPDATE_MESSAGES = {
+    **MESSAGES,
+    "app": "Invalid apartment number format (e.g., 123, 123A, 123 A).",
+    "street": "Invalid street name format.",
+    "city": "Invalid city name format.",
+    "province": "Invalid province name.",
+    "phone": "Phone number must be exactly 10 digits.",
+}
+DOB_FORMAT_MESSAGE = "Invalid date of birth format (expected YYYY-MM-DD)."
+MIN_DOB = datetime(1900, 1, 1)
+
+
+# every value is checked (and should be stored) as a string without surrounding spaces, the same
+# in validate_customer and validate_batch: None / NaN become "", 1234 becomes "1234"
+def normalize(value):
+    if value is None or value != value: # NaN is the only value not equal to itself
+        return ""
+    return str(value).strip()
+
+
+# the record with every value normalized, for callers that store what was validated
+def normalize_customer(record):
+    return {field: normalize(value) for field, value in record.items()}
+
+
+# date of birth has two messages (bad format / out of range), returns None when valid
+def _dob_error(value):
+    try:
+        dob = datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return DOB_FORMAT_MESSAGE
+    if not (MIN_DOB <= dob <= datetime.now()): # between 1900 and now
+        return MESSAGES["dob"]
+    return None
+
+
+# one check per field, truthy when the (non-empty) value is valid
+CHECKS = {
+    "first_name": lambda v: NAME.fullmatch(v),
+    "last_name": lambda v: NAME.fullmatch(v),
+    "app": lambda v: UNIT.fullmatch(v),
+    "building": lambda v: UNIT.fullmatch(v),
+    "street": lambda v: STREET.fullmatch(v),
+    "city": lambda v: CITY.fullmatch(v),
+    "province": lambda v: v in PROVINCES,
+    "postal_code": lambda v: POSTAL_CODE.fullmatch(v),
+    "phone": lambda v: v.isdigit() and len(v) == 10, # must have exactly 10 digits
+    "email": lambda v: EMAIL.match(v) and len(v) >= 6,
+    "pin": lambda v: v.isdigit() and len(v) == 4, # must be exactly 4 digits
+}
+
+
+# validate one customer record (a dict with the FIELDS keys), values are normalized first
+# returns {field: message} for every invalid field, an empty dict means the record is valid
+# partial=True (updates): only the fields that have a value are checked
+# messages: MESSAGES (registration) or UPDATE_MESSAGES
+def validate_customer(record, partial=False, messages=MESSAGES):
+    errors = {}
+    for field in FIELDS:
+        value = normalize(record.get(field))
+        if not value:
+            if partial or field in OPTIONAL:
+                continue
+            value = ""
+        if field == "dob":
+            message = _dob_error(value)
+            if message:
+                errors[field] = message
+        elif not CHECKS[field](value):
+            errors[field] = messages[field]
+    return errors
+
+
+# validate a whole DataFrame at once (one column per field, ex: a chunk of a migration file)
+# every check runs over a full column instead of row by row through validate_customer
+# returns a DataFrame with the same index and one column per field: the message, or None when valid
+# values are normalized like validate_customer does (normalize), column by column
+def validate_batch(df, partial=False, messages=MESSAGES):
+    import pandas as pd
+
+    errors = pd.DataFrame(index=df.index)
+    for field in FIELDS:
+        if field in df.columns:
+            values = df[field].fillna("").astype(str).str.strip() # normalize() for a whole column
+        else:
+            values = pd.Series("", index=df.index)
+        empty = values == ""
+        skip = empty if (partial or field in OPTIONAL) else pd.Series(False, index=df.index)
+
+        if field == "dob":
+            dob = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce")
+            bad_format = dob.isna()
+            bad_range = ~bad_format & ((dob < MIN_DOB) | (dob > datetime.now()))
+            message = pd.Series(None, index=df.index, dtype=object)
+            message[bad_format] = DOB_FORMAT_MESSAGE
+            message[bad_range] = messages["dob"]
+            errors[field] = message.where(~skip, None)
+            continue
+
+        if field == "province":
+            valid = values.isin(PROVINCES)
+        elif field == "phone":
+            valid = values.str.isdigit() & (values.str.len() == 10)
+        elif field == "pin":
+            valid = values.str.isdigit() & (values.str.len() == 4)
+        elif field == "email":
+            valid = values.map(lambda v: EMAIL.match(v) is not None) & (values.str.len() >= 6)
+        else: # regex fields: the compiled pattern is reused for every row of the column
+            valid = values.map(lambda v, check=CHECKS[field]: check(v) is not None)
+        errors[field] = pd.Series(messages[field], index=df.index, dtype=object).where(~(valid | skip), None)
+    return errors
+
+
+# messages of one validate_customer result (or one row of validate_batch), in field order
+def error_messages(errors):
+    return [message for field, message in errors.items() if isinstance(message, str) and message]